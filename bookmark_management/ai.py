@@ -1,6 +1,19 @@
 import google.generativeai as genai
 from dotenv import load_dotenv
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+import asyncio
+import itertools
 import os
+import queue
+import re
+import threading
+import time
+
+import metrics
+from cache import MISSING, SuggestionCache, content_key
+from local_tags import LocalTagIndex
+from urls import url_hash
 
 # Load environment variables from .env file
 load_dotenv()
@@ -10,7 +23,306 @@ api_key = os.getenv("GOOGLE_API_KEY")
 
 genai.configure(api_key=api_key)
 
+# Queued by TagSuggestionService.close() to stop the batching thread
+_STOP = object()
+
+
+def parse_tags(text: str) -> List[str]:
+    return [tag.strip() for tag in text.split(",") if tag.strip()]
+
+
+# Anything that turns contents into tag lists. suggest_many gets a whole
+# batch at once; implementations that can't batch just loop.
+class Suggester:
+    name = "base"
+
+    def suggest_many(self, contents: List[str]) -> List[List[str]]:
+        return [self.suggest(content) for content in contents]
+
+    def suggest(self, content: str) -> List[str]:
+        return self.suggest_many([content])[0]
+
+
+# Tags from Gemini. The model object is created once, and a batch of
+# contents is sent as one numbered prompt, so it costs a single round-trip.
+# Each call gives up after timeout seconds, so a stalled request can't hold
+# a batching thread (and every caller waiting on its batch) indefinitely.
+class GeminiSuggester(Suggester):
+    def __init__(self, model_name="gemini-1.5-flash", timeout=10.0):
+        self.name = f"gemini:{model_name}"
+        self.model = genai.GenerativeModel(model_name)
+        self.request_options = {"timeout": timeout}
+
+    def suggest(self, content: str) -> List[str]:
+        response = self.model.generate_content(
+            f"Suggest relevant tags for: {content}. Only return comma separated tags in the response.",
+            request_options=self.request_options)
+        return parse_tags(response.text)
+
+    def suggest_many(self, contents: List[str]) -> List[List[str]]:
+        if len(contents) == 1:
+            return [self.suggest(contents[0])]
+
+        items = "\n".join(f"{i}. {' '.join(content.split())}" for i, content in enumerate(contents, 1))
+        response = self.model.generate_content(
+            "Suggest relevant tags for each numbered item below. Return exactly one line per item, "
+            "in the form '<number>: tag1, tag2, ...', and nothing else.\n" + items,
+            request_options=self.request_options)
+        results = {}
+        for line in response.text.splitlines():
+            match = re.match(r"\s*(\d+)\s*[:.)]\s*(.*)", line)
+            if match:
+                results[int(match.group(1))] = parse_tags(match.group(2))
+
+        # Anything the model skipped is asked for on its own
+        return [results[i] if i in results else self.suggest(content)
+                for i, content in enumerate(contents, 1)]
+
+
+# Deterministic offline stand-in for tests and benchmarks: the longest words
+# of the content become its tags, after a simulated model latency
+class FakeSuggester(Suggester):
+    name = "fake"
+
+    def __init__(self, latency=0.0, per_item_latency=0.0, max_tags=5):
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.max_tags = max_tags
+        self.calls = 0
+
+    def suggest_many(self, contents: List[str]) -> List[List[str]]:
+        self.calls += 1
+        time.sleep(self.latency + self.per_item_latency * len(contents))
+        results = []
+        for content in contents:
+            words = dict.fromkeys(re.findall(r"[a-z0-9]+", content.lower()))
+            results.append(sorted(words, key=lambda w: (-len(w), w))[:self.max_tags])
+        return results
+
+
+# Front door for tag suggestions. Answers from the cache when it can;
+# otherwise the request joins the in-flight call for the same content, or
+# queues for the batching threads, each of which sends whatever is pending
+# (up to max_batch_size, waiting at most max_wait_ms for more) in one model
+# call. With several workers, that many batches can be in flight at once.
+class TagSuggestionService:
+    def __init__(self, suggester: Suggester, cache: SuggestionCache, max_batch_size=16, max_wait_ms=20.0,
+                 workers=1):
+        self.suggester = suggester
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = workers
+
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self.counters = {"requests": 0, "coalesced": 0, "model_calls": 0, "batched_items": 0, "errors": 0}
+
+    def start(self):
+        with self._lock:
+            if not self._threads:
+                self._threads = [threading.Thread(target=self._run, name=f"tag-suggester-{n}", daemon=True)
+                                 for n in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+
+    def close(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+        self.cache.close()
+
+    # Returns a concurrent.futures.Future with the tags for content
+    def submit(self, content: str) -> Future:
+        key = content_key(content, self.suggester.name)
+        future = Future()
+        self.counters["requests"] += 1
+
+        tags = self.cache.get(key)
+        if tags is not MISSING:
+            future.set_result(tags)
+            return future
+
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.counters["coalesced"] += 1
+                return pending
+            self._pending[key] = future
+        self.start()
+        self._queue.put((key, content))
+        return future
+
+    # submit() for the event loop: a memory hit is answered in place, while
+    # anything that may read the cache file runs on executor
+    async def submit_async(self, content: str, executor=None) -> Future:
+        tags = self.cache.get_memory(content_key(content, self.suggester.name))
+        if tags is MISSING:
+            return await asyncio.get_running_loop().run_in_executor(executor, self.submit, content)
+        self.counters["requests"] += 1
+        future = Future()
+        future.set_result(tags)
+        return future
+
+    def suggest(self, content: str, timeout=None) -> List[str]:
+        return list(self.submit(content).result(timeout))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._run_batch(batch)
+            if stopping:
+                return
+
+    def _run_batch(self, batch):
+        self.counters["model_calls"] += 1
+        self.counters["batched_items"] += len(batch)
+        try:
+            with metrics.stage("ai-call"):
+                results = self.suggester.suggest_many([content for _, content in batch])
+            self.cache.put_many([(key, tags) for (key, _), tags in zip(batch, results)])
+        except Exception as e:
+            self.counters["errors"] += 1
+            metrics.count_error("ai-call")
+            self._resolve(batch, error=e)
+            return
+        self._resolve(batch, results=results)
+
+    def _resolve(self, batch, results=None, error=None):
+        with self._lock:
+            futures = [self._pending.pop(key) for key, _ in batch]
+        for i, future in enumerate(futures):
+            if not future.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[i])
+
+    def stats(self):
+        calls = self.counters["model_calls"]
+        return {
+            **self.counters,
+            "mean_batch_size": self.counters["batched_items"] / calls if calls else 0.0,
+            "queue_depth": self._queue.qsize(),
+            "cache": self.cache.stats(),
+        }
+
+
+# TAG_SUGGESTER=fake runs the service without network access
+# (TAG_FAKE_LATENCY seconds per simulated model call); otherwise Gemini
+# calls time out after GEMINI_TIMEOUT seconds
+def create_suggester(kind=None) -> Suggester:
+    kind = kind or os.getenv("TAG_SUGGESTER", "gemini")
+    if kind == "fake":
+        return FakeSuggester(latency=float(os.getenv("TAG_FAKE_LATENCY", "0")))
+    return GeminiSuggester(os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+                           timeout=float(os.getenv("GEMINI_TIMEOUT", "10")))
+
+
+service = TagSuggestionService(
+    create_suggester(),
+    SuggestionCache(
+        path=os.getenv("TAG_CACHE_PATH", "tag_suggestions.db"),
+        maxsize=int(os.getenv("TAG_CACHE_SIZE", "10000")),
+        disk_maxsize=int(os.getenv("TAG_CACHE_DISK_SIZE", "100000")),
+        ttl=float(os.getenv("TAG_CACHE_TTL", str(7 * 24 * 3600))),
+    ),
+    max_batch_size=int(os.getenv("TAG_BATCH_SIZE", "16")),
+    max_wait_ms=float(os.getenv("TAG_BATCH_WAIT_MS", "20")),
+    workers=int(os.getenv("TAG_BATCH_WORKERS", "4")),
+)
+
+# Suggestions from bookmarks already stored; the model is only asked when
+# the local index is less confident than TAG_LOCAL_MIN_CONFIDENCE
+local_index = LocalTagIndex()
+LOCAL_MIN_CONFIDENCE = float(os.getenv("TAG_LOCAL_MIN_CONFIDENCE", "0.5"))
+suggestion_counters = {"local": 0, "remote": 0, "timeouts": 0}
+
+# Add saved bookmarks to the local index, a chunk at a time; one saved
+# again replaces its earlier entry, which is keyed by URL hash
+def learn_bookmarks(bookmarks, chunk_size=10000):
+    bookmarks = iter(bookmarks)
+    while True:
+        chunk = list(itertools.islice(bookmarks, chunk_size))
+        if not chunk:
+            return
+        local_index.add_many((b.title, b.description, b.tags, url_hash(b.url)) for b in chunk)
+
+# Future with the tags for content: already resolved when the local index
+# is confident, otherwise the model service's (cached, batched) future
+def submit_tag_suggestions(content: str) -> Future:
+    tags, confidence = local_index.suggest_scored(content)
+    if tags and confidence >= LOCAL_MIN_CONFIDENCE:
+        suggestion_counters["local"] += 1
+        future = Future()
+        future.set_result(tags)
+        return future
+    suggestion_counters["remote"] += 1
+    return service.submit(content)
+
 def get_tag_suggestions(content: str):
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(f"Suggest relevant tags for: {content}. Only return comma separated tags in the response.")
-    return response.text.split(", ")  # Splitting tags by commas
+    return list(submit_tag_suggestions(content).result())
+
+# The async path keeps AI work off the threads that serve the database:
+# local lookups run on their own small executor, and at most
+# TAG_MAX_CONCURRENCY requests wait on the model at once. Waiting for a
+# slot counts against TAG_SUGGEST_TIMEOUT, after which TimeoutError is raised.
+AI_MAX_CONCURRENCY = int(os.getenv("TAG_MAX_CONCURRENCY", "64"))
+AI_TIMEOUT = float(os.getenv("TAG_SUGGEST_TIMEOUT", "10"))
+local_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tag-local")
+model_slots = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+async def learn_bookmarks_async(bookmarks):
+    await asyncio.get_running_loop().run_in_executor(local_executor, learn_bookmarks, bookmarks)
+
+async def _suggest_remote(content: str):
+    async with model_slots:
+        future = await service.submit_async(content, local_executor)
+        # Shielded, because the future may be shared with coalesced callers
+        return list(await asyncio.shield(asyncio.wrap_future(future)))
+
+async def get_tag_suggestions_async(content: str, timeout: float = AI_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    tags, confidence = await loop.run_in_executor(local_executor, local_index.suggest_scored, content)
+    if tags and confidence >= LOCAL_MIN_CONFIDENCE:
+        suggestion_counters["local"] += 1
+        return tags
+    suggestion_counters["remote"] += 1
+    try:
+        return await asyncio.wait_for(_suggest_remote(content), timeout)
+    except asyncio.TimeoutError:
+        suggestion_counters["timeouts"] += 1
+        raise
+
+def suggestion_stats():
+    return {
+        **suggestion_counters,
+        "local_min_confidence": LOCAL_MIN_CONFIDENCE,
+        "max_concurrency": AI_MAX_CONCURRENCY,
+        "local_index": local_index.stats(),
+        "model_service": service.stats(),
+    }
@@ -1,14 +1,37 @@
+import os
 import streamlit as st
 import requests
 
 BASE_URL = "http://127.0.0.1:8000"  # Adjust if deployed elsewhere
 
+# A little longer than the backend's own suggestion timeout, so its 504
+# arrives first; a stuck backend can't hang the script run beyond this
+SUGGEST_TIMEOUT = float(os.getenv("TAG_SUGGEST_TIMEOUT", "10")) + 5
+
+# Changes whenever a bookmark is saved; a cheap call made once per rerun
+def get_bookmarks_version():
+    try:
+        response = requests.get(f"{BASE_URL}/bookmarks/version", timeout=5)
+        response.raise_for_status()
+        return response.json()["version"]
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+
+# Streamlit reruns the whole script on every interaction; remember the
+# suggestions per content so unchanged text isn't sent to the backend again.
+# Suggestions are partly drawn from the saved bookmarks, so they're kept
+# per data version. Failures raise, so they aren't cached.
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def fetch_tag_suggestions(content, version):
+    response = requests.post(f"{BASE_URL}/tags/suggest", json={"content": content}, timeout=SUGGEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json().get("suggested_tags", [])
+
 # Function to call the backend for tag suggestions
 def get_tag_suggestions(content):
-    response = requests.post(f"{BASE_URL}/tags/suggest", json={"content": content})
-    if response.status_code == 200:
-        return response.json().get("suggested_tags", [])
-    else:
+    try:
+        return fetch_tag_suggestions(content, get_bookmarks_version())
+    except requests.RequestException:
         st.error("Error fetching tag suggestions")
         return []
 
@@ -0,0 +1,714 @@
+import argparse
+import itertools
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import requests
+
+import ai
+import database
+import metrics
+import models
+from cache import SuggestionCache
+from local_tags import LocalTagIndex
+import transfer
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+# Work in a throwaway directory, since database.py uses ./bookmarks.db
+def use_temp_database():
+    workdir = tempfile.mkdtemp(prefix="bookmarks-bench-")
+    os.chdir(workdir)
+    return os.path.join(workdir, "bookmarks.db")
+
+
+# Tag search as it was before the bookmark_tags index: one LIKE scan per tag
+def legacy_tag_search(connection, tags):
+    rows = []
+    for tag in tags:
+        rows.extend(connection.execute("SELECT * FROM bookmarks WHERE tags LIKE ?", ('%' + tag + '%',)).fetchall())
+    return rows
+
+
+def bench_tags(args):
+    path = use_temp_database()
+    rng = random.Random(42)
+    vocabulary = [f"tag{i}" for i in range(args.tags)]
+
+    # Load the corpus the old way (tags column only), then let the migration
+    # build the index, as it would on an existing database
+    connection = sqlite3.connect(path)
+    connection.execute('''CREATE TABLE bookmarks (id INTEGER PRIMARY KEY, url TEXT, title TEXT,
+                          description TEXT, tags TEXT)''')
+    started = time.perf_counter()
+    for start in range(0, args.bookmarks, 100000):
+        connection.executemany(
+            "INSERT INTO bookmarks (url, title, description, tags) VALUES (?, ?, ?, ?)",
+            [(f"https://example.com/{i}", f"Bookmark {i}", "", ",".join(rng.sample(vocabulary, args.tags_per_bookmark)))
+             for i in range(start, min(start + 100000, args.bookmarks))],
+        )
+    connection.commit()
+    connection.close()
+    print(f"loaded {args.bookmarks} bookmarks in {time.perf_counter() - started:.1f} s")
+
+    started = time.perf_counter()
+    database.create_bookmark_table()
+    print(f"migrated tag index in {time.perf_counter() - started:.1f} s")
+
+    connection = sqlite3.connect(path)
+    queries = [rng.sample(vocabulary, 2) for _ in range(args.queries)]
+    for match in ("any", "all"):
+        legacy_total = indexed_total = 0.0
+        for tags in queries:
+            sql, params = database.tag_search_query(tags, match)
+            indexed, rows = timed(lambda: connection.execute(sql, params).fetchall())
+            indexed_total += indexed
+            if match == "any" and args.queries_legacy:
+                legacy, _ = timed(lambda: legacy_tag_search(connection, tags), repeat=1)
+                legacy_total += legacy
+        print(f"match={match}: indexed {indexed_total / len(queries) * 1000:8.3f} ms/query", end="")
+        if match == "any" and args.queries_legacy:
+            print(f"   LIKE scans {legacy_total / len(queries) * 1000:8.1f} ms/query", end="")
+        print()
+    connection.close()
+
+
+# Synthetic text with a Zipf-like word distribution, so queries mix very
+# common words (long posting lists) with rare ones
+def synthetic_corpus(rng, n_bookmarks, n_words, n_tags):
+    words = [f"w{i:05d}" for i in range(n_words)]
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(n_words)))
+    tags = [f"tag{i}" for i in range(n_tags)]
+    for i in range(n_bookmarks):
+        yield models.Bookmark(
+            url=f"https://example.com/{i}",
+            title=" ".join(rng.choices(words, cum_weights=cum_weights, k=6)),
+            description=" ".join(rng.choices(words, cum_weights=cum_weights, k=30)),
+            tags=rng.sample(tags, 3),
+        )
+
+
+# Full-text search as a LIKE scan over the three text columns
+def legacy_text_search(connection, words, limit):
+    where = " AND ".join("(title LIKE ? OR description LIKE ? OR tags LIKE ?)" for _ in words)
+    params = [f"%{w}%" for w in words for _ in range(3)]
+    return connection.execute(f"SELECT * FROM bookmarks WHERE {where} LIMIT ?", params + [limit]).fetchall()
+
+
+def bench_search(args):
+    path = use_temp_database()
+    rng = random.Random(42)
+    database.create_bookmark_table()
+
+    # Index maintenance cost: the triggers run inside every save
+    started = time.perf_counter()
+    batch = []
+    for bookmark in synthetic_corpus(rng, args.bookmarks, args.words, args.tags):
+        batch.append(bookmark)
+        if len(batch) == 10000:
+            database.save_bookmarks(batch)
+            batch = []
+    database.save_bookmarks(batch)
+    elapsed = time.perf_counter() - started
+    print(f"indexed {args.bookmarks} bookmarks in {elapsed:.1f} s ({args.bookmarks / elapsed:.0f} bookmarks/s)")
+
+    queries = {
+        "common word": [["w00001"], ["w00002"], ["w00003"]],
+        "rare word": [[f"w{rng.randrange(args.words // 2, args.words):05d}"] for _ in range(args.queries)],
+        "two words": [[f"w{rng.randrange(10):05d}", f"w{rng.randrange(100, 1000):05d}"] for _ in range(args.queries)],
+        "prefix": [[f"w{rng.randrange(100, 1000):05d}"[:-1]] for _ in range(args.queries)],
+    }
+    connection = sqlite3.connect(path)
+    for name, word_lists in queries.items():
+        for offset in (0, args.deep_offset):
+            latencies = []
+            for words in word_lists:
+                text = " ".join(words)
+                sql, params = database.text_search_query(text, limit=args.limit, offset=offset)
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    connection.execute(sql, params).fetchall()
+                    latencies.append(time.perf_counter() - started)
+            p50, p99 = percentiles_ms(latencies)
+            print(f"{name:12s} offset={offset:<5d} FTS5 p50={p50:8.3f} ms  p99={p99:8.3f} ms", end="")
+            if offset == 0 and args.queries_legacy:
+                legacy = [timed(lambda: legacy_text_search(connection, words, args.limit), repeat=1)[0]
+                          for words in word_lists]
+                print(f"   unranked LIKE scan p50={percentiles_ms(legacy)[0]:8.1f} ms", end="")
+            print()
+    connection.close()
+
+
+# Dedupe job on a legacy-shaped database where a share of the rows repeat
+# an earlier URL in another spelling, plus write throughput with upserts
+def bench_dedupe(args):
+    path = use_temp_database()
+    rng = random.Random(42)
+    spellings = ["https://example.com/{}", "http://EXAMPLE.com/{}/", "https://example.com/{}?utm_source=feed",
+                 "example.com/{}#section"]
+    connection = sqlite3.connect(path)
+    connection.execute('''CREATE TABLE bookmarks (id INTEGER PRIMARY KEY, url TEXT, title TEXT,
+                          description TEXT, tags TEXT)''')
+    n_unique = int(args.bookmarks * (1 - args.duplicates))
+    rows = []
+    for i in range(args.bookmarks):
+        page = i if i < n_unique else rng.randrange(n_unique)
+        rows.append((rng.choice(spellings).format(page), f"Page {page}", "", f"tag{page % 50}"))
+    rng.shuffle(rows)
+    connection.executemany("INSERT INTO bookmarks (url, title, description, tags) VALUES (?, ?, ?, ?)", rows)
+    connection.commit()
+    connection.close()
+
+    started = time.perf_counter()
+    database.repository.create_tables(deduplicate=False)
+    print(f"schema migrations: {time.perf_counter() - started:.1f} s")
+    # The gap between progress calls bounds how long one batch holds the write lock
+    started = time.perf_counter()
+    last = [started]
+    longest = [0.0]
+
+    def progress(stage, done):
+        now = time.perf_counter()
+        longest[0] = max(longest[0], now - last[0])
+        last[0] = now
+
+    stats = database.repository.deduplicate(args.batch_size, progress)
+    elapsed = time.perf_counter() - started
+    print(f"dedupe: {stats['hashed']} rows in {elapsed:.1f} s ({stats['hashed'] / elapsed:.0f} rows/s), "
+          f"removed {stats['removed']} duplicates in {stats['groups']} groups, "
+          f"longest batch {longest[0] * 1000:.0f} ms, final step {(time.perf_counter() - last[0]) * 1000:.0f} ms")
+
+    batch = [models.Bookmark(url=f"https://new.example.com/{i}", title=f"New {i}", description="",
+                             tags=["new"]) for i in range(args.writes)]
+    elapsed, _ = timed(lambda: database.save_bookmarks(batch), repeat=1)
+    print(f"save_bookmarks (inserts): {args.writes / elapsed:.0f} bookmarks/s")
+    elapsed, _ = timed(lambda: database.save_bookmarks(batch), repeat=1)
+    print(f"save_bookmarks (same URLs again, no-op upserts): {args.writes / elapsed:.0f} bookmarks/s")
+
+
+def percentiles_ms(latencies):
+    if not latencies:
+        return 0.0, 0.0
+    p50, p99 = np.percentile(np.asarray(latencies) * 1000.0, [50, 99])
+    return p50, p99
+
+
+# Hammers one endpoint from several threads for a fixed time
+def run_load(make_request, seconds, concurrency):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(worker_id):
+        session = requests.Session()
+        local = []
+        i = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = make_request(session, worker_id, i)
+            local.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                with lock:
+                    errors[0] += 1
+            i += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+# Concurrent callers asking for tags, drawn from a pool of distinct contents
+# so that, as with Streamlit reruns, the same content comes up repeatedly
+def run_suggest_calls(suggest, contents, requests_per_client, concurrency):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        rng = random.Random(worker_id)
+        local = []
+        for _ in range(requests_per_client):
+            content = rng.choice(contents)
+            started = time.perf_counter()
+            suggest(content)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def bench_suggest(args):
+    workdir = tempfile.mkdtemp(prefix="bookmarks-suggest-")
+    cache_path = os.path.join(workdir, "tag_suggestions.db")
+    contents = [f"Article {i} about python web scraping and data pipelines, part {i % 7}"
+                for i in range(args.distinct)]
+
+    def report(name, suggester, latencies, elapsed):
+        p50, p99 = percentiles_ms(latencies)
+        print(f"{name:22s} {len(latencies) / elapsed:8.1f} req/s  p50={p50:8.2f} ms  p99={p99:8.2f} ms  "
+              f"model calls={suggester.calls}")
+
+    # Before: every request is its own model call
+    suggester = ai.FakeSuggester(args.latency, args.per_item_latency)
+    latencies, elapsed = run_suggest_calls(suggester.suggest, contents, args.requests, args.concurrency)
+    report("direct", suggester, latencies, elapsed)
+
+    # Cache, coalescing and batching in front of the same suggester
+    for name in ("service (cold)", "service (restarted)"):
+        suggester = ai.FakeSuggester(args.latency, args.per_item_latency)
+        service = ai.TagSuggestionService(suggester, SuggestionCache(cache_path), args.batch_size, args.wait_ms)
+        latencies, elapsed = run_suggest_calls(service.suggest, contents, args.requests, args.concurrency)
+        report(name, suggester, latencies, elapsed)
+        stats = service.stats()
+        print(f"{'':22s} hit rate={stats['cache']['hit_rate']:.2f}  coalesced={stats['coalesced']}  "
+              f"mean batch={stats['mean_batch_size']:.1f}")
+        service.close()
+
+
+# Bookmarks drawn from topics: each topic has its own words and tags, and
+# every text also mixes in words shared by all topics
+def topic_bookmarks(rng, n, topics, shared_words):
+    for _ in range(n):
+        words, tags = rng.choice(topics)
+        title = " ".join(rng.choice(words) if rng.random() < 0.7 else rng.choice(shared_words) for _ in range(5))
+        description = " ".join(rng.choice(words) if rng.random() < 0.5 else rng.choice(shared_words)
+                               for _ in range(25))
+        yield title, description, tags
+
+
+def bench_local(args):
+    rng = random.Random(42)
+    shared_words = [f"common{i}" for i in range(2000)]
+    topics = [([f"topic{t}word{i}" for i in range(50)], [f"tag{t}a", f"tag{t}b", f"tag{t}c"])
+              for t in range(args.topics)]
+
+    index = LocalTagIndex()
+    started = time.perf_counter()
+    corpus = list(topic_bookmarks(rng, args.bookmarks, topics, shared_words))
+    for start in range(0, len(corpus), 10000):
+        index.add_many(corpus[start:start + 10000])
+    elapsed = time.perf_counter() - started
+    print(f"indexed {args.bookmarks} bookmarks in {elapsed:.1f} s ({args.bookmarks / elapsed:.0f} bookmarks/s)")
+
+    # Incremental adds, as single saves arrive through the API
+    started = time.perf_counter()
+    for bookmark in topic_bookmarks(rng, args.adds, topics, shared_words):
+        index.add(*bookmark)
+    print(f"single adds: {(time.perf_counter() - started) / args.adds * 1000:.3f} ms/bookmark")
+
+    queries = list(topic_bookmarks(rng, args.queries, topics, shared_words))
+    latencies, results = [], []
+    for title, description, tags in queries:
+        started = time.perf_counter()
+        suggested, confidence = index.suggest_scored(f"{title} {description}")
+        latencies.append(time.perf_counter() - started)
+        results.append((set(suggested), set(tags), confidence))
+    p50, p99 = percentiles_ms(latencies)
+    print(f"local index      p50={p50:8.2f} ms  p99={p99:8.2f} ms")
+
+    # Unrelated content should fall through to the model
+    noise = [" ".join(rng.choice(shared_words) for _ in range(30)) for _ in range(args.queries)]
+    noise_confidence = [index.suggest_scored(content)[1] for content in noise]
+
+    for threshold in (0.3, 0.5, 0.7):
+        answered = [(s, t) for s, t, c in results if s and c >= threshold]
+        precision = (sum(len(s & t) / len(s) for s, t in answered) / len(answered)) if answered else 0.0
+        false_local = sum(c >= threshold for c in noise_confidence) / len(noise_confidence)
+        print(f"  confidence >= {threshold:.2f}: {len(answered) / len(results) * 100:5.1f}% answered locally, "
+              f"precision {precision:.2f}; unrelated content answered locally {false_local * 100:5.1f}%")
+
+    # The model round-trip the local index replaces
+    if args.gemini:
+        suggester = ai.GeminiSuggester()
+    else:
+        suggester = ai.FakeSuggester(args.latency)
+    latencies = []
+    for title, description, _ in queries[:args.model_queries]:
+        started = time.perf_counter()
+        suggester.suggest(f"{title} {description}")
+        latencies.append(time.perf_counter() - started)
+    p50, p99 = percentiles_ms(latencies)
+    print(f"{'gemini' if args.gemini else 'fake model':16s} p50={p50:8.2f} ms  p99={p99:8.2f} ms")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Start the API with uvicorn against a throwaway database
+def start_server(port, **extra_env):
+    workdir = tempfile.mkdtemp(prefix="bookmarks-load-")
+    env = dict(os.environ, BOOKMARKS_DB=os.path.join(workdir, "bookmarks.db"),
+               TAG_CACHE_PATH=os.path.join(workdir, "tag_suggestions.db"), **extra_env)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/bookmarks/search", params={"tags": ["x"]}, timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("API server did not start")
+
+
+def bench_load(args):
+    server = None
+    base_url = args.url
+    if base_url is None:
+        port = free_port()
+        server = start_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+
+    vocabulary = [f"tag{i}" for i in range(args.tags)]
+    try:
+        def create(session, worker_id, i):
+            rng = random.Random(worker_id * 1000003 + i)
+            return session.post(f"{base_url}/bookmarks/", json={
+                "url": f"https://example.com/{worker_id}/{i}",
+                "title": f"Bookmark {worker_id}-{i}",
+                "description": "load test",
+                "tags": rng.sample(vocabulary, 3),
+            })
+
+        def search(session, worker_id, i):
+            rng = random.Random(worker_id * 1000003 + i)
+            return session.get(f"{base_url}/bookmarks/search", params={"tags": rng.sample(vocabulary, 2)})
+
+        for name, make_request in (("create", create), ("search", search)):
+            latencies, errors = run_load(make_request, args.seconds, args.concurrency)
+            p50, p99 = percentiles_ms(latencies)
+            print(f"{name:7s} {len(latencies) / args.seconds:8.0f} req/s  p50={p50:7.2f} ms  p99={p99:7.2f} ms  "
+                  f"errors={errors}  ({args.concurrency} clients)")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+# /bookmarks/ latency on its own, then again while other clients saturate
+# /tags/suggest with content the cache and local index can't answer
+def bench_isolation(args):
+    port = free_port()
+    server = start_server(port, TAG_SUGGESTER="fake", TAG_FAKE_LATENCY=str(args.model_latency))
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        requests.post(f"{base_url}/bookmarks/bulk", json=[
+            {"url": f"https://example.com/{i}", "title": f"Bookmark {i}", "description": "isolation test",
+             "tags": ["load"]} for i in range(args.bookmarks)])
+
+        def list_bookmarks(session, worker_id, i):
+            return session.get(f"{base_url}/bookmarks/")
+
+        def suggest(session, worker_id, i):
+            return session.post(f"{base_url}/tags/suggest", json={"content": f"unseen content {worker_id} {i}"})
+
+        def report(name, latencies, errors, clients):
+            p50, p99 = percentiles_ms(latencies)
+            print(f"{name:28s} {len(latencies) / args.seconds:8.0f} req/s  p50={p50:8.2f} ms  p99={p99:8.2f} ms  "
+                  f"errors={errors}  ({clients} clients)")
+
+        latencies, errors = run_load(list_bookmarks, args.seconds, args.concurrency)
+        report("/bookmarks/ alone", latencies, errors, args.concurrency)
+
+        background = {}
+        saturating = threading.Thread(target=lambda: background.update(
+            result=run_load(suggest, args.seconds, args.ai_concurrency)))
+        saturating.start()
+        latencies, errors = run_load(list_bookmarks, args.seconds, args.concurrency)
+        saturating.join()
+        report("/bookmarks/ with AI load", latencies, errors, args.concurrency)
+        report("/tags/suggest (saturating)", *background["result"], args.ai_concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# What a sync client pays per poll: the whole collection, one page, an
+# incremental poll with nothing new, and ETag revalidation
+def bench_sync(args):
+    port = free_port()
+    server = start_server(port, TAG_SUGGESTER="fake")
+    base_url = f"http://127.0.0.1:{port}"
+    session = requests.Session()
+    try:
+        for start in range(0, args.bookmarks, 5000):
+            session.post(f"{base_url}/bookmarks/bulk", json=[
+                {"url": f"https://example.com/{i}", "title": f"Bookmark {i}", "description": "sync test " * 5,
+                 "tags": ["sync", f"tag{i % 100}"]} for i in range(start, min(start + 5000, args.bookmarks))])
+
+        def measure(name, params=None, headers=None):
+            latencies = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = session.get(f"{base_url}/bookmarks/", params=params, headers=headers)
+                latencies.append(time.perf_counter() - started)
+            p50, _ = percentiles_ms(latencies)
+            print(f"{name:34s} {p50:9.2f} ms  {len(response.content):>10d} bytes  status={response.status_code}")
+            return response
+
+        measure(f"whole collection ({args.bookmarks})")
+        first = measure(f"page of {args.page}", params={"limit": args.page})
+        measure(f"page of {args.page}, id+updated_at",
+                params={"limit": args.page, "columns": "id,updated_at"})
+        measure("same page, If-None-Match", params={"limit": args.page},
+                headers={"If-None-Match": first.headers["ETag"]})
+        everything = session.get(f"{base_url}/bookmarks/", params={"columns": "id"})
+        measure("poll with nothing new", params={
+            "since": everything.headers["X-Next-Since"], "after_id": everything.headers["X-Next-After-Id"]})
+        measure("whole collection, If-None-Match", headers={
+            "If-None-Match": session.get(f"{base_url}/bookmarks/").headers["ETag"]})
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# Peak Python heap while fn runs, next to its result
+def traced(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+def write_bookmark_file(path, format, bookmarks):
+    export = transfer.BookmarkExport(format)
+    with open(path, "wb") as fileobj:
+        fileobj.write(export.header())
+        for i, bookmark in enumerate(bookmarks, 1):
+            fileobj.write(export.rows([(i, bookmark.url, bookmark.title, bookmark.description,
+                                        ",".join(bookmark.tags), "2024-01-01T00:00:00.000Z")]))
+        fileobj.write(export.footer())
+    return os.path.getsize(path)
+
+
+def bench_transfer(args):
+    use_temp_database()
+    database.create_bookmark_table()
+    rng = random.Random(42)
+
+    def corpus(prefix, n):
+        for i, bookmark in enumerate(synthetic_corpus(rng, n, 5000, 200)):
+            # Half arrive untagged, as browser exports do
+            yield bookmark.model_copy(update={"url": f"https://{prefix}.example.com/{i}",
+                                              "tags": bookmark.tags if i % 2 else []})
+
+    # Memory is measured without learning, since the local tag index is
+    # meant to grow with the collection
+    for format in ("html", "json"):
+        runs = [(args.bookmarks // 10, "heap", False), (args.bookmarks, "heap", False),
+                (args.bookmarks, "rate", False), (args.bookmarks, "rate", True)]
+        for n, measure, learn in runs:
+            prefix = f"{format}-{n}-{measure}-{learn}"
+            path = f"{prefix}.{format}"
+            size = write_bookmark_file(path, format, corpus(prefix, n))
+
+            def run_import():
+                with open(path, "rb") as fileobj:
+                    return transfer.import_file(fileobj, format, args.chunk_size, learn=learn)
+
+            label = f"import {format} {n:>8d} bookmarks ({size / 1e6:6.1f} MB)"
+            if measure == "heap":
+                peak, _ = traced(run_import)
+                print(f"{label}: peak heap {peak / 1e6:6.1f} MB")
+            else:
+                stats = run_import().stats()
+                print(f"{label}: {stats['bookmarks_per_second']:8.0f} bookmarks/s, {stats['chunks']} transactions"
+                      f"{', learning tags' if learn else ''}")
+
+    total = database.get_max_bookmark_id()
+    for format in ("html", "json"):
+        def run_export():
+            with open(f"export.{format}", "wb") as fileobj:
+                return transfer.export_file(fileobj, format, args.chunk_size)
+
+        peak, _ = traced(run_export)
+        stats = run_export().stats()
+        print(f"export {format} {total:>8d} bookmarks ({stats['bytes'] / 1e6:6.1f} MB): "
+              f"{stats['bookmarks_per_second']:8.0f} bookmarks/s, peak heap {peak / 1e6:6.1f} MB")
+
+    # For comparison: parsing the whole file into memory before saving
+    with open(f"html-{args.bookmarks}-rate-False.html", "rb") as fileobj:
+        peak, _ = traced(lambda: transfer.NetscapeParser().feed(fileobj.read().decode("utf-8")))
+    print(f"whole-file parse of html {args.bookmarks:>8d} bookmarks: peak heap {peak / 1e6:6.1f} MB")
+
+
+
+# Cost of the timing layer, then create/search req/s with the sampling
+# profiler off and on, in alternating rounds so drift affects both alike
+def bench_metrics(args):
+    import statistics
+
+    histogram = metrics.Histogram()
+    observe_seconds, _ = timed(lambda: [histogram.observe(0.001) for _ in range(100000)])
+
+    def stage_blocks():
+        for _ in range(100000):
+            with metrics.stage("bench"):
+                pass
+    stage_seconds, _ = timed(stage_blocks)
+    print(f"Histogram.observe: {observe_seconds * 1e4:.0f} ns, with metrics.stage(): {stage_seconds * 1e4:.0f} ns")
+
+    port = free_port()
+    server = start_server(port, TAG_SUGGESTER="fake")
+    base_url = f"http://127.0.0.1:{port}"
+    rates = {False: [], True: []}
+    try:
+        def create_and_search(session, worker_id, i):
+            if i % 2:
+                return session.get(f"{base_url}/bookmarks/search", params={"q": f"bookmark {i % 50}", "limit": 10})
+            return session.post(f"{base_url}/bookmarks/", json={
+                "url": f"https://example.com/{worker_id}/{i}",
+                "title": f"Bookmark {i % 50} from client {worker_id}",
+                "description": "metrics overhead run",
+                "tags": [f"tag{i % 20}"],
+            })
+
+        run_load(create_and_search, 1.0, args.concurrency)
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                requests.post(f"{base_url}/debug/profiler", params={"enabled": enabled})
+                latencies, _ = run_load(create_and_search, args.seconds, args.concurrency)
+                rates[enabled].append(len(latencies) / args.seconds)
+        profiler_stats = requests.post(f"{base_url}/debug/profiler", params={"enabled": False}).json()
+        scrape = requests.get(f"{base_url}/metrics").text
+    finally:
+        server.terminate()
+        server.wait()
+
+    off, on = statistics.median(rates[False]), statistics.median(rates[True])
+    print(f"profiler off: {off:.0f} req/s, on: {on:.0f} req/s (median of {args.rounds} rounds), "
+          f"throughput change {100.0 * (on - off) / off:+.2f}%, "
+          f"sampler's own share of wall time {100.0 * profiler_stats['overhead']:.2f}% "
+          f"({profiler_stats['samples']} samples)")
+    for line in scrape.splitlines():
+        if line.startswith(("stage_duration_seconds_sum", "stage_duration_seconds_count")):
+            print(f"  {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bookmark management benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tags = subparsers.add_parser("tags", help="Indexed tag search vs LIKE scans")
+    tags.add_argument("--bookmarks", type=int, default=1000000)
+    tags.add_argument("--tags", type=int, default=10000)
+    tags.add_argument("--tags-per-bookmark", type=int, default=3)
+    tags.add_argument("--queries", type=int, default=20)
+    tags.add_argument("--no-legacy", dest="queries_legacy", action="store_false",
+                      help="Skip the (slow) LIKE scan baseline")
+    tags.set_defaults(func=bench_tags)
+
+    search = subparsers.add_parser("search", help="FTS5 ranked text search latency on a synthetic corpus")
+    search.add_argument("--bookmarks", type=int, default=200000)
+    search.add_argument("--words", type=int, default=50000)
+    search.add_argument("--tags", type=int, default=1000)
+    search.add_argument("--queries", type=int, default=20)
+    search.add_argument("--repeat", type=int, default=5)
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--deep-offset", type=int, default=1000)
+    search.add_argument("--no-legacy", dest="queries_legacy", action="store_false",
+                        help="Skip the (slow) LIKE scan baseline")
+    search.set_defaults(func=bench_search)
+
+    suggest = subparsers.add_parser("suggest", help="Tag suggestion cache, coalescing and batching with a fake model")
+    suggest.add_argument("--distinct", type=int, default=200, help="Distinct contents requested")
+    suggest.add_argument("--requests", type=int, default=50, help="Requests per client")
+    suggest.add_argument("--concurrency", type=int, default=32)
+    suggest.add_argument("--latency", type=float, default=0.3, help="Simulated seconds per model call")
+    suggest.add_argument("--per-item-latency", type=float, default=0.005)
+    suggest.add_argument("--batch-size", type=int, default=16)
+    suggest.add_argument("--wait-ms", type=float, default=20.0)
+    suggest.set_defaults(func=bench_suggest)
+
+    local = subparsers.add_parser("local", help="Local nearest-neighbour tag suggestions vs the model")
+    local.add_argument("--bookmarks", type=int, default=100000)
+    local.add_argument("--topics", type=int, default=500)
+    local.add_argument("--adds", type=int, default=2000)
+    local.add_argument("--queries", type=int, default=500)
+    local.add_argument("--model-queries", type=int, default=10)
+    local.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per fake model call")
+    local.add_argument("--gemini", action="store_true", help="Time real Gemini calls (needs GOOGLE_API_KEY)")
+    local.set_defaults(func=bench_local)
+
+    load = subparsers.add_parser("load", help="Requests/sec for create and search against the API")
+    load.add_argument("--url", default=None, help="Existing server to test (default: start one with uvicorn)")
+    load.add_argument("--seconds", type=float, default=10.0)
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--tags", type=int, default=1000)
+    load.set_defaults(func=bench_load)
+
+    isolation = subparsers.add_parser("isolation", help="/bookmarks/ latency while /tags/suggest is saturated")
+    isolation.add_argument("--seconds", type=float, default=10.0)
+    isolation.add_argument("--concurrency", type=int, default=4, help="/bookmarks/ clients")
+    isolation.add_argument("--ai-concurrency", type=int, default=64, help="/tags/suggest clients")
+    isolation.add_argument("--model-latency", type=float, default=1.0, help="Simulated seconds per model call")
+    isolation.add_argument("--bookmarks", type=int, default=50)
+    isolation.set_defaults(func=bench_isolation)
+
+    dedupe = subparsers.add_parser("dedupe", help="URL dedupe job and upsert write throughput")
+    dedupe.add_argument("--bookmarks", type=int, default=500000)
+    dedupe.add_argument("--duplicates", type=float, default=0.1, help="Share of rows repeating an earlier URL")
+    dedupe.add_argument("--batch-size", type=int, default=5000)
+    dedupe.add_argument("--writes", type=int, default=50000)
+    dedupe.set_defaults(func=bench_dedupe)
+
+    sync = subparsers.add_parser("sync", help="Cost of full, paged, incremental and conditional GET /bookmarks/")
+    sync.add_argument("--bookmarks", type=int, default=100000)
+    sync.add_argument("--page", type=int, default=100)
+    sync.add_argument("--repeat", type=int, default=10)
+    sync.set_defaults(func=bench_sync)
+
+    transfer_parser = subparsers.add_parser("transfer", help="Streaming import/export throughput and memory")
+    transfer_parser.add_argument("--bookmarks", type=int, default=100000)
+    transfer_parser.add_argument("--chunk-size", type=int, default=1000)
+    transfer_parser.set_defaults(func=bench_transfer)
+
+    metrics_parser = subparsers.add_parser("metrics", help="Timing layer cost and sampling profiler overhead")
+    metrics_parser.add_argument("--concurrency", type=int, default=8)
+    metrics_parser.add_argument("--seconds", type=float, default=5.0)
+    metrics_parser.add_argument("--rounds", type=int, default=3)
+    metrics_parser.set_defaults(func=bench_metrics)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by SuggestionCache.get when a key is absent or expired
+MISSING = object()
+
+
+# Cache key for a piece of content: whitespace differences don't count, and
+# the namespace (which suggester produced the tags) keeps engines apart
+def content_key(content: str, namespace: str = "") -> str:
+    normalized = " ".join(content.split())
+    return hashlib.sha256(f"{namespace}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+# Tag suggestions cached in memory (LRU, maxsize entries) in front of a
+# SQLite file (disk_maxsize entries), so they survive restarts. Entries in
+# both layers expire ttl seconds after they were computed. The file has its
+# own lock, so memory hits never wait behind disk reads and writes.
+class SuggestionCache:
+    def __init__(self, path="tag_suggestions.db", maxsize=10000, disk_maxsize=100000, ttl=7 * 24 * 3600.0):
+        self.path = path
+        self.maxsize = maxsize
+        self.disk_maxsize = disk_maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        # Rows in the file: counted when it is opened and after each trim,
+        # otherwise kept up to date by put_many (expired rows that get
+        # rewritten are counted twice until the next trim)
+        self._disk_size = 0
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        # The file is opened on first use, so importing doesn't create it
+        self._connection = None
+
+    def _disk(self):
+        if self._connection is None and self.path:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute('''CREATE TABLE IF NOT EXISTS suggestions (
+                                     key TEXT PRIMARY KEY,
+                                     tags TEXT NOT NULL,
+                                     created_at REAL NOT NULL
+                                 )''')
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_suggestions_created ON suggestions (created_at)")
+            connection.commit()
+            self._disk_size = connection.execute("SELECT COUNT(*) FROM suggestions").fetchone()[0]
+            self._connection = connection
+        return self._connection
+
+    # Memory first, then the file
+    def get(self, key):
+        tags = self.get_memory(key)
+        if tags is MISSING:
+            tags = self.get_disk(key)
+        return tags
+
+    # Never touches the file, so it is safe to call from the event loop
+    def get_memory(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            tags, created_at = entry
+            if created_at + self.ttl >= now:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return list(tags)
+            del self._entries[key]
+            self.counters["expirations"] += 1
+            return MISSING
+
+    # The file only (a hit is copied into memory); counts a miss otherwise
+    def get_disk(self, key):
+        now = time.time()
+        row = None
+        with self._disk_lock:
+            disk = self._disk()
+            if disk is not None:
+                row = disk.execute(
+                    "SELECT tags, created_at FROM suggestions WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is not None and row[1] + self.ttl >= now:
+                tags = json.loads(row[0])
+                self._remember(key, tags, row[1])
+                self.counters["disk_hits"] += 1
+                return list(tags)
+            self.counters["misses"] += 1
+            return MISSING
+
+    def put_many(self, items):
+        # items are (key, tags) pairs; written to disk in one transaction
+        now = time.time()
+        with self._lock:
+            for key, tags in items:
+                self._remember(key, list(tags), now)
+        with self._disk_lock:
+            disk = self._disk()
+            if disk is not None:
+                with disk:
+                    disk.executemany(
+                        "INSERT OR REPLACE INTO suggestions (key, tags, created_at) VALUES (?, ?, ?)",
+                        [(key, json.dumps(list(tags)), now) for key, tags in items],
+                    )
+                self._disk_size += len(items)
+                self._disk_writes += len(items)
+                # Trimming the file costs a scan, so only do it every so often
+                if self._disk_writes >= max(1, self.disk_maxsize // 10):
+                    self._disk_writes = 0
+                    self._trim_disk(disk, now)
+
+    def put(self, key, tags):
+        self.put_many([(key, tags)])
+
+    def _remember(self, key, tags, created_at):
+        self._entries[key] = (tags, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _trim_disk(self, disk, now):
+        with disk:
+            disk.execute("DELETE FROM suggestions WHERE created_at < ?", (now - self.ttl,))
+            disk.execute('''DELETE FROM suggestions WHERE key IN (
+                                SELECT key FROM suggestions ORDER BY created_at DESC
+                                LIMIT -1 OFFSET ?)''', (self.disk_maxsize,))
+            self._disk_size = disk.execute("SELECT COUNT(*) FROM suggestions").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        with self._disk_lock:
+            disk = self._disk()
+            if disk is not None:
+                with disk:
+                    disk.execute("DELETE FROM suggestions")
+                self._disk_size = 0
+
+    def close(self):
+        with self._disk_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            return {
+                "size": len(self._entries),
+                "disk_size": self._disk_size if self._connection is not None else None,
+                "maxsize": self.maxsize,
+                "disk_maxsize": self.disk_maxsize,
+                "ttl": self.ttl,
+                "hit_rate": (self.counters["hits"] + self.counters["disk_hits"]) / lookups if lookups else 0.0,
+                **self.counters,
+            }
@@ -1,56 +1,676 @@
+import asyncio
+import os
+import queue
 import sqlite3
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Optional
+import metrics
 from models import Bookmark
+from urls import url_hash
+
+DATABASE_PATH = os.getenv("BOOKMARKS_DB", "bookmarks.db")
+
+# Bumped whenever create_bookmark_table gains a migration step
+SCHEMA_VERSION = 4
+
+# WAL lets searches run while a save is committing; synchronous=NORMAL is
+# durable across application crashes in WAL mode and skips the per-commit fsync
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-32768",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+]
+
+# UTC with milliseconds; sorts correctly as text, which is how
+# updated_at is compared in sync queries
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+# Statements are module constants so each pooled connection's statement
+# cache prepares them once and reuses them for every call
+# Saving a URL that is already bookmarked (in canonical form) updates that
+# bookmark instead; id comes back only if something was inserted or changed
+UPSERT_BOOKMARK_SQL = f'''INSERT INTO bookmarks (url, title, description, tags, updated_at, url_hash)
+                          VALUES (?, ?, ?, ?, {NOW_SQL}, ?)
+                          ON CONFLICT (url_hash) DO UPDATE SET
+                              url = excluded.url,
+                              title = excluded.title,
+                              description = excluded.description,
+                              tags = excluded.tags,
+                              updated_at = excluded.updated_at
+                          WHERE bookmarks.url IS NOT excluded.url
+                             OR bookmarks.title IS NOT excluded.title
+                             OR bookmarks.description IS NOT excluded.description
+                             OR bookmarks.tags IS NOT excluded.tags
+                          RETURNING id'''
+# Imports only fill in what the file has: a bookmark that is already saved
+# keeps its description and tags when the imported entry has none, and its
+# title when the imported one is just the URL. Returns the stored tags of
+# every row inserted or changed.
+IMPORT_BOOKMARK_SQL = f'''INSERT INTO bookmarks (url, title, description, tags, updated_at, url_hash)
+                          VALUES (?, ?, ?, ?, {NOW_SQL}, ?)
+                          ON CONFLICT (url_hash) DO UPDATE SET
+                              url = excluded.url,
+                              title = CASE WHEN excluded.title IN ('', excluded.url) THEN bookmarks.title
+                                           ELSE excluded.title END,
+                              description = COALESCE(NULLIF(excluded.description, ''), bookmarks.description),
+                              tags = COALESCE(NULLIF(excluded.tags, ''), bookmarks.tags),
+                              updated_at = excluded.updated_at
+                          WHERE bookmarks.url IS NOT excluded.url
+                             OR (excluded.title NOT IN ('', excluded.url) AND bookmarks.title IS NOT excluded.title)
+                             OR (excluded.description != '' AND bookmarks.description IS NOT excluded.description)
+                             OR (excluded.tags != '' AND bookmarks.tags IS NOT excluded.tags)
+                          RETURNING id, tags'''
+# Until the unique index on url_hash exists (a database from before it,
+# while the one-time dedupe runs) ON CONFLICT (url_hash) can't be used, so
+# saves look the URL up and update or insert it with these instead. The
+# parameters are the upserts' five, plus the id found for updates. A URL
+# whose rows the dedupe hasn't hashed yet is inserted again; its last
+# pass merges those.
+FIND_BY_URL_HASH_SQL = "SELECT id FROM bookmarks WHERE url_hash = ? ORDER BY id LIMIT 1"
+INSERT_BOOKMARK_SQL = f'''INSERT INTO bookmarks (url, title, description, tags, updated_at, url_hash)
+                          VALUES (?1, ?2, ?3, ?4, {NOW_SQL}, ?5)
+                          RETURNING id, tags'''
+UPDATE_BOOKMARK_SQL = f'''UPDATE bookmarks SET url = ?1, title = ?2, description = ?3, tags = ?4, updated_at = {NOW_SQL}
+                          WHERE id = ?6 AND url_hash IS ?5
+                            AND (url IS NOT ?1 OR title IS NOT ?2 OR description IS NOT ?3 OR tags IS NOT ?4)
+                          RETURNING id, tags'''
+IMPORT_UPDATE_SQL = f'''UPDATE bookmarks SET
+                            url = ?1,
+                            title = CASE WHEN ?2 IN ('', ?1) THEN title ELSE ?2 END,
+                            description = COALESCE(NULLIF(?3, ''), description),
+                            tags = COALESCE(NULLIF(?4, ''), tags),
+                            updated_at = {NOW_SQL}
+                        WHERE id = ?6 AND url_hash IS ?5
+                          AND (url IS NOT ?1
+                               OR (?2 NOT IN ('', ?1) AND title IS NOT ?2)
+                               OR (?3 != '' AND description IS NOT ?3)
+                               OR (?4 != '' AND tags IS NOT ?4))
+                        RETURNING id, tags'''
+DELETE_TAGS_SQL = "DELETE FROM bookmark_tags WHERE bookmark_id = ?"
+INSERT_TAG_SQL = "INSERT OR IGNORE INTO bookmark_tags (tag, bookmark_id) VALUES (?, ?)"
+SELECT_BOOKMARKS_SQL = "SELECT * FROM bookmarks"
+
+# Full-text index over title, description and tags. It is an external
+# content table, so the text itself is only stored once, in bookmarks; the
+# triggers keep the index in step with every insert, update and delete.
+FTS_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS bookmarks_fts USING fts5(
+           title, description, tags,
+           content='bookmarks', content_rowid='id',
+           tokenize='porter unicode61 remove_diacritics 2'
+       )''',
+    '''CREATE TRIGGER IF NOT EXISTS bookmarks_fts_insert AFTER INSERT ON bookmarks BEGIN
+           INSERT INTO bookmarks_fts (rowid, title, description, tags)
+           VALUES (new.id, new.title, new.description, new.tags);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS bookmarks_fts_delete AFTER DELETE ON bookmarks BEGIN
+           INSERT INTO bookmarks_fts (bookmarks_fts, rowid, title, description, tags)
+           VALUES ('delete', old.id, old.title, old.description, old.tags);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS bookmarks_fts_update AFTER UPDATE OF title, description, tags ON bookmarks BEGIN
+           INSERT INTO bookmarks_fts (bookmarks_fts, rowid, title, description, tags)
+           VALUES ('delete', old.id, old.title, old.description, old.tags);
+           INSERT INTO bookmarks_fts (rowid, title, description, tags)
+           VALUES (new.id, new.title, new.description, new.tags);
+       END''',
+]
+
+# Columns GET /bookmarks/ may project, in table order
+BOOKMARK_COLUMNS = ["id", "url", "title", "description", "tags", "updated_at"]
+
+# BM25 column weights: title matches count most, then tags, then description
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+
+
+# Thread-safe pool of open SQLite connections. FastAPI runs the sync
+# handlers on a threadpool, so connections are handed between threads.
+class ConnectionPool:
+    def __init__(self, path, size=8):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        for pragma in CONNECTION_PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        # Pool exhausted: wait for another thread to hand one back
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            if connection.in_transaction:
+                connection.rollback()
+            self._idle.put(connection)
+
+    @contextmanager
+    def transaction(self):
+        # Commits on success, rolls back if the block raises
+        with self.connection() as connection:
+            with connection:
+                yield connection
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+# Normalize a tag the way it is stored in the bookmark_tags index
+def normalize_tag(tag: str) -> str:
+    return tag.strip().lower()
+
+# Split a tag list into distinct, non-empty index entries
+def normalize_tags(tags: List[str]) -> List[str]:
+    return list(dict.fromkeys(t for t in (normalize_tag(tag) for tag in tags) if t))
+
+def row_to_bookmark(row) -> Bookmark:
+    return Bookmark(url=row[1], title=row[2], description=row[3], tags=row[4].split(','))
+
+# Ids of bookmarks matching the tags. With match="any" a bookmark needs
+# one of the tags, with match="all" it needs every tag.
+def tag_id_subquery(tags: List[str], match: str = "any"):
+    tags = normalize_tags(tags)
+    placeholders = ", ".join("?" for _ in tags)
+    if match == "all":
+        subquery = f'''SELECT bookmark_id FROM bookmark_tags WHERE tag IN ({placeholders})
+                       GROUP BY bookmark_id HAVING COUNT(*) = ?'''
+        params = tags + [len(tags)]
+    elif match == "any":
+        subquery = f"SELECT bookmark_id FROM bookmark_tags WHERE tag IN ({placeholders})"
+        params = tags
+    else:
+        raise ValueError(f"Unknown match mode: {match}")
+    return subquery, params
+
+# Build the single indexed query behind a tag search
+def tag_search_query(tags: List[str], match: str = "any"):
+    subquery, params = tag_id_subquery(tags, match)
+    return f"SELECT * FROM bookmarks WHERE id IN ({subquery}) ORDER BY id", params
+
+
+# Turn free text into an FTS5 query: every word must match, the last one
+# as a prefix so partially typed words still find results. Words are quoted,
+# so FTS5 operators and punctuation in user input are treated as text.
+def fts_query(text: str) -> str:
+    words = [w.replace('"', '""') for w in text.split()]
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+# Ranked full-text search, optionally restricted to bookmarks with the given
+# tags. Ranking happens inside the FTS table and only the requested page is
+# joined back to bookmarks, so broad queries don't fetch every matching row.
+def text_search_query(text: str, tags: List[str] = (), match: str = "any", limit: int = 20, offset: int = 0):
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    where = "bookmarks_fts MATCH ?"
+    params = [fts_query(text)]
+    if normalize_tags(tags):
+        subquery, tag_params = tag_id_subquery(tags, match)
+        where += f" AND rowid IN ({subquery})"
+        params += tag_params
+    sql = f'''SELECT bookmarks.* FROM (
+                  SELECT rowid, bm25(bookmarks_fts, {weights}) AS rank FROM bookmarks_fts
+                  WHERE {where} ORDER BY rank LIMIT ? OFFSET ?
+              ) AS hits
+              JOIN bookmarks ON bookmarks.id = hits.rowid
+              ORDER BY hits.rank'''
+    params += [limit, offset]
+    return sql, params
+
+
+# Keyset-paginated sync query, ordered by (updated_at, id). A client passes
+# the updated_at/id of the last row it saw (since/after_id) and gets only
+# what changed after it. id and updated_at are always selected, after the
+# projected columns, so the next cursor can be built; the full column list
+# is returned too.
+def bookmarks_page_query(columns: List[str], limit: Optional[int] = None, since: Optional[str] = None,
+                         after_id: Optional[int] = None):
+    unknown = [c for c in columns if c not in BOOKMARK_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    # after_id only breaks ties between bookmarks updated at the same time
+    if after_id is not None and since is None:
+        raise ValueError("after_id requires since")
+    selected = list(columns) + [c for c in ("id", "updated_at") if c not in columns]
+
+    sql = f"SELECT {', '.join(selected)} FROM bookmarks"
+    params = []
+    if since is not None and after_id is not None:
+        sql += " WHERE (updated_at, id) > (?, ?)"
+        params += [since, after_id]
+    elif since is not None:
+        sql += " WHERE updated_at > ?"
+        params.append(since)
+    sql += " ORDER BY updated_at, id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params, selected
+
+
+# All bookmark SQL lives here; handlers only see Bookmark models
+class BookmarkRepository:
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        # Whether ON CONFLICT (url_hash) can be used; rechecked on every
+        # save until it can, since dedupe.py may add the index from outside
+        self.unique_urls = False
+
+    # Create the bookmark tables if they don't exist and run migrations
+    def create_tables(self, deduplicate: bool = True):
+        with self.pool.transaction() as connection:
+            cursor = connection.cursor()
+            cursor.execute('''CREATE TABLE IF NOT EXISTS bookmarks (
+                                id INTEGER PRIMARY KEY,
+                                url TEXT,
+                                title TEXT,
+                                description TEXT,
+                                tags TEXT,
+                                updated_at TEXT,
+                                url_hash BLOB
+                            )''')
+            # One row per (tag, bookmark), so tag searches are index lookups
+            cursor.execute('''CREATE TABLE IF NOT EXISTS bookmark_tags (
+                                tag TEXT NOT NULL,
+                                bookmark_id INTEGER NOT NULL REFERENCES bookmarks(id) ON DELETE CASCADE,
+                                PRIMARY KEY (tag, bookmark_id)
+                            ) WITHOUT ROWID''')
+
+            # Build the tag index from the comma-separated tags column once
+            # (before the secondary index exists, which makes the bulk load faster)
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._migrate_tags(connection)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookmark_tags_bookmark ON bookmark_tags (bookmark_id)")
+
+            # Full-text index, built from the existing rows once. Before
+            # version 3 the update trigger fired on every column.
+            if version < 3:
+                cursor.execute("DROP TRIGGER IF EXISTS bookmarks_fts_update")
+            for statement in FTS_SCHEMA:
+                cursor.execute(statement)
+            if version < 2:
+                cursor.execute("INSERT INTO bookmarks_fts (bookmarks_fts) VALUES ('rebuild')")
+
+            # Change tracking for incremental sync; rows that predate it
+            # count as changed at migration time
+            columns = [row[1] for row in cursor.execute("PRAGMA table_info(bookmarks)")]
+            if "updated_at" not in columns:
+                cursor.execute("ALTER TABLE bookmarks ADD COLUMN updated_at TEXT")
+            cursor.execute(f"UPDATE bookmarks SET updated_at = {NOW_SQL} WHERE updated_at IS NULL")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookmarks_updated ON bookmarks (updated_at, id)")
+
+            if "url_hash" not in columns:
+                cursor.execute("ALTER TABLE bookmarks ADD COLUMN url_hash BLOB")
+            # Nothing to deduplicate in a new database, so it gets the
+            # unique index right away
+            if cursor.execute("SELECT 1 FROM bookmarks LIMIT 1").fetchone() is None:
+                cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bookmarks_url_hash ON bookmarks (url_hash)")
+                cursor.execute("DROP INDEX IF EXISTS idx_bookmarks_url_hash_scan")
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._check_unique_urls(connection)
+
+        # A database from before the unique index gets its duplicates
+        # merged, in batches (dedupe.py runs this step on its own, with
+        # progress reports; the server runs it in the background)
+        if deduplicate:
+            self.deduplicate()
+
+    def _check_unique_urls(self, connection) -> bool:
+        self.unique_urls = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_bookmarks_url_hash'"
+        ).fetchone() is not None
+        return self.unique_urls
+
+    def has_unique_urls(self) -> bool:
+        with self.pool.connection() as connection:
+            return self._check_unique_urls(connection)
+
+    # One-time dedupe job. Walks the table in short transactions, so it can
+    # run against a live database: first it hashes every URL, batch_size
+    # rows at a time, then it merges each group of rows with the same
+    # canonical URL into the oldest one (tags combined, empty fields filled
+    # in from the others), batch_size / 10 groups at a time since merges
+    # touch several rows and the full-text index. The unique index is
+    # created at the end, in one transaction with a last pass over rows
+    # written meanwhile.
+    # progress(stage, rows_done) is called after every batch. Setting stop
+    # (a threading.Event) ends the job after the current batch; the next
+    # run picks up where it left off.
+    def deduplicate(self, batch_size: int = 5000, progress=None, stop=None):
+        stats = {"hashed": 0, "groups": 0, "removed": 0}
+        if self.has_unique_urls():
+            return stats
+        with self.pool.transaction() as connection:
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_bookmarks_url_hash_scan ON bookmarks (url_hash)")
+
+        last_id = 0
+        while True:
+            with self.pool.transaction() as connection:
+                rows = connection.execute(
+                    "SELECT id, url FROM bookmarks WHERE id > ? AND url_hash IS NULL ORDER BY id LIMIT ?",
+                    (last_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                connection.executemany("UPDATE bookmarks SET url_hash = ? WHERE id = ?",
+                                       [(url_hash(url or ""), bookmark_id) for bookmark_id, url in rows])
+            last_id = rows[-1][0]
+            stats["hashed"] += len(rows)
+            if progress:
+                progress("hash", stats["hashed"])
+            if stop is not None and stop.is_set():
+                return stats
+
+        last_hash = b""
+        while True:
+            with self.pool.transaction() as connection:
+                hashes = [row[0] for row in connection.execute(
+                    '''SELECT url_hash FROM bookmarks WHERE url_hash > ?
+                       GROUP BY url_hash HAVING COUNT(*) > 1 ORDER BY url_hash LIMIT ?''',
+                    (last_hash, max(1, batch_size // 10))).fetchall()]
+                if not hashes:
+                    break
+                stats["removed"] += self._merge_duplicates(connection, hashes)
+            last_hash = hashes[-1]
+            stats["groups"] += len(hashes)
+            if progress:
+                progress("merge", stats["groups"])
+            if stop is not None and stop.is_set():
+                return stats
+
+        with self.pool.transaction() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute("SELECT id, url FROM bookmarks WHERE url_hash IS NULL").fetchall()
+            connection.executemany("UPDATE bookmarks SET url_hash = ? WHERE id = ?",
+                                   [(url_hash(url or ""), bookmark_id) for bookmark_id, url in rows])
+            stats["hashed"] += len(rows)
+            hashes = [row[0] for row in connection.execute(
+                "SELECT url_hash FROM bookmarks GROUP BY url_hash HAVING COUNT(*) > 1")]
+            stats["removed"] += self._merge_duplicates(connection, hashes)
+            stats["groups"] += len(hashes)
+            connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bookmarks_url_hash ON bookmarks (url_hash)")
+            connection.execute("DROP INDEX idx_bookmarks_url_hash_scan")
+        self.unique_urls = True
+        return stats
+
+    # Folds every group of same-URL rows into its oldest row; returns the
+    # number of rows deleted
+    def _merge_duplicates(self, connection, hashes):
+        removed = 0
+        for hash_ in hashes:
+            rows = connection.execute(
+                "SELECT id, url, title, description, tags FROM bookmarks WHERE url_hash = ? ORDER BY id",
+                (hash_,)).fetchall()
+            keep_id, url, title, description, tags = rows[0]
+            merged_tags = [tag for tag in (tags or "").split(",") if tag.strip()]
+            seen = set(normalize_tags(merged_tags))
+            for _, _, other_title, other_description, other_tags in rows[1:]:
+                title = title or other_title
+                description = description or other_description
+                for tag in (other_tags or "").split(","):
+                    if tag.strip() and normalize_tag(tag) not in seen:
+                        seen.add(normalize_tag(tag))
+                        merged_tags.append(tag)
+
+            duplicate_ids = [(row[0],) for row in rows[1:]]
+            connection.executemany("DELETE FROM bookmarks WHERE id = ?", duplicate_ids)
+            connection.execute(
+                f"UPDATE bookmarks SET title = ?, description = ?, tags = ?, updated_at = {NOW_SQL} WHERE id = ?",
+                (title, description, ",".join(merged_tags), keep_id))
+            connection.executemany(INSERT_TAG_SQL, [(tag, keep_id) for tag in seen])
+            removed += len(duplicate_ids)
+        return removed
+
+    # Populate bookmark_tags from the legacy tags column
+    def _migrate_tags(self, connection, batch_size=10000):
+        connection.execute("DELETE FROM bookmark_tags")
+        reader = connection.execute("SELECT id, tags FROM bookmarks WHERE tags IS NOT NULL AND tags != ''")
+        while True:
+            rows = reader.fetchmany(batch_size)
+            if not rows:
+                break
+            connection.executemany(
+                INSERT_TAG_SQL,
+                [(tag, bookmark_id) for bookmark_id, tags in rows for tag in normalize_tags(tags.split(','))],
+            )
+
+    # Runs upsert_sql, or without the unique index an insert or update_sql;
+    # returns the row's RETURNING values if it was inserted or changed
+    def _write(self, connection, upsert_sql, update_sql, bookmark: Bookmark):
+        params = (bookmark.url, bookmark.title, bookmark.description, ",".join(bookmark.tags),
+                  url_hash(bookmark.url))
+        if self.unique_urls or self._check_unique_urls(connection):
+            return connection.execute(upsert_sql, params).fetchone()
+        found = connection.execute(FIND_BY_URL_HASH_SQL, (params[4],)).fetchone()
+        if found is None:
+            return connection.execute(INSERT_BOOKMARK_SQL, params).fetchone()
+        return connection.execute(update_sql, params + tuple(found)).fetchone()
+
+    # Upsert one bookmark and, if it was inserted or changed, its tag index rows
+    def _upsert(self, connection, bookmark: Bookmark):
+        row = self._write(connection, UPSERT_BOOKMARK_SQL, UPDATE_BOOKMARK_SQL, bookmark)
+        if row is not None:
+            connection.execute(DELETE_TAGS_SQL, (row[0],))
+            connection.executemany(INSERT_TAG_SQL, [(tag, row[0]) for tag in normalize_tags(bookmark.tags)])
+
+    def save(self, bookmark: Bookmark):
+        with self.pool.transaction() as connection:
+            self._upsert(connection, bookmark)
+
+    # Save many bookmarks in one transaction
+    def save_many(self, bookmarks: List[Bookmark]):
+        if not bookmarks:
+            return
+        with self.pool.transaction() as connection:
+            for bookmark in bookmarks:
+                self._upsert(connection, bookmark)
+
+    # Save an imported chunk in one transaction; returns the ids of the
+    # bookmarks it inserted or changed that are still untagged
+    def import_many(self, bookmarks: List[Bookmark]) -> List[int]:
+        untagged = []
+        with self.pool.transaction() as connection:
+            for bookmark in bookmarks:
+                row = self._write(connection, IMPORT_BOOKMARK_SQL, IMPORT_UPDATE_SQL, bookmark)
+                if row is None:
+                    continue
+                bookmark_id, tags = row
+                connection.execute(DELETE_TAGS_SQL, (bookmark_id,))
+                tags = normalize_tags(tags.split(",")) if tags else []
+                connection.executemany(INSERT_TAG_SQL, [(tag, bookmark_id) for tag in tags])
+                if not tags:
+                    untagged.append(bookmark_id)
+        return untagged
+
+    def list(self) -> List[Bookmark]:
+        with self.pool.connection() as connection:
+            rows = connection.execute(SELECT_BOOKMARKS_SQL).fetchall()
+        return [row_to_bookmark(row) for row in rows]
+
+    # Rows of one sync page as tuples, in the order bookmarks_page_query selects
+    def page(self, columns: List[str], limit: Optional[int] = None, since: Optional[str] = None,
+             after_id: Optional[int] = None):
+        sql, params, selected = bookmarks_page_query(columns, limit, since, after_id)
+        with self.pool.connection() as connection:
+            return connection.execute(sql, params).fetchall(), selected
+
+    # Up to batch_size rows (BOOKMARK_COLUMNS) with id above after_id, in id order
+    def rows_after(self, after_id: int, batch_size: int = 10000):
+        with self.pool.connection() as connection:
+            return connection.execute(
+                f"SELECT {', '.join(BOOKMARK_COLUMNS)} FROM bookmarks WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, batch_size)).fetchall()
+
+    # Stream every bookmark in id order, batch_size rows at a time
+    def iter_all(self, batch_size: int = 10000):
+        last_id = 0
+        while True:
+            rows = self.rows_after(last_id, batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row_to_bookmark(row)
+            last_id = rows[-1][0]
+
+    def max_id(self) -> int:
+        with self.pool.connection() as connection:
+            return connection.execute("SELECT COALESCE(MAX(id), 0) FROM bookmarks").fetchone()[0]
+
+    # Changes whenever a bookmark is added or updated, since every write
+    # sets updated_at; both maxima are read from the ends of indexes
+    def data_version(self) -> str:
+        with self.pool.connection() as connection:
+            max_id, updated_at = connection.execute(
+                "SELECT (SELECT MAX(id) FROM bookmarks), (SELECT MAX(updated_at) FROM bookmarks)").fetchone()
+        return f"{max_id or 0}-{updated_at or ''}"
+
+    # (id, title, description) of those of the given bookmarks that are
+    # still without tags, in id order
+    def untagged(self, ids: List[int]):
+        if not ids:
+            return []
+        with self.pool.connection() as connection:
+            return connection.execute(
+                f'''SELECT id, title, description FROM bookmarks
+                    WHERE id IN ({",".join("?" * len(ids))}) AND (tags IS NULL OR tags = '') ORDER BY id''',
+                list(ids)).fetchall()
+
+    # Give untagged bookmarks their suggested tags; items are (id, tags).
+    # Bookmarks that got tags some other way in the meantime are left alone.
+    def fill_tags(self, items):
+        filled = 0
+        with self.pool.transaction() as connection:
+            for bookmark_id, tags in items:
+                tags = [tag for tag in tags if tag.strip()]
+                if not tags:
+                    continue
+                cursor = connection.execute(
+                    f'''UPDATE bookmarks SET tags = ?, updated_at = {NOW_SQL}
+                        WHERE id = ? AND (tags IS NULL OR tags = '')''',
+                    (",".join(tags), bookmark_id))
+                if cursor.rowcount:
+                    connection.executemany(INSERT_TAG_SQL, [(tag, bookmark_id) for tag in normalize_tags(tags)])
+                    filled += 1
+        return filled
+
+    def by_tags(self, tags: List[str], match: str = "any") -> List[Bookmark]:
+        if not normalize_tags(tags):
+            return []
+        sql, params = tag_search_query(tags, match)
+        with self.pool.connection() as connection:
+            # Each bookmark comes back once, however many of the tags it matches
+            rows = connection.execute(sql, params).fetchall()
+        return [row_to_bookmark(row) for row in rows]
+
+    # BM25-ranked full-text search, one page at a time
+    def search_text(self, text: str, tags: List[str] = (), match: str = "any",
+                    limit: int = 20, offset: int = 0) -> List[Bookmark]:
+        if not fts_query(text):
+            return []
+        sql, params = text_search_query(text, tags, match, limit, offset)
+        with self.pool.connection() as connection:
+            rows = connection.execute(sql, params).fetchall()
+        return [row_to_bookmark(row) for row in rows]
+
+
+pool = ConnectionPool(DATABASE_PATH, size=int(os.getenv("BOOKMARKS_POOL_SIZE", "8")))
+repository = BookmarkRepository(pool)
+
+# Dedicated threads for async callers, one per pooled connection, so
+# database work never queues behind anything else running in threads
+executor = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix="bookmarks-db")
+
+# Run fn(*args) on a database thread and await the result
+async def run(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, metrics.timed_call, "db-query", fn, *args)
 
 # Function to create the bookmark table if it doesn't exist
-def create_bookmark_table():
-    connection = sqlite3.connect("bookmarks.db")
-    cursor = connection.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS bookmarks (
-                        id INTEGER PRIMARY KEY,
-                        url TEXT,
-                        title TEXT,
-                        description TEXT,
-                        tags TEXT
-                    )''')
-    connection.commit()
-    connection.close()
+def create_bookmark_table(deduplicate: bool = True):
+    repository.create_tables(deduplicate)
+
+# Function to run the one-time URL dedupe, if the database still needs it
+def deduplicate_bookmarks(stop=None):
+    return repository.deduplicate(stop=stop)
 
 # Function to save a bookmark to SQLite
 def save_bookmark(bookmark: Bookmark):
-    connection = sqlite3.connect("bookmarks.db")
-    cursor = connection.cursor()
-    tags_str = ",".join(bookmark.tags)  # Store tags as a comma-separated string
-    cursor.execute('''INSERT INTO bookmarks (url, title, description, tags)
-                      VALUES (?, ?, ?, ?)''', 
-                   (bookmark.url, bookmark.title, bookmark.description, tags_str))
-    connection.commit()
-    connection.close()
+    repository.save(bookmark)
+
+# Function to save many bookmarks in a single transaction
+def save_bookmarks(bookmarks: List[Bookmark]):
+    repository.save_many(bookmarks)
+
+# Function to save an imported chunk, keeping existing values the file lacks
+def import_bookmarks(bookmarks: List[Bookmark]) -> List[int]:
+    return repository.import_many(bookmarks)
 
 # Function to retrieve all bookmarks from SQLite
 def get_bookmarks() -> List[Bookmark]:
-    connection = sqlite3.connect("bookmarks.db")
-    cursor = connection.cursor()
-    cursor.execute("SELECT * FROM bookmarks")
-    rows = cursor.fetchall()
-    bookmarks = [Bookmark(url=row[1], title=row[2], description=row[3], tags=row[4].split(',')) for row in rows]
-    connection.close()
-    return bookmarks
+    return repository.list()
+
+# Function to fetch one page of bookmarks for incremental sync
+def get_bookmarks_page(columns: List[str], limit: Optional[int] = None, since: Optional[str] = None,
+                       after_id: Optional[int] = None):
+    return repository.page(columns, limit, since, after_id)
+
+# Function to iterate over all bookmarks without loading them at once
+def iter_bookmarks(batch_size: int = 10000):
+    return repository.iter_all(batch_size)
+
+# Function to read the next batch of rows in id order, for exports
+def get_bookmark_rows_after(after_id: int, batch_size: int = 1000):
+    return repository.rows_after(after_id, batch_size)
+
+# Function to get the highest bookmark id, 0 when there are none
+def get_max_bookmark_id() -> int:
+    return repository.max_id()
+
+# Function to get a version string that changes whenever bookmarks change
+def get_data_version() -> str:
+    return repository.data_version()
+
+# Function to find which of the given bookmarks still need tags
+def get_untagged_bookmarks(ids: List[int]):
+    return repository.untagged(ids)
+
+# Function to store suggested tags on bookmarks that are still untagged
+def fill_bookmark_tags(items):
+    return repository.fill_tags(items)
 
 # Function to retrieve bookmarks by tags
-def get_bookmarks_by_tags(tags: List[str]) -> List[Bookmark]:
-    connection = sqlite3.connect("bookmarks.db")
-    cursor = connection.cursor()
-    
-    # Prepare the SQL query to match any of the tags in the bookmark's tags list
-    # We need to ensure that tags are properly handled for multiple inputs
-    bookmarks = []
-    for tag in tags:
-        cursor.execute("SELECT * FROM bookmarks WHERE tags LIKE ?", ('%' + tag + '%',))
-        rows = cursor.fetchall()
-        for row in rows:
-            bookmark = Bookmark(url=row[1], title=row[2], description=row[3], tags=row[4].split(','))
-            bookmarks.append(bookmark)
-    
-    connection.close()
-    return bookmarks
+def get_bookmarks_by_tags(tags: List[str], match: str = "any") -> List[Bookmark]:
+    return repository.by_tags(tags, match)
+
+# Function to search bookmark titles, descriptions and tags, best match first
+def search_bookmarks_text(text: str, tags: List[str] = (), match: str = "any",
+                          limit: int = 20, offset: int = 0) -> List[Bookmark]:
+    return repository.search_text(text, tags, match, limit, offset)
@@ -0,0 +1,34 @@
+import argparse
+import time
+
+from database import BookmarkRepository, ConnectionPool, DATABASE_PATH
+
+
+# Runs the one-time URL dedupe against a database, which may be in use by
+# a running server: every batch is its own short transaction
+def main():
+    parser = argparse.ArgumentParser(description="Merge bookmarks that share a canonical URL and add the unique index")
+    parser.add_argument("--db", default=DATABASE_PATH)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    repository = BookmarkRepository(ConnectionPool(args.db, size=1))
+    started = time.perf_counter()
+    last_report = [started]
+
+    def progress(stage, done):
+        now = time.perf_counter()
+        if now - last_report[0] >= 1.0:
+            last_report[0] = now
+            print(f"{stage}: {done} ({done / (now - started):.0f}/s)")
+
+    repository.create_tables(deduplicate=False)
+    stats = repository.deduplicate(args.batch_size, progress)
+    elapsed = time.perf_counter() - started
+    print(f"hashed {stats['hashed']} rows, merged {stats['groups']} duplicate groups, "
+          f"removed {stats['removed']} rows in {elapsed:.1f} s")
+    repository.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import threading
+from typing import Iterable, List, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+# Titles are short and to the point, so their words count twice
+def bookmark_text(title: str, description: str) -> str:
+    return f"{title} {title} {description}"
+
+
+# Nearest-neighbour tag suggestions from bookmarks already stored. Texts
+# become hashed word 1-2 gram vectors (no vocabulary to maintain, so new
+# bookmarks can be added at any time), weighted by TF-IDF at query time.
+#
+# Rows live in a column-compressed matrix, so a query only reads the
+# columns of its own terms. New rows wait in a small pending block and are
+# merged in (refreshing the IDF weights and row norms) once they make up
+# merge_fraction of the corpus and number at least min_merge, so a stream
+# of single saves doesn't rebuild the matrix every time. Only the first
+# rows of an empty index are merged sooner, on the first query.
+#
+# A bookmark added again under the same key replaces its earlier row,
+# which stops counting at once and is dropped at the next merge.
+class LocalTagIndex:
+    def __init__(self, n_features=2 ** 20, neighbours=10, max_tags=5, min_tag_share=0.3,
+                 min_similarity=0.05, merge_fraction=0.05, min_merge=1000):
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features, ngram_range=(1, 2), stop_words="english",
+            alternate_sign=False, norm=None, dtype=np.float32,
+        )
+        self.n_features = n_features
+        self.neighbours = neighbours
+        self.max_tags = max_tags
+        self.min_tag_share = min_tag_share
+        self.min_similarity = min_similarity
+        self.merge_fraction = merge_fraction
+        self.min_merge = min_merge
+
+        self._lock = threading.Lock()
+        self._matrix = sp.csc_matrix((0, n_features), dtype=np.float32)
+        self._norms = np.ones(0, dtype=np.float32)
+        self._idf = np.ones(n_features, dtype=np.float32)
+        self._pending = []
+        self._pending_rows = 0
+        self._pending_block = None
+        self._doc_tags = []
+        self._doc_keys = []
+        self._key_docs = {}
+        # Replaced rows, left out of every query until the next merge
+        self._dead = []
+        self._dead_array = None
+        self._tag_names = []
+        self._tag_ids = {}
+        self.counters = {"queries": 0, "merges": 0, "replaced": 0}
+
+    # Sublinear term frequencies, one CSR row per text
+    def _term_frequencies(self, texts: List[str]):
+        counts = self.vectorizer.transform(texts).tocsr()
+        np.log(counts.data, out=counts.data)
+        counts.data += 1.0
+        return counts
+
+    def _row_norms(self, rows):
+        return np.sqrt(rows.multiply(rows) @ (self._idf * self._idf)).astype(np.float32)
+
+    # Bookmarks are (title, description, tags) triples, or (title,
+    # description, tags, key) to replace whatever was added under the same
+    # key (e.g. the URL hash). Untagged ones are skipped, but still remove
+    # their key's earlier row.
+    def add_many(self, bookmarks: Iterable[Tuple]):
+        texts, tag_lists, keys, removed = [], [], [], []
+        for bookmark in bookmarks:
+            title, description, tags = bookmark[:3]
+            key = bookmark[3] if len(bookmark) > 3 else None
+            tags = [t for t in dict.fromkeys(tag.strip().lower() for tag in tags) if t]
+            if tags:
+                texts.append(bookmark_text(title, description))
+                tag_lists.append(tags)
+                keys.append(key)
+            elif key is not None:
+                removed.append(key)
+        if not texts and not removed:
+            return
+
+        rows = self._term_frequencies(texts) if texts else None
+        with self._lock:
+            for key in removed:
+                self._forget(key)
+            for tags, key in zip(tag_lists, keys):
+                if key is not None:
+                    self._forget(key)
+                    self._key_docs[key] = len(self._doc_tags)
+                self._doc_keys.append(key)
+                ids = []
+                for tag in tags:
+                    tag_id = self._tag_ids.get(tag)
+                    if tag_id is None:
+                        tag_id = self._tag_ids[tag] = len(self._tag_names)
+                        self._tag_names.append(tag)
+                    ids.append(tag_id)
+                self._doc_tags.append(np.asarray(ids, dtype=np.int32))
+            if rows is not None:
+                self._pending.append(rows)
+                self._pending_rows += rows.shape[0]
+                self._pending_block = None
+            if self._merge_due():
+                self._merge()
+
+    def _merge_due(self, querying=False):
+        if querying and self._matrix.shape[0] == 0:
+            return self._pending_rows > 0
+        return self._pending_rows >= max(self.min_merge, self.merge_fraction * self._matrix.shape[0])
+
+    def _forget(self, key):
+        doc = self._key_docs.pop(key, None)
+        if doc is not None:
+            self._doc_tags[doc] = np.zeros(0, dtype=np.int32)
+            self._doc_keys[doc] = None
+            self._dead.append(doc)
+            self._dead_array = None
+            self.counters["replaced"] += 1
+
+    def add(self, title: str, description: str, tags: List[str]):
+        self.add_many([(title, description, tags)])
+
+    def _merge(self):
+        matrix = sp.vstack([self._matrix] + self._pending, format="csc")
+        if self._dead:
+            keep = np.ones(matrix.shape[0], dtype=bool)
+            keep[self._dead] = False
+            matrix = matrix[keep]
+            self._doc_tags = [tags for tags, kept in zip(self._doc_tags, keep) if kept]
+            self._doc_keys = [key for key, kept in zip(self._doc_keys, keep) if kept]
+            self._key_docs = {key: doc for doc, key in enumerate(self._doc_keys) if key is not None}
+            self._dead = []
+            self._dead_array = None
+        self._matrix = matrix
+        self._pending = []
+        self._pending_rows = 0
+        self._pending_block = None
+        n_docs = self._matrix.shape[0]
+        # Stored entries per column are the term's document frequencies
+        df = np.diff(self._matrix.indptr)
+        self._idf = (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0).astype(np.float32)
+        self._norms = np.maximum(self._row_norms(self._matrix), 1e-12)
+        self.counters["merges"] += 1
+
+    # Returns (tags, confidence). Tags are those carried by at least
+    # min_tag_share of the (similarity-weighted) nearest neighbours.
+    # Confidence is the share of the top tag, scaled down when fewer than
+    # `neighbours` bookmarks are at least min_similarity close: neighbours
+    # that agree mean the content sits inside a known topic.
+    def suggest_scored(self, content: str) -> Tuple[List[str], float]:
+        query = self._term_frequencies([content])
+        terms = query.indices
+        with self._lock:
+            self.counters["queries"] += 1
+            if self._merge_due(querying=True):
+                self._merge()
+            idf = self._idf[terms]
+            query_norm = float(np.sqrt(np.sum((query.data * idf) ** 2)))
+            if query_norm == 0.0 or not self._doc_tags:
+                return [], 0.0
+            weights = query.data * idf * idf / query_norm
+
+            # One sparse product over just the query's term columns
+            scores = self._matrix[:, terms] @ weights
+            scores /= self._norms
+            if self._pending:
+                # Stacked once per batch of adds, then reused by every query
+                if self._pending_block is None:
+                    block = sp.vstack(self._pending, format="csc")
+                    self._pending_block = (block, np.maximum(self._row_norms(block), 1e-12))
+                block, norms = self._pending_block
+                scores = np.concatenate([scores, (block[:, terms] @ weights) / norms])
+            if self._dead:
+                if self._dead_array is None:
+                    self._dead_array = np.asarray(self._dead)
+                scores[self._dead_array] = -np.inf
+
+            k = min(self.neighbours, scores.shape[0])
+            nearest = np.argpartition(-scores, k - 1)[:k]
+            nearest = nearest[scores[nearest] >= self.min_similarity]
+            if nearest.size == 0:
+                return [], 0.0
+            votes = {}
+            for doc in nearest:
+                for tag_id in self._doc_tags[doc]:
+                    votes[tag_id] = votes.get(tag_id, 0.0) + float(scores[doc])
+            total = float(scores[nearest].sum())
+            ranked = sorted(votes.items(), key=lambda item: -item[1])
+            tags = [self._tag_names[tag_id] for tag_id, vote in ranked[:self.max_tags]
+                    if vote / total >= self.min_tag_share]
+            confidence = ranked[0][1] / total * nearest.size / self.neighbours
+        return tags, min(confidence, 1.0)
+
+    def suggest(self, content: str) -> List[str]:
+        return self.suggest_scored(content)[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._doc_tags) - len(self._dead),
+                "pending": self._pending_rows,
+                "tags": len(self._tag_names),
+                "nonzeros": int(self._matrix.nnz + sum(rows.nnz for rows in self._pending)),
+                **self.counters,
+            }
@@ -1,53 +1,240 @@
-from fastapi import FastAPI, HTTPException, Query
-from typing import List
-import sqlite3
-import models, ai, database
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import List, Optional
+import asyncio
+import hashlib
+import models, ai, database, transfer, metrics
 import logging
+import os
+import threading
 
-app = FastAPI()
+logger = logging.getLogger("bookmarks")
 
-# Initialize the database
-database.create_bookmark_table()
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# A database from before the unique URL index is deduplicated in the
+# background, in short transactions, so startup doesn't wait for it;
+# saves work without the index meanwhile
+async def deduplicate_in_background(stop: threading.Event):
+    try:
+        stats = await asyncio.get_running_loop().run_in_executor(None, database.deduplicate_bookmarks, stop)
+        logger.info("URL dedupe %s: %s", "stopped" if stop.is_set() else "finished", stats)
+    except Exception:
+        logger.exception("URL dedupe failed; it is retried on the next start")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if metrics.PROFILE_ON_START:
+        metrics.profiler.start()
+    dedupe_stop = threading.Event()
+    dedupe = None
+    if not database.repository.unique_urls:
+        dedupe = asyncio.create_task(deduplicate_in_background(dedupe_stop))
+    yield
+    dedupe_stop.set()
+    if dedupe is not None:
+        await dedupe
+    metrics.profiler.stop()
+    transfer.backfill.close()
+    ai.service.close()
+    ai.local_executor.shutdown(wait=True)
+    database.executor.shutdown(wait=True)
+    database.pool.close()
+
+
+# Handlers are async: database calls run on database.executor and tag
+# suggestions on the AI side's own threads, so slow model calls can't take
+# the threads that plain CRUD requests need
+app = FastAPI(lifespan=lifespan)
+
+# Per-route request latency, and the start time the validate stage is measured from
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Initialize the database (the URL dedupe, if needed, starts with the app)
+database.create_bookmark_table(deduplicate=False)
+
+# Build the local tag suggestion index from the stored bookmarks
+ai.learn_bookmarks(database.iter_bookmarks())
 
-# Endpoint to create a bookmark
+# Set up logging (LOG_LEVEL=DEBUG for everything, including the libraries)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+# Endpoint to create a bookmark, or update the one saved for the same URL
 @app.post("/bookmarks/", response_model=models.Bookmark)
-def create_bookmark(bookmark: models.Bookmark):
-    try:
-        # Save the bookmark to the database
-        database.save_bookmark(bookmark)
-    except sqlite3.IntegrityError:
-        raise HTTPException(status_code=400, detail="Bookmark already exists")
+async def create_bookmark(bookmark: models.Bookmark):
+    metrics.validated()
+    # Save the bookmark to the database
+    await database.run(database.save_bookmark, bookmark)
+    await ai.learn_bookmarks_async([bookmark])
     return bookmark
 
-# Endpoint to get all bookmarks
+# Endpoint to create many bookmarks in one transaction
+@app.post("/bookmarks/bulk")
+async def create_bookmarks(bookmarks: List[models.Bookmark]):
+    metrics.validated()
+    await database.run(database.save_bookmarks, bookmarks)
+    await ai.learn_bookmarks_async(bookmarks)
+    return {"saved": len(bookmarks)}
+
+# Endpoint to import a Netscape bookmark HTML file or JSON (an array, or one
+# object per line) sent as the request body. The body is parsed as it
+# arrives and saved a chunk at a time; untagged bookmarks get suggested
+# tags in the background afterwards.
+@app.post("/bookmarks/import")
+async def import_bookmarks(request: Request, format: str = Query("html", pattern="^(html|json)$"),
+                           folder_tags: bool = False, chunk_size: int = Query(1000, ge=1, le=10000)):
+    job = transfer.BookmarkImport(format, chunk_size, folder_tags)
+    try:
+        async for data in request.stream():
+            for chunk in job.feed(data):
+                await ai.learn_bookmarks_async(await database.run(job.save, chunk))
+        for chunk in job.close():
+            await ai.learn_bookmarks_async(await database.run(job.save, chunk))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e} (after {job.counters['bookmarks']} bookmarks)")
+    finally:
+        transfer.backfill.enqueue(job.untagged_ids)
+    stats = job.stats()
+    transfer.logger.info("import finished: %s", stats)
+    return stats
+
+# Endpoint to download every bookmark as Netscape HTML or JSON, streamed in
+# batches so the collection is never held in memory at once
+@app.get("/bookmarks/export")
+async def export_bookmarks(format: str = Query("html", pattern="^(html|json)$")):
+    return StreamingResponse(
+        transfer.export_stream(format),
+        media_type=transfer.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="bookmarks.{format}"'},
+    )
+
+# Fields returned when no columns are requested, as before pagination
+DEFAULT_COLUMNS = ["url", "title", "description", "tags"]
+
+# Strong validator for a page: it changes whenever a row joins, leaves or
+# is updated within the page, or the projection changes
+def page_etag(columns, keys):
+    digest = hashlib.sha1(",".join(columns).encode("utf-8"))
+    for bookmark_id, updated_at in keys:
+        digest.update(f"{bookmark_id}:{updated_at};".encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+def etag_matches(if_none_match, etag):
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+# Endpoint to get bookmarks, whole or a page at a time
 @app.get("/bookmarks/", response_model=List[models.Bookmark])
-def get_bookmarks():
-    # Retrieve all bookmarks from the database
-    bookmarks = database.get_bookmarks()
-    return bookmarks
+async def get_bookmarks(
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    since: Optional[str] = None,
+    after_id: Optional[int] = None,
+    columns: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    # Pages are ordered by (updated_at, id). Pass the X-Next-Since and
+    # X-Next-After-Id of the previous response to get the next page, or on
+    # a later poll only what changed since; after_id is only accepted
+    # together with since. columns is a comma separated projection of id,
+    # url, title, description, tags and updated_at. Without limit the
+    # whole collection is returned.
+    selected = [c.strip() for c in columns.split(",") if c.strip()] if columns else DEFAULT_COLUMNS
+    if any(c not in database.BOOKMARK_COLUMNS for c in selected):
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {columns}")
+    if after_id is not None and since is None:
+        raise HTTPException(status_code=400, detail="after_id requires since")
+
+    # Revalidation only reads ids and timestamps, straight from the index
+    if if_none_match:
+        keys, _ = await database.run(database.get_bookmarks_page, ["id", "updated_at"], limit, since, after_id)
+        etag = page_etag(selected, keys)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+    rows, row_columns = await database.run(database.get_bookmarks_page, selected, limit, since, after_id)
+    id_index, updated_index = row_columns.index("id"), row_columns.index("updated_at")
+    headers = {"ETag": page_etag(selected, ((row[id_index], row[updated_index]) for row in rows))}
+    if rows:
+        headers["X-Next-Since"] = rows[-1][updated_index]
+        headers["X-Next-After-Id"] = str(rows[-1][id_index])
+
+    bookmarks = []
+    for row in rows:
+        bookmark = dict(zip(selected, row))
+        if "tags" in bookmark:
+            bookmark["tags"] = bookmark["tags"].split(",")
+        bookmarks.append(bookmark)
+    return JSONResponse(bookmarks, headers=headers)
+
+# Endpoint to get the data version, which changes whenever a bookmark is
+# saved; clients key their caches (e.g. of tag suggestions, which depend
+# on the saved bookmarks) on it
+@app.get("/bookmarks/version")
+async def get_data_version():
+    return {"version": await database.run(database.get_data_version)}
 
-# Endpoint to suggest tags using Gemini API
+# Endpoint to suggest tags from similar bookmarks, falling back to Gemini API
 @app.post("/tags/suggest", response_model=models.TagSuggestionResponse)
-def suggest_tags(request: models.TagSuggestionRequest):
-    # Get tag suggestions using Gemini API
-    tags = ai.get_tag_suggestions(request.content)
+async def suggest_tags(request: models.TagSuggestionRequest):
+    metrics.validated()
+    # Get tag suggestions from the local index or Gemini API
+    try:
+        tags = await ai.get_tag_suggestions_async(request.content)
+    except asyncio.TimeoutError:
+        metrics.count_error("ai-call")
+        raise HTTPException(status_code=504, detail="Tag suggestion timed out")
     return models.TagSuggestionResponse(suggested_tags=tags)
 
-# Endpoint to search for bookmarks by tags
+# Endpoint to report local/remote suggestion, cache, batching and backfill counters
+@app.get("/tags/stats")
+async def tag_stats():
+    return {**ai.suggestion_stats(), "backfill": transfer.backfill.stats()}
+
+# The same counters, also exported as gauges on /metrics
+metrics.registry.add_collector("tags", tag_stats)
+
+# Endpoint for Prometheus: request and stage latency histograms (validate,
+# db-query, ai-call), error counters and the tag gauges, for this process
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# Endpoint to start or stop the sampling profiler; clear drops the samples so far
+@app.post("/debug/profiler")
+async def toggle_profiler(enabled: bool, clear: bool = False):
+    if clear:
+        metrics.profiler.clear()
+    if enabled:
+        metrics.profiler.start()
+    else:
+        metrics.profiler.stop()
+    return metrics.profiler.stats()
+
+# Endpoint to get the sampled stacks in folded format (flamegraph.pl, speedscope)
+@app.get("/debug/profiler", response_class=PlainTextResponse)
+async def get_profile():
+    return metrics.profiler.folded()
+
+# Endpoint to search for bookmarks by text and/or tags
 @app.get("/bookmarks/search", response_model=List[models.Bookmark])
-def search_bookmarks(tags: List[str] = Query([])):
+async def search_bookmarks(tags: List[str] = Query([]), match: str = Query("any", pattern="^(any|all)$"),
+                     q: Optional[str] = None, limit: int = Query(20, ge=1, le=200), offset: int = Query(0, ge=0)):
     """
-    Endpoint to search for bookmarks by tags. If no tags are provided,
-    it returns all bookmarks.
+    Endpoint to search for bookmarks. With q, titles, descriptions and tags
+    are searched full-text and results come back best match first, limit
+    at a time (tags, if given, narrow the matches further). Without q it
+    filters by tags only; if no tags are provided either, it returns all
+    bookmarks. With match=any a bookmark needs one of the tags, with
+    match=all it needs every one of them.
     """
-    if not tags:
+    if q:
+        bookmarks = await database.run(database.search_bookmarks_text, q, tags, match, limit, offset)
+    elif not tags:
         # If no tags are specified, return all bookmarks
-        bookmarks = database.get_bookmarks()
+        bookmarks = await database.run(database.get_bookmarks)
     else:
         # Filter bookmarks by tags
-        bookmarks = database.get_bookmarks_by_tags(tags)
+        bookmarks = await database.run(database.get_bookmarks_by_tags, tags, match)
 
     return bookmarks
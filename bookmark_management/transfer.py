@@ -0,0 +1,438 @@
+import argparse
+import codecs
+import html
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from array import array
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import List, Optional
+
+import models, ai, database
+from local_tags import bookmark_text
+
+logger = logging.getLogger("bookmarks.transfer")
+
+IMPORT_FORMATS = ("html", "json")
+MEDIA_TYPES = {"html": "text/html; charset=utf-8", "json": "application/json"}
+
+# Bookmarks that point into the browser rather than at a page
+SKIPPED_SCHEMES = ("place:", "javascript:", "data:", "about:", "chrome:")
+
+# Queued by TagBackfill.close() to stop the worker thread
+_STOP = object()
+
+
+# Push parser for the Netscape bookmark file format that browsers export:
+# feed it text as it arrives and it hands back each bookmark once it has
+# been read completely, so only the current bookmark is held in memory. A
+# bookmark's description (<DD>) follows its link, so a bookmark is finished
+# by whatever comes after it. With folder_tags, bookmarks that have no
+# TAGS attribute are tagged with the names of the folders they are in.
+class NetscapeParser(HTMLParser):
+    def __init__(self, folder_tags=False):
+        super().__init__(convert_charrefs=True)
+        self.folder_tags = folder_tags
+        self._folders = []
+        self._folder_name = None
+        self._current = None
+        self._reading = None
+        self._text = []
+        self._done = []
+
+    def feed(self, text: str) -> List[dict]:
+        super().feed(text)
+        done, self._done = self._done, []
+        return done
+
+    def close(self) -> List[dict]:
+        super().close()
+        self._finish()
+        done, self._done = self._done, []
+        return done
+
+    def _finish(self):
+        if self._current is not None:
+            if self._reading == "description":
+                self._current["description"] = "".join(self._text).strip()
+            self._done.append(self._current)
+        self._current = None
+        self._reading = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("dt", "a", "h3", "dl", "hr"):
+            self._finish()
+        if tag == "a":
+            attrs = dict(attrs)
+            tags = [t.strip() for t in (attrs.get("tags") or "").split(",") if t.strip()]
+            if not tags and self.folder_tags:
+                tags = [folder for folder in self._folders if folder]
+            self._current = {"url": attrs.get("href") or "", "title": "", "description": "", "tags": tags}
+            self._reading, self._text = "title", []
+        elif tag == "h3":
+            self._reading, self._text = "folder", []
+        elif tag == "dl":
+            self._folders.append(self._folder_name)
+            self._folder_name = None
+        elif tag == "dd" and self._current is not None and self._reading is None:
+            self._reading, self._text = "description", []
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._reading == "title":
+            self._current["title"] = "".join(self._text).strip()
+            self._reading = None
+        elif tag == "h3" and self._reading == "folder":
+            self._folder_name = "".join(self._text).strip()
+            self._reading = None
+        elif tag == "dl":
+            self._finish()
+            if self._folders:
+                self._folders.pop()
+
+    def handle_data(self, data):
+        if self._reading is not None:
+            self._text.append(data)
+
+
+# Push parser for a JSON array of bookmark objects (as written by the JSON
+# export) or for one object per line. Only the object currently being
+# received is buffered, up to max_item_size characters.
+class JSONStreamParser:
+    SEPARATORS = re.compile(r"[\s,]*")
+
+    def __init__(self, max_item_size=1 << 20):
+        self.max_item_size = max_item_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._started = False
+
+    def feed(self, text: str) -> List[dict]:
+        buffer = self._buffer + text
+        items = []
+        position = 0
+        while True:
+            position = self.SEPARATORS.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            if not self._started:
+                self._started = True
+                if buffer[position] == "[":
+                    position += 1
+                    continue
+            if buffer[position] == "]":
+                position += 1
+                continue
+            try:
+                item, position = self._decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Most likely cut off mid-object; wait for more text
+                break
+            if not isinstance(item, dict):
+                raise ValueError(f"Expected a bookmark object, got {type(item).__name__}")
+            items.append(item)
+        self._buffer = buffer[position:]
+        if len(self._buffer) > self.max_item_size:
+            raise ValueError(f"Bookmark object larger than {self.max_item_size} characters")
+        return items
+
+    def close(self) -> List[dict]:
+        if self._buffer.strip():
+            raise ValueError(f"Invalid JSON near: {self._buffer[:80]!r}")
+        return []
+
+
+# A parsed entry as a Bookmark, or None if it can't be imported
+def to_bookmark(item: dict) -> Optional[models.Bookmark]:
+    url = item.get("url")
+    if not isinstance(url, str):
+        return None
+    url = url.strip()
+    if not url or url.lower().startswith(SKIPPED_SCHEMES):
+        return None
+    tags = item.get("tags") or []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    tags = [str(tag).strip() for tag in tags if str(tag).strip()]
+    return models.Bookmark(url=url, title=str(item.get("title") or url),
+                           description=str(item.get("description") or ""), tags=tags)
+
+
+# One import: bytes go in through feed() and come back as chunks of
+# chunk_size bookmarks, each to be saved in its own transaction with
+# save(). Holding at most one chunk plus the parser's buffer keeps memory
+# flat however large the file is.
+class BookmarkImport:
+    def __init__(self, format="html", chunk_size=1000, folder_tags=False):
+        if format not in IMPORT_FORMATS:
+            raise ValueError(f"Unknown import format: {format}")
+        self.format = format
+        self.chunk_size = chunk_size
+        self.parser = NetscapeParser(folder_tags) if format == "html" else JSONStreamParser()
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self._chunk = []
+        # Ids of bookmarks this import inserted or changed that are still
+        # untagged, for the backfill; 8 bytes each
+        self.untagged_ids = array("q")
+        self.started = time.perf_counter()
+        self.counters = {"bookmarks": 0, "skipped": 0, "untagged": 0, "chunks": 0, "bytes": 0}
+
+    def _collect(self, items, final=False):
+        for item in items:
+            bookmark = to_bookmark(item)
+            if bookmark is None:
+                self.counters["skipped"] += 1
+            else:
+                self._chunk.append(bookmark)
+        chunks = []
+        while len(self._chunk) >= self.chunk_size or (final and self._chunk):
+            chunks.append(self._chunk[:self.chunk_size])
+            self._chunk = self._chunk[self.chunk_size:]
+        return chunks
+
+    def feed(self, data: bytes) -> List[List[models.Bookmark]]:
+        self.counters["bytes"] += len(data)
+        return self._collect(self.parser.feed(self.decoder.decode(data)))
+
+    def close(self) -> List[List[models.Bookmark]]:
+        items = self.parser.feed(self.decoder.decode(b"", final=True))
+        return self._collect(items + self.parser.close(), final=True)
+
+    # Saves a chunk in one transaction (runs on a database thread) and
+    # returns the bookmarks that came with tags, for the local index
+    def save(self, chunk: List[models.Bookmark]) -> List[models.Bookmark]:
+        self.untagged_ids.extend(database.import_bookmarks(chunk))
+        self.counters["bookmarks"] += len(chunk)
+        self.counters["chunks"] += 1
+        tagged = [bookmark for bookmark in chunk if bookmark.tags]
+        self.counters["untagged"] += len(chunk) - len(tagged)
+        return tagged
+
+    def stats(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            "format": self.format,
+            **self.counters,
+            "seconds": round(seconds, 3),
+            "bookmarks_per_second": round(self.counters["bookmarks"] / seconds, 1) if seconds else 0.0,
+        }
+
+
+# With learn, tagged bookmarks are also added to the local tag index
+def import_file(fileobj, format="html", chunk_size=1000, folder_tags=False, learn=True, read_size=1 << 16):
+    job = BookmarkImport(format, chunk_size, folder_tags)
+    for data in iter(lambda: fileobj.read(read_size), b""):
+        for chunk in job.feed(data):
+            tagged = job.save(chunk)
+            if learn:
+                ai.learn_bookmarks(tagged)
+    for chunk in job.close():
+        tagged = job.save(chunk)
+        if learn:
+            ai.learn_bookmarks(tagged)
+    return job
+
+
+def netscape_timestamp(updated_at: Optional[str]) -> str:
+    try:
+        return str(int(datetime.fromisoformat(updated_at).timestamp()))
+    except (TypeError, ValueError):
+        return ""
+
+
+# One export, written a batch of rows (database.BOOKMARK_COLUMNS) at a time
+class BookmarkExport:
+    def __init__(self, format="html"):
+        if format not in IMPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {format}")
+        self.format = format
+        self.started = time.perf_counter()
+        self.counters = {"bookmarks": 0, "bytes": 0}
+        self._first = True
+
+    def _emit(self, text: str) -> bytes:
+        data = text.encode("utf-8")
+        self.counters["bytes"] += len(data)
+        return data
+
+    def header(self) -> bytes:
+        if self.format == "json":
+            return self._emit("[")
+        return self._emit(
+            "<!DOCTYPE NETSCAPE-Bookmark-file-1>\n"
+            '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n'
+            "<TITLE>Bookmarks</TITLE>\n<H1>Bookmarks</H1>\n<DL><p>\n")
+
+    def rows(self, rows) -> bytes:
+        parts = []
+        for _, url, title, description, tags, updated_at in rows:
+            tags = [tag for tag in (tags or "").split(",") if tag]
+            if self.format == "json":
+                parts.append(("\n" if self._first else ",\n") + json.dumps(
+                    {"url": url, "title": title, "description": description, "tags": tags,
+                     "updated_at": updated_at}, ensure_ascii=False))
+                self._first = False
+            else:
+                parts.append(f'    <DT><A HREF="{html.escape(url)}" LAST_MODIFIED="{netscape_timestamp(updated_at)}"'
+                             f' TAGS="{html.escape(",".join(tags))}">{html.escape(title or "")}</A>\n')
+                if description:
+                    parts.append(f"    <DD>{html.escape(description)}\n")
+        self.counters["bookmarks"] += len(rows)
+        return self._emit("".join(parts))
+
+    def footer(self) -> bytes:
+        return self._emit("\n]\n" if self.format == "json" else "</DL><p>\n")
+
+    def stats(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            "format": self.format,
+            **self.counters,
+            "seconds": round(seconds, 3),
+            "bookmarks_per_second": round(self.counters["bookmarks"] / seconds, 1) if seconds else 0.0,
+        }
+
+
+def export_file(fileobj, format="html", batch_size=1000):
+    export = BookmarkExport(format)
+    fileobj.write(export.header())
+    last_id = 0
+    while True:
+        rows = database.get_bookmark_rows_after(last_id, batch_size)
+        if not rows:
+            break
+        fileobj.write(export.rows(rows))
+        last_id = rows[-1][0]
+    fileobj.write(export.footer())
+    return export
+
+
+# The same, as an async generator of bytes for a streaming response
+async def export_stream(format="html", batch_size=1000):
+    export = BookmarkExport(format)
+    yield export.header()
+    last_id = 0
+    while True:
+        rows = await database.run(database.get_bookmark_rows_after, last_id, batch_size)
+        if not rows:
+            break
+        yield export.rows(rows)
+        last_id = rows[-1][0]
+    yield export.footer()
+    logger.info("export finished: %s", export.stats())
+
+
+# Suggests tags for imported bookmarks that arrived without any, off the
+# request path. Each import queues the ids of the untagged bookmarks it
+# added or changed; the worker walks them batch_size bookmarks at a
+# time, submitting the whole batch before waiting so the suggestion
+# service can send it to the model in one call.
+# Suggested tags are not added to the local index, which only learns from
+# tags people chose. Queued imports are not persisted across restarts.
+class TagBackfill:
+    def __init__(self, batch_size=16, timeout=None):
+        self.batch_size = batch_size
+        self.timeout = timeout if timeout is not None else ai.AI_TIMEOUT
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counters = {"imports": 0, "scanned": 0, "tagged": 0, "errors": 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tag-backfill", daemon=True)
+                self._thread.start()
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    # Queue bookmarks by id for suggestions
+    def enqueue(self, ids):
+        if len(ids):
+            self.start()
+            self._queue.put(ids)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                self.fill(item)
+            except Exception:
+                self.counters["errors"] += 1
+                logger.exception("tag backfill failed for %d bookmarks", len(item))
+
+    # Suggest and store tags for those of the bookmarks that are still
+    # untagged; returns how many were tagged
+    def fill(self, ids) -> int:
+        self.counters["imports"] += 1
+        tagged = 0
+        for start in range(0, len(ids), self.batch_size):
+            rows = database.get_untagged_bookmarks(ids[start:start + self.batch_size])
+            if not rows:
+                continue
+            futures = [(bookmark_id, ai.submit_tag_suggestions(bookmark_text(title, description)))
+                       for bookmark_id, title, description in rows]
+            items = []
+            for bookmark_id, future in futures:
+                try:
+                    items.append((bookmark_id, future.result(self.timeout)))
+                except Exception:
+                    self.counters["errors"] += 1
+            filled = database.fill_bookmark_tags(items)
+            tagged += filled
+            self.counters["scanned"] += len(rows)
+            self.counters["tagged"] += filled
+        return tagged
+
+    def stats(self):
+        return {**self.counters, "queued_imports": self._queue.qsize()}
+
+
+backfill = TagBackfill(batch_size=int(os.getenv("TAG_BACKFILL_BATCH_SIZE", "16")))
+
+
+# Import or export a bookmark file against BOOKMARKS_DB from the command line
+def main():
+    parser = argparse.ArgumentParser(description="Import or export bookmarks as Netscape HTML or JSON")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=IMPORT_FORMATS,
+                        help="defaults to json for .json/.ndjson files, html otherwise")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--folder-tags", action="store_true", help="tag untagged bookmarks with their folder names")
+    parser.add_argument("--suggest-tags", action="store_true", help="suggest tags for untagged imports before exiting")
+    args = parser.parse_args()
+    format = args.format or ("json" if args.path.endswith((".json", ".ndjson")) else "html")
+
+    database.create_bookmark_table()
+    try:
+        if args.action == "import":
+            with open(args.path, "rb") as fileobj:
+                job = import_file(fileobj, format, args.chunk_size, args.folder_tags, learn=args.suggest_tags)
+            print(f"imported: {job.stats()}")
+            if args.suggest_tags and job.untagged_ids:
+                started = time.perf_counter()
+                tagged = backfill.fill(job.untagged_ids)
+                print(f"tagged {tagged} bookmarks in {time.perf_counter() - started:.1f} s")
+        else:
+            with open(args.path, "wb") as fileobj:
+                export = export_file(fileobj, format, args.chunk_size)
+            print(f"exported: {export.stats()}")
+    finally:
+        ai.service.close()
+        database.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "twclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "ref_src", "spm",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_")
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+# The form two URLs are compared in to decide whether they are the same
+# bookmark: http and https count as one, host case, default ports and a
+# trailing slash don't matter, tracking parameters are dropped and the rest
+# sorted, and fragments are ignored unless they look like an app route.
+# URLs without a scheme ("example.com/page") are read as web addresses.
+def canonical_url(url: str) -> str:
+    url = url.strip()
+    if "://" not in url:
+        url = "http://" + url
+    parts = urlsplit(url)
+
+    scheme = parts.scheme.lower()
+    if scheme in DEFAULT_PORTS:
+        scheme = "https"
+    host = (parts.hostname or "").rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host
+    if parts.username:
+        netloc = f"{parts.username}{':' + parts.password if parts.password else ''}@{netloc}"
+    if port is not None and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        netloc += f":{port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+
+    query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not is_tracking_param(name)))
+    fragment = parts.fragment if parts.fragment.startswith(("!", "/")) else ""
+    return urlunsplit((scheme, netloc, path, query, fragment))
+
+
+# 128 bits of SHA-256 over the canonical form; the unique key for a bookmark
+def url_hash(url: str) -> bytes:
+    return hashlib.sha256(canonical_url(url).encode("utf-8")).digest()[:16]
@@ -0,0 +1,214 @@
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import metrics
+
+logger = logging.getLogger("fraud.alerts")
+
+# Queued by stop() to tell the worker to finish up
+_STOP = object()
+
+
+# Sends fraud alert emails from a background thread, so the request path
+# only pays for a queue put. Keeps one SMTP connection open between sends,
+# retries failed sends a bounded number of times and folds alerts that
+# arrive close together into a single digest email.
+class AlertDispatcher:
+    def __init__(self, host="smtp.gmail.com", port=587, use_starttls=True,
+                 username=None, password=None, sender=None, receiver=None,
+                 max_queue_size=10000, digest_window=2.0, max_digest_size=100,
+                 max_retries=3, retry_backoff=1.0, idle_timeout=30.0):
+        self.host = host
+        self.port = port
+        self.use_starttls = use_starttls
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.receiver = receiver
+
+        self.digest_window = digest_window
+        self.max_digest_size = max_digest_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._server = None
+        self._thread = None
+
+        self.counters = {
+            "enqueued": 0,
+            "dropped": 0,
+            "emails_sent": 0,
+            "alerts_sent": 0,
+            "alerts_failed": 0,
+            "retries": 0,
+            "connections_opened": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            host=os.getenv("SMTP_HOST", "smtp.gmail.com"),
+            port=int(os.getenv("SMTP_PORT", "587")),
+            use_starttls=os.getenv("SMTP_STARTTLS", "1") not in ("0", "false", "False"),
+            username=os.getenv("EMAIL_USER"),
+            password=os.getenv("EMAIL_PASSWORD"),
+            receiver=os.getenv("EMAIL_RECEIVER"),
+            digest_window=float(os.getenv("ALERT_DIGEST_WINDOW", "2")),
+            max_digest_size=int(os.getenv("ALERT_MAX_DIGEST_SIZE", "100")),
+            max_retries=int(os.getenv("ALERT_MAX_RETRIES", "3")),
+        )
+
+    # Alerts can only be sent with a sender and a receiver address
+    @property
+    def configured(self):
+        return bool(self.sender and self.receiver)
+
+    def start(self):
+        if not self.configured:
+            logger.warning("EMAIL_USER/EMAIL_RECEIVER not set; fraud alerts will be dropped")
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="fraud-alerts", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10.0):
+        # The worker drains everything queued before the sentinel, then
+        # exits; waits at most timeout in total, even if the queue is full
+        # or the worker has died
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        if thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.warning("Alert queue still full at shutdown; %d alerts not sent", self._queue.qsize())
+                return
+        thread.join(max(deadline - time.monotonic(), 0.0))
+
+    def enqueue(self, alert):
+        if not self.configured:
+            self.counters["dropped"] += 1
+            return False
+        try:
+            self._queue.put_nowait(alert)
+            self.counters["enqueued"] += 1
+            return True
+        except queue.Full:
+            # Never block the request path; a full queue means SMTP is far behind
+            self.counters["dropped"] += 1
+            return False
+
+    def metrics(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "connected": self._server is not None,
+            **self.counters,
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # Servers drop idle sessions anyway, so close it ourselves
+                self._disconnect()
+                continue
+            if first is _STOP:
+                break
+
+            # Collect anything else that arrives within the digest window
+            batch = [first]
+            deadline = time.monotonic() + self.digest_window
+            while len(batch) < self.max_digest_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    alert = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if alert is _STOP:
+                    stopping = True
+                    break
+                batch.append(alert)
+
+            # Nothing a batch does may take the worker down with it
+            try:
+                self._send_with_retries(batch)
+            except Exception:
+                logger.exception("Dropping %d fraud alerts after an unexpected error", len(batch))
+                metrics.count_error("alert")
+                self.counters["alerts_failed"] += len(batch)
+                self._disconnect()
+
+        self._disconnect()
+
+    def _send_with_retries(self, batch):
+        message = self._build_message(batch)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.stage("alert"):
+                    server = self._connect()
+                    server.sendmail(self.sender, [self.receiver], message.as_string())
+                self.counters["emails_sent"] += 1
+                self.counters["alerts_sent"] += len(batch)
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning("Failed to send fraud alert (attempt %d): %s", attempt + 1, e)
+                metrics.count_error("alert")
+                self._disconnect()
+                if attempt < self.max_retries:
+                    self.counters["retries"] += 1
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+        self.counters["alerts_failed"] += len(batch)
+
+    def _connect(self):
+        if self._server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=10)
+            if self.use_starttls:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+            self._server = server
+            self.counters["connections_opened"] += 1
+        return self._server
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _build_message(self, batch):
+        if len(batch) == 1:
+            alert = batch[0]
+            subject = "Fraud Alert: Transaction Detected"
+            body = f"""
+    A fraudulent transaction has been detected:
+    Type: {alert['type']}
+    Amount: {alert['amount']}
+    """
+        else:
+            subject = f"Fraud Alert: {len(batch)} Transactions Detected"
+            lines = [f"    Type: {alert['type']}, Amount: {alert['amount']}" for alert in batch]
+            body = f"\n    {len(batch)} fraudulent transactions have been detected:\n" + "\n".join(lines) + "\n"
+
+        msg = MIMEMultipart()
+        msg["From"] = self.sender
+        msg["To"] = self.receiver
+        msg["Subject"] = subject
+        msg.attach(MIMEText(body, "plain"))
+        return msg
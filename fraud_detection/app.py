@@ -50,37 +50,77 @@ with st.form(key="transaction_form"):
         else:
             st.error("Please fill all fields")
 
+# Changes whenever the server stores a transaction. The fetches below are
+# cached per version, so Streamlit reruns only go back to the server for
+# this number until new data arrives.
+def get_data_version():
+    try:
+        response = requests.get(f"{API_BASE_URL}/dashboard-data/version", timeout=5)
+        response.raise_for_status()
+        return response.json()["version"]
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+
+@st.cache_data(ttl=60, max_entries=16, show_spinner=False)
+def fetch_recent_transactions(limit, version):
+    # Newest first, as the server returns them
+    response = requests.get(f"{API_BASE_URL}/transactions", params={"limit": limit}, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=60, max_entries=16, show_spinner=False)
+def fetch_aggregate(bucket, buckets, version):
+    response = requests.get(f"{API_BASE_URL}/dashboard-data/aggregate",
+                            params={"bucket": bucket, "buckets": buckets}, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+data_version = get_data_version()
+
 # Fetch and display transaction data
 st.header("Transaction Data")
 try:
-    response = requests.get(f"{API_BASE_URL}/transactions")
-    if response.status_code == 200:
-        # Load data into a DataFrame
-        transaction_data = pd.DataFrame(response.json())
+    transaction_data = pd.DataFrame(fetch_recent_transactions(100, data_version))
+
+    # Add a serial number column starting from 1 at the beginning of the DataFrame
+    if not transaction_data.empty:
+        transaction_data.insert(0, 'SR No.', transaction_data.index + 1)
 
-        # Sort data by timestamp to ensure the most recent transactions appear first
-        if not transaction_data.empty:
-            transaction_data["timestamp"] = pd.to_datetime(transaction_data["timestamp"])
-            transaction_data = transaction_data.sort_values(by="timestamp", ascending=False)
+    # Display the data in the app with the SR No. column at the start
+    st.dataframe(transaction_data, hide_index=True)
+except requests.RequestException as e:
+    st.error(f"Error fetching transactions: {e}")
 
-            # Add a serial number column starting from 1 at the beginning of the DataFrame
-            transaction_data.insert(0, 'SR No.', transaction_data.index + 1)
+# Fraud Trends visualization (bucketed and aggregated by the server)
+st.header("Fraud Trends")
+BUCKET_CHOICES = {"Hourly (last 48 hours)": ("1h", 48), "Daily (last 90 days)": ("1d", 90),
+                  "Weekly (last 52 weeks)": ("7d", 52)}
+choice = st.selectbox("Bucket size", list(BUCKET_CHOICES), index=1)
+try:
+    aggregate = fetch_aggregate(*BUCKET_CHOICES[choice], data_version)
+    trends = pd.DataFrame(aggregate["buckets"]).set_index("start")
+    if trends["transactions"].sum():
+        totals = aggregate["totals"]
+        columns = st.columns(3)
+        columns[0].metric("Transactions", f"{totals['transactions']:,}")
+        columns[1].metric("Fraudulent", f"{totals['fraudulent']:,}")
+        columns[2].metric("Fraud rate", f"{totals['fraud_rate']:.2%}")
 
-            # Reset index to avoid the default pandas index column being shown
-            transaction_data.reset_index(drop=True, inplace=True)
+        st.subheader("Fraudulent transactions")
+        st.line_chart(trends["fraudulent"])
+        st.subheader("Fraud rate")
+        st.line_chart(trends["fraud_rate"])
 
-        # Display the data in the app with the SR No. column at the start
-        st.dataframe(transaction_data)
+        st.subheader("Transactions by type")
+        by_type = pd.DataFrame({start: {t: v["transactions"] for t, v in row.items()}
+                                for start, row in trends["by_type"].items()}).T.fillna(0)
+        st.bar_chart(by_type)
 
-        # Fraud Trends visualization
-        st.header("Fraud Trends")
-        if not transaction_data.empty:
-            try:
-                fraud_trends = transaction_data.groupby(transaction_data["timestamp"].dt.date)["isFraud"].sum()
-                st.line_chart(fraud_trends)
-            except Exception as e:
-                st.error(f"Error in generating fraud trends: {e}")
+        percentiles = trends["amount_percentiles"].dropna()
+        if not percentiles.empty:
+            st.subheader("Amount percentiles")
+            st.line_chart(pd.DataFrame(percentiles.tolist(), index=percentiles.index))
     else:
-        st.error(f"Failed to fetch transaction data. Status Code: {response.status_code}")
-except Exception as e:
-    st.error(f"Error fetching transactions: {e}")
+        st.info("No transactions in this period yet.")
+except requests.RequestException as e:
+    st.error(f"Error in generating fraud trends: {e}")
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# Collects concurrent scoring requests for a short window and scores them
+# with a single vectorized call, resolving each caller's future afterwards.
+class MicroBatcher:
+    def __init__(self, predict_fn, n_features, max_batch_size=64, max_wait_ms=2.0, stats_window=1000):
+        self.predict_fn = predict_fn
+        self.n_features = n_features
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._pending = []
+        self._timer = None
+        # The event loop only keeps weak references to tasks, so in-flight
+        # batches are held here until they finish
+        self._tasks = set()
+        # A single worker keeps batches ordered and leaves the event loop free
+        # to collect the next batch while the current one is being scored.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fraud-batcher")
+
+        # Rolling windows used for the stats endpoint
+        self._batch_sizes = deque(maxlen=stats_window)
+        self._batch_latencies = deque(maxlen=stats_window)
+        self._request_latencies = deque(maxlen=stats_window)
+        self._total_batches = 0
+        self._total_rows = 0
+        self._total_errors = 0
+
+    async def submit(self, row):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            # A row of the wrong width (e.g. built just before a model
+            # reload) fails the whole batch rather than leaving it hanging
+            features = np.empty((len(batch), self.n_features), dtype=np.float64)
+            for i, (row, _, _) in enumerate(batch):
+                features[i] = row
+            predictions = await loop.run_in_executor(self._executor, self.predict_fn, features)
+        except Exception as e:
+            self._total_errors += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        for i, (_, future, enqueued_at) in enumerate(batch):
+            self._request_latencies.append(finished - enqueued_at)
+            if not future.done():
+                future.set_result(predictions[i])
+
+        self._batch_sizes.append(len(batch))
+        self._batch_latencies.append(finished - started)
+        self._total_batches += 1
+        self._total_rows += len(batch)
+
+    def stats(self):
+        sizes = np.asarray(self._batch_sizes, dtype=np.float64)
+        batch_ms = np.asarray(self._batch_latencies, dtype=np.float64) * 1000.0
+        request_ms = np.asarray(self._request_latencies, dtype=np.float64) * 1000.0
+
+        def percentiles(values):
+            if values.size == 0:
+                return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            return {"p50": float(p50), "p90": float(p90), "p99": float(p99), "max": float(values.max())}
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending": len(self._pending),
+            "total_batches": self._total_batches,
+            "total_rows": self._total_rows,
+            "total_errors": self._total_errors,
+            "batch_size": {
+                "mean": float(sizes.mean()) if sizes.size else 0.0,
+                **percentiles(sizes),
+            },
+            "batch_latency_ms": percentiles(batch_ms),
+            "request_latency_ms": percentiles(request_ms),
+        }
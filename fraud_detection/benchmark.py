@@ -0,0 +1,611 @@
+import argparse
+import json
+import os
+import pickle
+import random
+import re
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from features import FeatureVectorizer, FEATURE_COLUMNS
+from velocity import VelocityStore, VELOCITY_FEATURES
+
+
+# Same fields as the Transaction schema in main.py (not imported, so the
+# benchmarks don't need the trained model on disk)
+class Transaction(BaseModel):
+    type: str
+    amount: float
+    oldbalanceOrg: float
+    newbalanceOrig: float
+    oldbalanceDest: float
+    newbalanceDest: float
+    nameOrig: Optional[str] = None
+    step: Optional[int] = None
+
+
+def load_encoder(path="type_encoder.pkl"):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def random_transactions(encoder, n, seed=42):
+    rng = random.Random(seed)
+    types = list(encoder.classes_)
+    return [
+        Transaction(
+            type=rng.choice(types),
+            amount=rng.uniform(0, 1e7),
+            oldbalanceOrg=rng.uniform(0, 1e7),
+            newbalanceOrig=rng.uniform(0, 1e7),
+            oldbalanceDest=rng.uniform(0, 1e7),
+            newbalanceDest=rng.uniform(0, 1e7),
+        )
+        for _ in range(n)
+    ]
+
+
+def time_per_call(fn, items, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - started)
+    return best / len(items)
+
+
+# The feature preparation process_transaction used to do for every request
+def pandas_features(transaction, encoder):
+    transaction_data = pd.DataFrame([transaction.model_dump()])
+    transaction_data['step'] = 1
+    transaction_data = transaction_data[FEATURE_COLUMNS]
+    transaction_data['type'] = encoder.transform(transaction_data['type'])
+    return transaction_data.to_numpy(dtype=np.float64)[0]
+
+
+def bench_features(args):
+    encoder = load_encoder()
+    vectorizer = FeatureVectorizer(FEATURE_COLUMNS, encoder)
+    transactions = random_transactions(encoder, args.n)
+
+    # Parity: every row must match the pandas + LabelEncoder path exactly
+    for transaction in transactions:
+        expected = pandas_features(transaction, encoder)
+        actual = vectorizer.transform(transaction)
+        if not np.array_equal(expected, actual):
+            raise AssertionError(f"Feature mismatch for {transaction}: {expected} != {actual}")
+
+    # Unknown types must be rejected by both paths
+    unknown = transactions[0].model_copy(update={"type": "CASH-IN"})
+    for fn in (lambda t: pandas_features(t, encoder), vectorizer.transform):
+        try:
+            fn(unknown)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Unknown transaction type was not rejected")
+    print(f"parity: OK ({len(transactions)} transactions)")
+
+    before = time_per_call(lambda t: pandas_features(t, encoder), transactions[:min(args.n, 2000)])
+    row = np.empty(len(FEATURE_COLUMNS), dtype=np.float64)
+    after = time_per_call(lambda t: vectorizer.transform(t, out=row), transactions)
+    print(f"pandas path:     {before * 1e6:9.2f} us/request")
+    print(f"vectorizer path: {after * 1e6:9.2f} us/request")
+    print(f"speedup:         {before / after:9.1f}x")
+
+
+def bench_alerts(args):
+    # Needs aiosmtpd (pip install aiosmtpd) for a local SMTP stand-in
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.handlers import Sink
+
+    from alerts import AlertDispatcher
+
+    class CountingSink(Sink):
+        received = 0
+
+        async def handle_DATA(self, server, session, envelope):
+            CountingSink.received += 1
+            return "250 OK"
+
+    controller = Controller(CountingSink(), hostname="127.0.0.1", port=args.port)
+    controller.start()
+    try:
+        dispatcher = AlertDispatcher(
+            host="127.0.0.1", port=args.port, use_starttls=False,
+            sender="alerts@example.com", receiver="admin@example.com",
+            digest_window=args.digest_window,
+        )
+        dispatcher.start()
+
+        # Time spent by the request path is just the enqueue
+        started = time.perf_counter()
+        for i in range(args.n):
+            dispatcher.enqueue({"type": "TRANSFER", "amount": float(i)})
+        enqueue_seconds = time.perf_counter() - started
+
+        dispatcher.stop(timeout=60)
+        total_seconds = time.perf_counter() - started
+    finally:
+        controller.stop()
+
+    metrics = dispatcher.metrics()
+    print(f"alerts:             {args.n}")
+    print(f"enqueue cost:       {enqueue_seconds / args.n * 1e6:9.2f} us/alert")
+    print(f"emails received:    {CountingSink.received}")
+    print(f"connections opened: {metrics['connections_opened']}")
+    print(f"delivered in:       {total_seconds:9.3f} s")
+    print(f"metrics:            {metrics}")
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(np.asarray(samples) * 1000.0, q)) if samples else 0.0
+
+
+def bench_storage(args):
+    import asyncio
+    import os
+    import sqlite3
+    import tempfile
+    from datetime import datetime, timezone
+
+    import storage
+
+    workdir = tempfile.mkdtemp(prefix="fraud-bench-")
+    row = ("TRANSFER", 1234.5, False, str(datetime.now(timezone.utc)))
+
+    # Baseline: what main.py used to do, one shared connection and a commit per insert
+    legacy_path = os.path.join(workdir, "legacy.db")
+    conn = sqlite3.connect(legacy_path)
+    storage.create_schema(conn)
+    started = time.perf_counter()
+    for _ in range(args.legacy_n):
+        conn.execute(storage.INSERT_SQL, row)
+        conn.commit()
+    legacy_tps = args.legacy_n / (time.perf_counter() - started)
+    conn.close()
+
+    store = storage.TransactionStore(os.path.join(workdir, "store.db"))
+    store.start()
+
+    async def writer(deadline, counts):
+        while time.perf_counter() < deadline:
+            await store.insert(row)
+            counts[0] += 1
+
+    sql, params, _ = storage.transactions_query(storage.TRANSACTION_COLUMNS, 100)
+
+    async def reader(deadline, latencies):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await store.read(storage.fetch_all, sql, params)
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.005)
+
+    async def run():
+        # Seed some history so reads have something to sort
+        await store.insert_many([row] * args.seed_rows)
+
+        idle_latencies = []
+        await reader(time.perf_counter() + 1.0, idle_latencies)
+
+        counts = [0]
+        loaded_latencies = []
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(
+            reader(deadline, loaded_latencies),
+            *[writer(deadline, counts) for _ in range(args.concurrency)],
+        )
+        return counts[0], idle_latencies, loaded_latencies
+
+    written, idle, loaded = asyncio.run(run())
+    metrics = store.metrics()
+    store.close()
+
+    print(f"legacy insert+commit:    {legacy_tps:10.0f} inserts/s")
+    print(f"store sustained inserts: {written / args.seconds:10.0f} inserts/s "
+          f"({args.concurrency} concurrent writers, {metrics['commits']} commits, "
+          f"{metrics['rows_written'] / max(metrics['commits'], 1):.1f} rows/commit)")
+    print(f"/transactions read, idle:         p50={percentile_ms(idle, 50):.2f} ms  p99={percentile_ms(idle, 99):.2f} ms")
+    print(f"/transactions read, under writes: p50={percentile_ms(loaded, 50):.2f} ms  p99={percentile_ms(loaded, 99):.2f} ms")
+
+
+# Loads one model format in a fresh interpreter and reports load time and memory
+COLD_START_SCRIPT = """
+import json, pickle, sys, time
+started = time.perf_counter()
+if sys.argv[1] == "compiled":
+    from compiled_model import CompiledForest
+    model = CompiledForest.load(sys.argv[2])
+    model.predict([[0.0] * model.n_features_in_])
+else:
+    with open(sys.argv[2], "rb") as f:
+        model = pickle.load(f)
+    model.predict([[0.0] * model.n_features_in_])
+elapsed = time.perf_counter() - started
+status = dict(line.split(":", 1) for line in open("/proc/self/status") if ":" in line)
+print(json.dumps({"seconds": elapsed, "rss_kb": int(status["VmRSS"].split()[0]),
+                  "rss_anon_kb": int(status.get("RssAnon", "0 kB").split()[0])}))
+"""
+
+
+def bench_model(args):
+    import subprocess
+    import sys
+    import warnings
+
+    from compiled_model import CompiledForest
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+    forest = CompiledForest.load(args.compiled)
+
+    rng = np.random.default_rng(42)
+    X = np.column_stack([
+        rng.integers(1, 744, args.n),
+        rng.integers(0, len(load_encoder().classes_), args.n),
+        *[rng.exponential(1e5, args.n) for _ in range(model.n_features_in_ - 2)],
+    ]).astype(np.float64)
+
+    # Parity: identical probabilities, not just identical labels
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = model.predict_proba(X)
+    if not np.array_equal(expected, forest.predict_proba(X)):
+        raise AssertionError("Compiled forest predictions differ from the sklearn model")
+    print(f"parity: OK ({args.n} rows)")
+
+    for name, source in (("sklearn", args.model), ("compiled", args.compiled)):
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_START_SCRIPT, name, source],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output)
+        print(f"{name:9s} cold start: {result['seconds'] * 1000:8.1f} ms  "
+              f"RSS {result['rss_kb'] / 1024:7.1f} MB  (private {result['rss_anon_kb'] / 1024:7.1f} MB)")
+
+    frame = pd.DataFrame(X, columns=FEATURE_COLUMNS)
+    for batch_size in (1, 64, 1024, args.n):
+        batches = max(1, min(200, args.n // batch_size))
+        for name, predict, data in (("sklearn", model.predict, frame), ("compiled", forest.predict, X)):
+            started = time.perf_counter()
+            for i in range(batches):
+                predict(data[i * batch_size:(i + 1) * batch_size])
+            elapsed = time.perf_counter() - started
+            print(f"{name:9s} batch={batch_size:<6d} {batches * batch_size / elapsed:12.0f} rows/s")
+
+
+def bench_velocity(args):
+    encoder = load_encoder()
+    rng = np.random.default_rng(42)
+    # Zipf-distributed origins: a few busy accounts, a long tail of rare ones
+    accounts = [f"C{a}" for a in rng.zipf(1.3, args.n) % args.accounts]
+    transactions = [t.model_copy(update={"nameOrig": name})
+                    for t, name in zip(random_transactions(encoder, args.n), accounts)]
+
+    # Raw store cost, on a simulated clock of args.rate transactions/second
+    store = VelocityStore(max_keys=args.max_keys)
+    out = np.empty(store.n_features, dtype=np.float64)
+    latencies = []
+    for i, transaction in enumerate(transactions):
+        started = time.perf_counter()
+        store.features(transaction, now=i / args.rate, out=out)
+        latencies.append(time.perf_counter() - started)
+    stats = store.stats()
+    print(f"store.features: p50 {percentile_ms(latencies, 50) * 1000:6.2f} us  "
+          f"p99 {percentile_ms(latencies, 99) * 1000:6.2f} us  ({args.n} transactions, "
+          f"{stats['keys']} accounts tracked, {stats['bytes_per_key']} bytes/account, "
+          f"{stats['allocated_bytes'] / 1e6:.1f} MB allocated)")
+    print(f"evictions: {stats['evicted_idle']} idle, {stats['evicted_full']} at max_keys={args.max_keys}")
+
+    # What the velocity columns add to building one request's feature row
+    plain = FeatureVectorizer(FEATURE_COLUMNS, encoder)
+    with_velocity = FeatureVectorizer(FEATURE_COLUMNS + VELOCITY_FEATURES, encoder,
+                                      velocity=VelocityStore(max_keys=args.max_keys))
+    before = time_per_call(plain.transform, transactions)
+    after = time_per_call(with_velocity.transform, transactions)
+    added = (after - before) * 1e6
+    print(f"feature row without velocity: {before * 1e6:7.2f} us/request")
+    print(f"feature row with velocity:    {after * 1e6:7.2f} us/request (+{added:.2f} us, "
+          f"{'within' if added <= args.budget_us else 'OVER'} the {args.budget_us:.0f} us budget)")
+
+
+# Resident and proportional set size (PSS splits shared pages between the
+# processes mapping them) of a process and all its descendants, in kB
+def process_tree_memory(pid):
+    pids = [pid]
+    rss = pss = 0
+    while pids:
+        current = pids.pop()
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+            with open(f"/proc/{current}/smaps_rollup") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line and not line.startswith(("0", "7")))
+        except FileNotFoundError:
+            continue
+        rss += int(fields["Rss"].split()[0])
+        pss += int(fields["Pss"].split()[0])
+    return rss, pss
+
+
+# One keep-alive connection replaying POST /transaction bodies with a raw
+# HTTP/1.1 client, so the load generator costs as little CPU as possible
+async def replay_client(host, port, bodies, deadline, latencies, errors):
+    import asyncio
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            body = next(bodies)
+            started = time.perf_counter()
+            writer.write(b"POST /transaction HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (host.encode(), len(body), body))
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(re.search(rb"(?i)content-length:\s*(\d+)", head).group(1))
+            response = await reader.readexactly(length)
+            if head.startswith(b"HTTP/1.1 200") and b'"error"' not in response:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[0] += 1
+    finally:
+        writer.close()
+
+
+# Start server.py on a free port against a throwaway database and wait
+# until it answers; returns the process, its port and the database path
+def start_fraud_server(workers):
+    import socket
+    import subprocess
+    import sys
+    import tempfile
+
+    import requests
+
+    workdir = tempfile.mkdtemp(prefix="fraud-server-bench-")
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    db = os.path.join(workdir, "transactions.db")
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--workers", str(workers), "--port", str(port), "--db", db,
+         "--socket", os.path.join(workdir, "writer.sock")],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(600):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/batch-stats", timeout=5)
+            return server, port, db
+        except requests.RequestException:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+async def replay_load(port, bodies, seconds, concurrency):
+    import asyncio
+    import itertools
+
+    latencies, errors = [], [0]
+    cycle = itertools.cycle(bodies)
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*[replay_client("127.0.0.1", port, cycle, deadline, latencies, errors)
+                           for _ in range(concurrency)])
+    return latencies, errors[0]
+
+
+def bench_server(args):
+    import asyncio
+    import sqlite3
+
+    encoder = load_encoder()
+    transactions = random_transactions(encoder, 5000, seed=7)
+    bodies = [t.model_copy(update={"nameOrig": f"C{i % 500}"}).model_dump_json().encode() for i, t in
+              enumerate(transactions)]
+    worker_counts = args.workers or list(range(1, (os.cpu_count() or 1) + 1))
+
+    print(f"{'workers':>7s} {'req/s':>9s} {'p50 ms':>8s} {'p99 ms':>8s} {'errors':>7s} {'persisted':>13s} "
+          f"{'RSS MB':>8s} {'PSS MB':>8s}")
+    for workers in worker_counts:
+        server, port, db = start_fraud_server(workers)
+        try:
+            # Let every worker finish starting before measuring
+            time.sleep(1.0 + 0.5 * workers)
+
+            warmup, _ = asyncio.run(replay_load(port, bodies, 1.0, args.concurrency))
+            latencies, errors = asyncio.run(replay_load(port, bodies, args.seconds, args.concurrency))
+            rss, pss = process_tree_memory(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+        # Every acknowledged transaction must have reached the database
+        persisted = sqlite3.connect(db).execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        acknowledged = len(warmup) + len(latencies)
+        print(f"{workers:7d} {len(latencies) / args.seconds:9.0f} {percentile_ms(latencies, 50):8.2f} "
+              f"{percentile_ms(latencies, 99):8.2f} {errors:7d} {f'{persisted}/{acknowledged}':>13s} "
+              f"{rss / 1024:8.1f} {pss / 1024:8.1f}")
+
+
+
+# Mean time per stage from a /metrics scrape, in ms
+def stage_means(text):
+    sums, counts = {}, {}
+    for match in re.finditer(r'stage_duration_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)', text):
+        kind, stage, value = match.groups()
+        (sums if kind == "sum" else counts)[stage] = float(value)
+    return {stage: (sums[stage] / counts[stage] * 1000.0, int(counts[stage])) for stage in sums if counts[stage]}
+
+
+# Cost of the timing layer itself, then req/s against a one-worker
+# server.py with the sampling profiler off and on, in alternating rounds
+# so drift affects both the same way
+def bench_metrics(args):
+    import asyncio
+    import statistics
+
+    import requests
+
+    import metrics
+
+    histogram = metrics.Histogram()
+    per_observe = time_per_call(histogram.observe, [0.001] * 100000)
+
+    def timed_block(_):
+        with metrics.stage("bench"):
+            pass
+    per_stage = time_per_call(timed_block, range(100000))
+    print(f"Histogram.observe: {per_observe * 1e9:.0f} ns, with metrics.stage(): {per_stage * 1e9:.0f} ns")
+
+    encoder = load_encoder()
+    bodies = [t.model_dump_json().encode() for t in random_transactions(encoder, 5000, seed=11)]
+    server, port, _ = start_fraud_server(1)
+    base_url = f"http://127.0.0.1:{port}"
+    rates = {False: [], True: []}
+    try:
+        time.sleep(1.5)
+        asyncio.run(replay_load(port, bodies, 1.0, args.concurrency))
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                requests.post(f"{base_url}/debug/profiler", params={"enabled": enabled})
+                latencies, errors = asyncio.run(replay_load(port, bodies, args.seconds, args.concurrency))
+                rates[enabled].append(len(latencies) / args.seconds)
+        profiler_stats = requests.post(f"{base_url}/debug/profiler", params={"enabled": False}).json()
+        stages = stage_means(requests.get(f"{base_url}/metrics").text)
+    finally:
+        server.terminate()
+        server.wait()
+
+    off, on = statistics.median(rates[False]), statistics.median(rates[True])
+    print(f"profiler off: {off:.0f} req/s, on: {on:.0f} req/s (median of {args.rounds} rounds), "
+          f"throughput change {100.0 * (on - off) / off:+.2f}%, "
+          f"sampler's own share of wall time {100.0 * profiler_stats['overhead']:.2f}% "
+          f"({profiler_stats['samples']} samples)")
+    for stage, (mean_ms, count) in sorted(stages.items()):
+        print(f"  {stage:12s} mean {mean_ms:8.3f} ms  ({count} observations)")
+
+
+
+# Dashboard refresh cost at growing table sizes: the old client-side path
+# (fetch every row, pandas to_datetime and groupby by day) against
+# storage.aggregate over the rollups, plus the error of its approximate
+# amount percentiles against exact ones
+def bench_aggregate(args):
+    import sqlite3
+    import tempfile
+    from datetime import datetime, timedelta
+
+    import storage
+
+    rng = np.random.default_rng(3)
+    types = ["CASH_IN", "CASH_OUT", "DEBIT", "PAYMENT", "TRANSFER"]
+    newest = datetime(2025, 1, 31)
+    for n_rows in args.rows:
+        path = os.path.join(tempfile.mkdtemp(prefix="fraud-aggregate-"), "transactions.db")
+        connection = sqlite3.connect(path)
+        storage.create_schema(connection)
+        seconds = rng.uniform(0, args.days * 86400, n_rows)
+        amounts = rng.lognormal(9, 2, n_rows)
+        chosen = rng.integers(0, len(types), n_rows)
+        fraud = rng.random(n_rows) < 0.01
+        started = time.perf_counter()
+        for i in range(0, n_rows, 10000):
+            rows = [(types[chosen[j]], float(amounts[j]), bool(fraud[j]), newest - timedelta(seconds=float(seconds[j])))
+                    for j in range(i, min(i + 10000, n_rows))]
+            with connection:
+                storage.write_rows(connection, rows)
+        load_rate = n_rows / (time.perf_counter() - started)
+        connection.close()
+        reader = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+        def client_side():
+            rows = reader.execute("SELECT id, type, amount, isFraud, timestamp FROM transactions").fetchall()
+            frame = pd.DataFrame(rows, columns=storage.TRANSACTION_COLUMNS)
+            frame["timestamp"] = pd.to_datetime(frame["timestamp"])
+            frame = frame.sort_values(by="timestamp", ascending=False)
+            return frame.groupby(frame["timestamp"].dt.date)["isFraud"].sum()
+
+        legacy, _ = min((timed_once(client_side) for _ in range(3)), key=lambda r: r[0])
+        daily, result = min((timed_once(lambda: storage.aggregate(reader, "1d", args.days)) for _ in range(5)),
+                            key=lambda r: r[0])
+        hourly, _ = min((timed_once(lambda: storage.aggregate(reader, "1h", 24 * 7)) for _ in range(5)),
+                        key=lambda r: r[0])
+
+        exact = np.percentile(amounts, [50, 90, 99])
+        approx = [result["totals"]["amount_percentiles"][key] for key in ("p50", "p90", "p99")]
+        error = max(abs(a - e) / e for a, e in zip(approx, exact))
+        print(f"{n_rows:>9d} rows (written with rollups at {load_rate:.0f} rows/s): "
+              f"client-side pandas {legacy * 1000:9.1f} ms, aggregate {args.days}x1d {daily * 1000:6.2f} ms, "
+              f"168x1h {hourly * 1000:6.2f} ms, percentile error {100 * error:.1f}%")
+        reader.close()
+
+
+def timed_once(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fraud detection micro-benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    features = subparsers.add_parser("features", help="Feature vectorizer parity check and per-request cost")
+    features.add_argument("--n", type=int, default=10000)
+    features.set_defaults(func=bench_features)
+
+    alerts = subparsers.add_parser("alerts", help="Alert dispatcher against a local SMTP server")
+    alerts.add_argument("--n", type=int, default=1000)
+    alerts.add_argument("--port", type=int, default=8025)
+    alerts.add_argument("--digest-window", type=float, default=0.2)
+    alerts.set_defaults(func=bench_alerts)
+
+    storage_parser = subparsers.add_parser("storage", help="Insert throughput and read latency under write load")
+    storage_parser.add_argument("--seconds", type=float, default=5.0)
+    storage_parser.add_argument("--concurrency", type=int, default=200)
+    storage_parser.add_argument("--legacy-n", type=int, default=2000)
+    storage_parser.add_argument("--seed-rows", type=int, default=100000)
+    storage_parser.set_defaults(func=bench_storage)
+
+    model_parser = subparsers.add_parser("model", help="Compiled forest parity, cold start, RSS and rows/sec")
+    model_parser.add_argument("--model", default="fraud_model.pkl")
+    model_parser.add_argument("--compiled", default="fraud_model_arrays")
+    model_parser.add_argument("--n", type=int, default=10000)
+    model_parser.set_defaults(func=bench_model)
+
+    velocity_parser = subparsers.add_parser("velocity", help="Velocity store cost, memory and eviction")
+    velocity_parser.add_argument("--n", type=int, default=200000)
+    velocity_parser.add_argument("--accounts", type=int, default=50000)
+    velocity_parser.add_argument("--rate", type=float, default=50.0, help="Simulated transactions per second")
+    velocity_parser.add_argument("--max-keys", type=int, default=100000)
+    velocity_parser.add_argument("--budget-us", type=float, default=25.0)
+    velocity_parser.set_defaults(func=bench_velocity)
+
+    server_parser = subparsers.add_parser("server", help="Load test server.py: req/s, p50/p99 and RSS per worker count")
+    server_parser.add_argument("--workers", type=int, nargs="*", help="Worker counts to test (default: 1..cores)")
+    server_parser.add_argument("--concurrency", type=int, default=32)
+    server_parser.add_argument("--seconds", type=float, default=10.0)
+    server_parser.set_defaults(func=bench_server)
+
+    metrics_parser = subparsers.add_parser("metrics", help="Timing layer cost and sampling profiler overhead")
+    metrics_parser.add_argument("--concurrency", type=int, default=32)
+    metrics_parser.add_argument("--seconds", type=float, default=5.0)
+    metrics_parser.add_argument("--rounds", type=int, default=3)
+    metrics_parser.set_defaults(func=bench_metrics)
+
+    aggregate_parser = subparsers.add_parser("aggregate", help="Dashboard aggregation cost vs table size")
+    aggregate_parser.add_argument("--rows", type=int, nargs="*", default=[10000, 100000, 1000000])
+    aggregate_parser.add_argument("--days", type=int, default=30)
+    aggregate_parser.set_defaults(func=bench_aggregate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import time
+from collections import OrderedDict
+
+# Returned by TTLCache.get when a key is absent or expired
+MISSING = object()
+
+
+# Bounded LRU cache whose entries also expire after ttl seconds
+class TTLCache:
+    def __init__(self, maxsize=100000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.counters["misses"] += 1
+            return MISSING
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.counters["expirations"] += 1
+            self.counters["misses"] += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self.counters["invalidations"] += 1
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            **self.counters,
+        }
+
+
+# Notices when any of the given files is replaced or modified. Stats the
+# files at most once per check_interval, so it is cheap to call per request.
+class FileWatcher:
+    def __init__(self, paths, check_interval=1.0):
+        self.paths = list(paths)
+        self.check_interval = check_interval
+        self._signature = self._current_signature()
+        self._next_check = time.monotonic() + check_interval
+
+    def _current_signature(self):
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return signature
+
+    def changed(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        signature = self._current_signature()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return True
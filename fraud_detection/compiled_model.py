@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import pickle
+
+import numpy as np
+
+META_FILE = "meta.json"
+ARRAY_NAMES = ["roots", "feature", "threshold", "left", "right", "value"]
+
+
+# Flattens a fitted sklearn RandomForestClassifier into plain node arrays
+# (one .npy file each) that can be memory-mapped, so every worker process
+# shares the same pages instead of holding its own unpickled copy.
+def export_forest(model, directory):
+    os.makedirs(directory, exist_ok=True)
+
+    roots, features, thresholds, lefts, rights, values = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes, dtype=np.int64)
+        is_leaf = tree.children_left == -1
+
+        # Leaves point at themselves, which is how traversal recognises them
+        roots.append(offset)
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+        # Same normalisation DecisionTreeClassifier.predict_proba applies
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        "roots": np.asarray(roots, dtype=np.int64),
+        "feature": np.concatenate(features).astype(np.int64),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "left": np.concatenate(lefts).astype(np.int64),
+        "right": np.concatenate(rights).astype(np.int64),
+        "value": np.concatenate(values),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+
+    meta = {
+        "n_features": int(model.n_features_in_),
+        "feature_names": [str(name) for name in getattr(model, "feature_names_in_", [])],
+        "classes": [c.item() if hasattr(c, "item") else c for c in model.classes_],
+        "max_depth": int(max_depth),
+        "n_trees": len(model.estimators_),
+        "n_nodes": int(offset),
+    }
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# NumPy predictor for a forest written by export_forest. Walks every tree
+# for every row at once, one level per step, then averages the leaf
+# probabilities in tree order, exactly as RandomForestClassifier does.
+class CompiledForest:
+    def __init__(self, arrays, meta):
+        self.roots = arrays["roots"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+
+        self.n_features_in_ = meta["n_features"]
+        self.feature_names = meta["feature_names"]
+        self.classes_ = np.asarray(meta["classes"])
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in ARRAY_NAMES
+        }
+        return cls(arrays, meta)
+
+    def apply(self, X):
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n_rows, n_trees = X.shape[0], self.roots.shape[0]
+
+        # One entry per (row, tree); only entries still on an internal node
+        # are advanced, so the work shrinks as paths reach their leaves
+        nodes = np.tile(self.roots, n_rows)
+        row_of = np.repeat(np.arange(n_rows), n_trees)
+        active = np.flatnonzero(self.left[nodes] != nodes)
+        while active.size:
+            current = nodes[active]
+            go_left = X[row_of[active], self.feature[current]] <= self.threshold[current]
+            following = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = following
+            active = active[self.left[following] != following]
+        return nodes.reshape(n_rows, n_trees)
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]), dtype=np.float64)
+        for t in range(leaves.shape[1]):
+            proba += self.value[leaves[:, t]]
+        proba /= leaves.shape[1]
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a pickled RandomForestClassifier to memory-mappable arrays")
+    parser.add_argument("model", nargs="?", default="fraud_model.pkl")
+    parser.add_argument("output", nargs="?", default="fraud_model_arrays")
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+    meta = export_forest(model, args.output)
+    print(f"Exported {meta['n_trees']} trees ({meta['n_nodes']} nodes, max depth {meta['max_depth']}) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import numpy as np
+
+# Column order the model was trained with
+FEATURE_COLUMNS = [
+    'step', 'type', 'amount', 'oldbalanceOrg', 'newbalanceOrig',
+    'oldbalanceDest', 'newbalanceDest'
+]
+
+
+# Column order of a fitted model (sklearn or CompiledForest), falling back
+# to FEATURE_COLUMNS for models fitted without feature names
+def model_columns(model):
+    names = getattr(model, 'feature_names_in_', None)
+    if names is None:
+        names = getattr(model, 'feature_names', None)
+    return [str(name) for name in names] if names is not None and len(names) else list(FEATURE_COLUMNS)
+
+
+# Builds the model's feature row straight from a Transaction, without going
+# through a pandas DataFrame. Created once at startup from the training
+# column order and the fitted type encoder. Columns named after velocity
+# features are filled from the given VelocityStore, which records the
+# transaction as a side effect.
+class FeatureVectorizer:
+    def __init__(self, columns, encoder, default_step=1, velocity=None):
+        self.columns = list(columns)
+        self.n_features = len(self.columns)
+        self.default_step = float(default_step)
+
+        # LabelEncoder assigns codes by position in its sorted classes_,
+        # so a dict lookup gives exactly the same values as transform()
+        self.type_codes = {label: float(code) for code, label in enumerate(encoder.classes_)}
+
+        self.type_index = self.columns.index('type')
+        self.step_index = self.columns.index('step') if 'step' in self.columns else None
+        self.velocity = None
+        self.velocity_positions = self.velocity_take = None
+        velocity_names = velocity.feature_names if velocity is not None else []
+        used = [(i, name) for i, name in enumerate(self.columns) if name in velocity_names]
+        if used:
+            self.velocity = velocity
+            self.velocity_positions = np.asarray([i for i, _ in used])
+            self.velocity_take = np.asarray([velocity_names.index(name) for _, name in used])
+            self.velocity_row = np.empty(velocity.n_features, dtype=np.float64)
+        self.numeric_fields = [
+            (i, name) for i, name in enumerate(self.columns)
+            if name not in ('type', 'step') and name not in velocity_names
+        ]
+
+    def encode_type(self, value):
+        try:
+            return self.type_codes[value]
+        except KeyError:
+            # Same message sklearn raises for an unseen label
+            raise ValueError(f"y contains previously unseen labels: '{value}'") from None
+
+    def transform(self, transaction, out=None):
+        row = np.empty(self.n_features, dtype=np.float64) if out is None else out
+
+        row[self.type_index] = self.encode_type(transaction.type)
+        if self.step_index is not None:
+            step = getattr(transaction, 'step', None)
+            row[self.step_index] = self.default_step if step is None else step
+        for i, name in self.numeric_fields:
+            row[i] = getattr(transaction, name)
+        if self.velocity is not None:
+            velocity = self.velocity.features(transaction, out=self.velocity_row)
+            row[self.velocity_positions] = velocity[self.velocity_take]
+        return row
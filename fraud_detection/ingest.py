@@ -0,0 +1,197 @@
+import argparse
+import io
+import json
+import pickle
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_COLUMNS, model_columns
+from velocity import VelocityStore, frame_features
+import storage
+
+NUMERIC_COLUMNS = [c for c in FEATURE_COLUMNS if c not in ('step', 'type')]
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+# Map of transaction type -> encoded value, taken from the fitted LabelEncoder
+def type_codes_from_encoder(encoder):
+    return {label: code for code, label in enumerate(encoder.classes_)}
+
+
+# Encode and score one chunk of raw records with a single predict call.
+# Returns the scored rows and the number of rows that had to be dropped.
+# columns is the model's feature order; velocity columns in it come from the
+# velocity store, replayed at each row's timestamp (or now, without one).
+def score_frame(frame, model, type_codes, columns=FEATURE_COLUMNS, velocity=None):
+    frame = frame.copy()
+    if 'step' not in frame:
+        frame['step'] = 1
+    frame['step'] = pd.to_numeric(frame['step'], errors='coerce').fillna(1)
+
+    for column in NUMERIC_COLUMNS:
+        if column not in frame:
+            frame[column] = np.nan
+        frame[column] = pd.to_numeric(frame[column], errors='coerce')
+
+    raw_type = frame['type'] if 'type' in frame else pd.Series(index=frame.index, dtype=object)
+    frame['type_code'] = raw_type.map(type_codes)
+
+    # ISO 8601 timestamps, converted to UTC (those without a zone are taken
+    # as UTC already); rows without one are stamped now
+    raw_time = frame['timestamp'] if 'timestamp' in frame else pd.Series(index=frame.index, dtype=object)
+    times = pd.to_datetime(raw_time, errors='coerce', utc=True, format='ISO8601')
+
+    # Rows with an unknown type, a non-numeric field or an unreadable
+    # timestamp can't be scored
+    valid = (frame['type_code'].notna() & frame[NUMERIC_COLUMNS].notna().all(axis=1)
+             & (times.notna() | raw_time.isna()))
+    dropped = int((~valid).sum())
+    frame = frame[valid]
+    if frame.empty:
+        return frame, dropped
+
+    # Stored in the same UTC text form as the service's own timestamps, so
+    # text order is time order for pagination and rollup buckets
+    times = times[valid].fillna(pd.Timestamp(datetime.now(timezone.utc)))
+    text = np.datetime_as_string(times.dt.tz_localize(None).to_numpy(), unit='us')
+    frame['timestamp'] = np.char.add(np.char.replace(text, 'T', ' '), '+00:00')
+
+    velocity_columns = {}
+    if velocity is not None and any(column in velocity.feature_names for column in columns):
+        velocity_columns = frame_features(frame, velocity, times.astype('int64').to_numpy() / 1e9)
+    features = pd.DataFrame({
+        column: frame['type_code'] if column == 'type'
+        else velocity_columns[column] if column in velocity_columns else frame[column]
+        for column in columns
+    }).astype(np.float64)
+    frame['isFraud'] = model.predict(features).astype(bool)
+    return frame, dropped
+
+
+# Database rows for a scored chunk, in storage.write_rows order
+def frame_rows(frame):
+    return list(zip(
+        frame['type'].astype(str).tolist(),
+        frame['amount'].tolist(),
+        frame['isFraud'].tolist(),
+        frame['timestamp'].tolist(),
+    ))
+
+
+# Write a scored chunk with one executemany inside a single transaction
+def write_frame(conn, frame):
+    with conn:
+        storage.write_rows(conn, frame_rows(frame))
+
+
+def iter_csv_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    yield from pd.read_csv(source, chunksize=chunk_size, dtype={'type': str, 'timestamp': str})
+
+
+def iter_ndjson_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    records = []
+    for line in source:
+        line = line.strip()
+        if not line:
+            continue
+        records.append(json.loads(line))
+        if len(records) >= chunk_size:
+            yield pd.DataFrame.from_records(records)
+            records = []
+    if records:
+        yield pd.DataFrame.from_records(records)
+
+
+# Same as the iterators above, but fed from an async byte stream such as an
+# HTTP request body. Only one chunk of lines is held in memory at a time.
+async def aiter_stream_chunks(byte_stream, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    header = None
+    lines = []
+    remainder = b""
+
+    def to_frame(chunk_lines):
+        if fmt == "csv":
+            return pd.read_csv(io.StringIO("\n".join([header] + chunk_lines)), dtype={'type': str, 'timestamp': str})
+        return pd.DataFrame.from_records([json.loads(line) for line in chunk_lines])
+
+    async for data in byte_stream:
+        remainder += data
+        *complete, remainder = remainder.split(b"\n")
+        for raw in complete:
+            line = raw.decode("utf-8").strip()
+            if not line:
+                continue
+            if fmt == "csv" and header is None:
+                header = line
+                continue
+            lines.append(line)
+            if len(lines) >= chunk_size:
+                yield to_frame(lines)
+                lines = []
+
+    line = remainder.decode("utf-8").strip()
+    if line and not (fmt == "csv" and header is None):
+        lines.append(line)
+    if lines:
+        yield to_frame(lines)
+
+
+def detect_format(path, content_type=None):
+    if content_type:
+        return "csv" if "csv" in content_type else "ndjson"
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score historical transactions in bulk")
+    parser.add_argument("input", help="CSV or NDJSON file, or '-' for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Input format (default: from file extension)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--db", default="transactions.db")
+    parser.add_argument("--model", default="fraud_model.pkl")
+    parser.add_argument("--encoder", default="type_encoder.pkl")
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+    with open(args.encoder, "rb") as f:
+        encoder = pickle.load(f)
+    type_codes = type_codes_from_encoder(encoder)
+    columns = model_columns(model)
+    velocity = VelocityStore()
+
+    fmt = args.format or detect_format(args.input)
+    source = sys.stdin if args.input == "-" else open(args.input, "r", newline="")
+    chunks = iter_csv_chunks(source, args.chunk_size) if fmt == "csv" else iter_ndjson_chunks(source, args.chunk_size)
+
+    conn = sqlite3.connect(args.db)
+    storage.create_schema(conn)
+    started = time.perf_counter()
+    scored = fraudulent = dropped = 0
+    try:
+        for chunk in chunks:
+            frame, chunk_dropped = score_frame(chunk, model, type_codes, columns, velocity)
+            if not frame.empty:
+                write_frame(conn, frame)
+            scored += len(frame)
+            fraudulent += int(frame['isFraud'].sum()) if not frame.empty else 0
+            dropped += chunk_dropped
+            elapsed = time.perf_counter() - started
+            print(f"scored={scored} fraudulent={fraudulent} dropped={dropped} rows/s={scored / elapsed:.0f}", file=sys.stderr)
+    finally:
+        conn.close()
+        if source is not sys.stdin:
+            source.close()
+
+    print(json.dumps({"scored": scored, "fraudulent": fraudulent, "dropped": dropped,
+                      "seconds": round(time.perf_counter() - started, 3)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,160 @@
 from dotenv import load_dotenv
 import os
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from datetime import datetime, timezone
+from typing import Optional
+from contextlib import asynccontextmanager
 import pickle
+import hashlib
+import io
+import json
 import pandas as pd
-import sqlite3
+import pyarrow as pa
+import asyncio
+import logging
+import time
+from batching import MicroBatcher
+from features import FeatureVectorizer, model_columns
+from velocity import VelocityStore
+from compiled_model import META_FILE, CompiledForest
+from cache import TTLCache, FileWatcher, MISSING
+from alerts import AlertDispatcher
+from storage import TransactionStore, RemoteTransactionStore
+import storage
+import ingest
+import metrics
 
 load_dotenv()
 
-app = FastAPI()
+# Errors and reloads are logged; LOG_LEVEL=DEBUG for more
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger("fraud")
+
+@asynccontextmanager
+async def lifespan(app):
+    store.start()
+    alert_dispatcher.start()
+    if metrics.PROFILE_ON_START:
+        metrics.profiler.start()
+    yield
+    metrics.profiler.stop()
+    alert_dispatcher.stop()
+    store.close()
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-route request latency, and the start time the validate stage is measured from
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Load the trained model. If the array export from train_model.py /
+# compiled_model.py is present, use it: it loads in milliseconds and its
+# memory-mapped pages are shared by every worker process.
+compiled_model_dir = os.getenv("FRAUD_COMPILED_MODEL", "fraud_model_arrays")
+
+# An export older than fraud_model.pkl is stale (the pickle was replaced
+# since), so the pickle is loaded instead until server.py or
+# compiled_model.py exports it again; exporting here would race between
+# workers reloading at the same time.
+def compiled_model_current():
+    meta_path = os.path.join(compiled_model_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    return (not os.path.exists("fraud_model.pkl")
+            or os.path.getmtime(meta_path) >= os.path.getmtime("fraud_model.pkl"))
+
+def load_artifacts():
+    if compiled_model_current():
+        loaded_model = CompiledForest.load(compiled_model_dir)
+    else:
+        if os.path.isdir(compiled_model_dir):
+            logger.warning("%s is older than fraud_model.pkl, loading the pickle", compiled_model_dir)
+        with open("fraud_model.pkl", "rb") as f:
+            loaded_model = pickle.load(f)
+
+    with open("type_encoder.pkl", "rb") as f:
+        loaded_encoder = pickle.load(f)
+    return loaded_model, loaded_encoder
+
+model, encoder = load_artifacts()
+
+# Columns in the order used during training
+expected_columns = model_columns(model)
+
+# Per-account transaction velocity, kept in memory. Models trained with
+# velocity columns (see velocity.py) get them filled in from here.
+velocity_store = VelocityStore(
+    bucket_seconds=int(os.getenv("FRAUD_VELOCITY_BUCKET_SECONDS", "60")),
+    max_keys=int(os.getenv("FRAUD_VELOCITY_MAX_KEYS", "100000")),
+)
 
-# Load the trained model
-with open("fraud_model.pkl", "rb") as f:
-    model = pickle.load(f)
+# Precompiled feature builder (replaces the per-request DataFrame round-trip)
+vectorizer = FeatureVectorizer(expected_columns, encoder, velocity=velocity_store)
 
-with open("type_encoder.pkl", "rb") as f:
-    encoder = pickle.load(f)
+# Replayed payloads with identical features reuse the earlier prediction
+prediction_cache = TTLCache(
+    maxsize=int(os.getenv("FRAUD_PREDICTION_CACHE_SIZE", "100000")),
+    ttl=float(os.getenv("FRAUD_PREDICTION_CACHE_TTL", "300")),
+)
 
-# Connect to the SQLite database
-conn = sqlite3.connect("transactions.db", check_same_thread=False)
-cursor = conn.cursor()
+# Responses by Idempotency-Key header, so retried requests aren't stored twice
+idempotency_cache = TTLCache(
+    maxsize=int(os.getenv("FRAUD_IDEMPOTENCY_CACHE_SIZE", "100000")),
+    ttl=float(os.getenv("FRAUD_IDEMPOTENCY_TTL", "86400")),
+)
 
-# Create transactions table if not exists
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS transactions (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    type TEXT,
-    amount REAL,
-    isFraud BOOLEAN,
-    timestamp TEXT
+# Cached predictions are only valid for the artifacts that produced them
+model_watcher = FileWatcher([
+    "fraud_model.pkl",
+    "type_encoder.pkl",
+    os.path.join(compiled_model_dir, "meta.json"),
+])
+
+# Unpickling runs on a worker thread so requests keep being served with
+# the old model meanwhile; if loading fails the old model stays in place
+async def reload_artifacts_if_changed():
+    global model, encoder, vectorizer, expected_columns
+    if model_watcher.changed():
+        logger.info("Model artifacts changed on disk, reloading and clearing prediction cache")
+        try:
+            loaded_model, loaded_encoder = await asyncio.get_running_loop().run_in_executor(None, load_artifacts)
+        except Exception:
+            logger.exception("Error reloading model artifacts, keeping the current ones")
+            return
+        model, encoder = loaded_model, loaded_encoder
+        expected_columns = model_columns(model)
+        vectorizer = FeatureVectorizer(expected_columns, encoder, velocity=velocity_store)
+        batcher.n_features = len(expected_columns)
+        prediction_cache.clear()
+
+# Score a whole batch of feature rows with a single model call
+def predict_batch(features):
+    if isinstance(model, CompiledForest):
+        return model.predict(features)
+    # Keep the training feature names so sklearn doesn't warn on every batch
+    return model.predict(pd.DataFrame(features, columns=expected_columns))
+
+# Micro-batching scheduler shared by all concurrent requests
+batcher = MicroBatcher(
+    predict_batch,
+    n_features=len(expected_columns),
+    max_batch_size=int(os.getenv("FRAUD_BATCH_MAX_SIZE", "64")),
+    max_wait_ms=float(os.getenv("FRAUD_BATCH_MAX_WAIT_MS", "2")),
 )
-""")
+
+# Fraud alerts are sent from a background queue, never from the request path
+alert_dispatcher = AlertDispatcher.from_env()
+
+# SQLite persistence: one group-committing writer thread plus read-only
+# readers. Under server.py, FRAUD_WRITER_SOCKET is set and writes go to the
+# deployment's single writer process instead.
+database_path = os.getenv("FRAUD_DB", "transactions.db")
+writer_socket = os.getenv("FRAUD_WRITER_SOCKET")
+if writer_socket:
+    store = RemoteTransactionStore(database_path, writer_socket)
+else:
+    store = TransactionStore(database_path)
 
 # Pydantic schema for incoming transaction data
 class Transaction(BaseModel):
@@ -44,134 +164,291 @@ class Transaction(BaseModel):
     newbalanceOrig: float
     oldbalanceDest: float
     newbalanceDest: float
+    # Optional: the origin account keys the velocity features, and step is
+    # passed to the model instead of the default of 1
+    nameOrig: Optional[str] = None
+    step: Optional[int] = None
 
 @app.post("/transaction")
-async def process_transaction(transaction: Transaction):
-    print("Received transaction data:")
-    print(transaction.dict())
-
-    # Convert transaction data into a DataFrame
-    transaction_data = pd.DataFrame([transaction.dict()])
-
-    # Log the columns to verify if they match the model's expected columns
-    print("Input Columns:", transaction_data.columns)
-
-    # Align the column names with those used during training
-    expected_columns = [
-        'step', 'type', 'amount', 'oldbalanceOrg', 'newbalanceOrig',
-        'oldbalanceDest', 'newbalanceDest'
-    ]
-
-    # Add a 'step' column (can be incremented or set to a placeholder value for testing)
-    transaction_data['step'] = 1  # Placeholder, set to 1 for now; you can modify this if needed
-
-    # Ensure the column names match the model's expected columns
+async def process_transaction(transaction: Transaction, idempotency_key: Optional[str] = Header(None)):
+    # A retry with the same Idempotency-Key gets the original response (or
+    # waits for it if the original is still in flight) and isn't stored again
+    if idempotency_key:
+        pending = idempotency_cache.get(idempotency_key)
+        if pending is not MISSING:
+            return await asyncio.shield(pending)
+        pending = asyncio.get_running_loop().create_future()
+        idempotency_cache.put(idempotency_key, pending)
+        try:
+            response = await score_transaction(transaction)
+        except BaseException as e:
+            idempotency_cache.pop(idempotency_key)
+            pending.set_exception(e)
+            # Often nobody else is waiting; mark it retrieved so asyncio
+            # doesn't log "Future exception was never retrieved"
+            pending.exception()
+            raise
+        if "error" in response:
+            # Failed attempts may be retried for real
+            idempotency_cache.pop(idempotency_key)
+        pending.set_result(response)
+        return response
+
+    return await score_transaction(transaction)
+
+async def score_transaction(transaction):
+    metrics.validated()
+    await reload_artifacts_if_changed()
+
+    # Build the model's feature row directly, in training column order
     try:
-        transaction_data = transaction_data[expected_columns]
-    except KeyError as e:
-        print(f"Column mismatch error: {e}")
-        return {"error": f"Column mismatch error: {e}"}
-
-    # Log the final columns after alignment
-    print("Aligned Columns:", transaction_data.columns)
-
-    # Apply LabelEncoding to the 'type' column, using the encoder loaded from disk
-    try:
-        transaction_data['type'] = encoder.transform(transaction_data['type'])
+        with metrics.stage("featurize"):
+            features = vectorizer.transform(transaction)
     except Exception as e:
-        print(f"Error encoding 'type' column: {e}")
+        logger.warning("Error encoding 'type' column: %s", e)
+        metrics.count_error("featurize")
         return {"error": f"Error encoding 'type' column: {e}"}
 
-    # Log the transformed data
-    print("Transformed Transaction Data:", transaction_data)
-
-    # Predict fraud status
-    try:
-        is_fraud = model.predict(transaction_data)[0]
-    except Exception as e:
-        print(f"Error during prediction: {e}")
-        return {"error": f"Error during prediction: {e}"}
+    # Predict fraud status (scored together with other in-flight requests),
+    # unless the same features were scored recently
+    cache_key = features.tobytes()
+    is_fraud = prediction_cache.get(cache_key)
+    if is_fraud is MISSING:
+        try:
+            # Includes the wait for the micro-batch to fill
+            with metrics.stage("predict"):
+                is_fraud = await batcher.submit(features)
+        except Exception as e:
+            logger.exception("Error during prediction")
+            metrics.count_error("predict")
+            return {"error": f"Error during prediction: {e}"}
+        prediction_cache.put(cache_key, is_fraud)
 
     # Insert transaction into the database
     try:
-        cursor.execute("""
-        INSERT INTO transactions (type, amount, isFraud, timestamp)
-        VALUES (?, ?, ?, ?)
-        """, (transaction.type, transaction.amount, bool(is_fraud), datetime.now()))
-        conn.commit()
+        # Includes the wait for the group commit
+        with metrics.stage("persist"):
+            await store.insert((transaction.type, transaction.amount, bool(is_fraud), datetime.now(timezone.utc)))
     except Exception as e:
-        print(f"Error inserting into database: {e}")
+        logger.exception("Error inserting into database")
+        metrics.count_error("persist")
         return {"error": f"Error inserting into database: {e}"}
 
-    # If fraud, send an email
+    # If fraud, queue an alert email for the admin
     if is_fraud:
-        send_email_to_admin(transaction)
+        alert_dispatcher.enqueue({"type": transaction.type, "amount": transaction.amount})
 
     return {"message": "Transaction processed", "isFraud": bool(is_fraud)}
 
-# Function to send an email to the admin if fraud is detected
-def send_email_to_admin(transaction):
+@app.post("/transactions/batch")
+async def process_transaction_batch(request: Request, chunk_size: int = ingest.DEFAULT_CHUNK_SIZE):
+    # Stream an NDJSON or CSV body and score it chunk by chunk, so memory
+    # stays flat no matter how large the upload is
+    fmt = ingest.detect_format("", request.headers.get("content-type", "application/x-ndjson"))
+    type_codes = ingest.type_codes_from_encoder(encoder)
+    loop = asyncio.get_running_loop()
+    # Uploads are usually backfills or replays, so they get velocity state of
+    # their own instead of counting towards (and evicting) live accounts
+    batch_velocity = VelocityStore(velocity_store.windows, velocity_store.bucket_seconds,
+                                   velocity_store.max_keys, velocity_store.idle_seconds, initial_capacity=64)
+
+    def score(chunk):
+        frame, dropped = ingest.score_frame(chunk, model, type_codes, expected_columns, batch_velocity)
+        if frame.empty:
+            return [], 0, dropped
+        return ingest.frame_rows(frame), int(frame['isFraud'].sum()), dropped
+
+    started = time.perf_counter()
+    scored = fraudulent = dropped = chunks = 0
     try:
-        # Setup email content
-        sender_email = "your_email@example.com"
-        receiver_email = "admin_email@example.com"
-        subject = "Fraudulent Transaction Alert"
-        body = f"A fraudulent transaction has been detected:\n\n{transaction.dict()}"
-
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = receiver_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-
-        # Setup email server (you can use Gmail or any SMTP server)
-        server = smtplib.SMTP('smtp.example.com', 587)  # Adjust SMTP server and port
-        server.starttls()
-        server.login(sender_email, 'your_email_password')
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
-        server.quit()
-        print("Fraud alert email sent successfully.")
+        async for chunk in ingest.aiter_stream_chunks(request.stream(), fmt, chunk_size):
+            rows, chunk_fraudulent, chunk_dropped = await loop.run_in_executor(
+                None, metrics.timed_call, "batch-score", score, chunk)
+            if rows:
+                with metrics.stage("persist"):
+                    await store.insert_many(rows)
+            scored += len(rows)
+            fraudulent += chunk_fraudulent
+            dropped += chunk_dropped
+            chunks += 1
     except Exception as e:
-        print(f"Error sending email: {e}")
+        logger.warning("Error processing batch after %d rows: %s", scored, e)
+        metrics.count_error("batch")
+        raise HTTPException(status_code=400, detail=f"Error processing batch after {scored} rows: {e}")
+
+    return {
+        "scored": scored,
+        "fraudulent": fraudulent,
+        "dropped": dropped,
+        "chunks": chunks,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+@app.get("/batch-stats")
+async def get_batch_stats():
+    # Batch size and latency distribution, used to tune the batching window
+    return batcher.stats()
+
+
+@app.get("/alerts/stats")
+async def get_alert_stats():
+    # Alert queue depth and delivery counters
+    return alert_dispatcher.metrics()
+
+
+@app.get("/velocity/stats")
+async def get_velocity_stats():
+    # Tracked accounts, memory and eviction counters of the velocity store
+    return velocity_store.stats()
+
+
+@app.get("/storage/stats")
+async def get_storage_stats():
+    # Writer queue depth and group-commit counters
+    return store.metrics()
+
+
+# The /stats endpoints above, also exported as gauges on /metrics
+metrics.registry.add_collector("batch", lambda: batcher.stats())
+metrics.registry.add_collector("alerts", lambda: alert_dispatcher.metrics())
+metrics.registry.add_collector("velocity", lambda: velocity_store.stats())
+metrics.registry.add_collector("storage", lambda: store.metrics())
+metrics.registry.add_collector("cache", lambda: {
+    "predictions": prediction_cache.stats(),
+    "idempotency": idempotency_cache.stats(),
+})
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text format: stage and request latency histograms
+    # (validate, featurize, predict, persist, alert, db-query), error
+    # counters and the gauges above. Per worker under server.py.
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/debug/profiler")
+async def toggle_profiler(enabled: bool, clear: bool = False):
+    # Start or stop the sampling profiler; clear drops the samples so far
+    if clear:
+        metrics.profiler.clear()
+    if enabled:
+        metrics.profiler.start()
+    else:
+        metrics.profiler.stop()
+    return metrics.profiler.stats()
+
+
+@app.get("/debug/profiler", response_class=PlainTextResponse)
+async def get_profile():
+    # Sampled stacks in folded format (flamegraph.pl, speedscope)
+    return metrics.profiler.folded()
+
+
+# Arrow types for each projectable transactions column
+ARROW_TYPES = {
+    "id": pa.int64(),
+    "type": pa.string(),
+    "amount": pa.float64(),
+    "isFraud": pa.bool_(),
+    "timestamp": pa.string(),
+}
+
+
+async def ndjson_stream(batches, columns):
+    async for rows in batches:
+        yield "".join(json.dumps(dict(zip(columns, t))) + "\n" for t in rows).encode("utf-8")
+
+
+async def arrow_stream(batches, columns):
+    schema = pa.schema([(c, ARROW_TYPES[c]) for c in columns])
+    buffer = io.BytesIO()
+    writer = pa.ipc.new_stream(buffer, schema)
+    async for rows in batches:
+        arrays = []
+        for i, column in enumerate(columns):
+            values = [t[i] for t in rows]
+            if column == "isFraud":
+                values = [None if v is None else bool(v) for v in values]
+            arrays.append(pa.array(values, type=ARROW_TYPES[column]))
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+        # Hand each encoded batch to the client as soon as it's ready
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    writer.close()
+    yield buffer.getvalue()
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    # Hit/miss/eviction counters for the prediction and idempotency caches
+    return {
+        "predictions": prediction_cache.stats(),
+        "idempotency": idempotency_cache.stats(),
+    }
 
 
 @app.get("/transactions")
-async def get_transactions(limit: int = 100):
+async def get_transactions(
+    limit: int = Query(100, ge=1),
+    after_id: Optional[int] = None,
+    before_timestamp: Optional[str] = None,
+    before_id: Optional[int] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    columns: Optional[str] = None,
+    format: str = "json",
+):
+    # Keyset pagination: pass after_id to walk forward by id, or
+    # before_timestamp/before_id (from the last row of the previous page)
+    # to walk back from the newest transaction. columns is a comma separated
+    # projection; format=ndjson or format=arrow streams the page from a
+    # server-side cursor instead of building it in memory. start and end
+    # are ISO 8601 times (UTC unless they carry an offset).
+    selected = [c.strip() for c in columns.split(",") if c.strip()] if columns else list(storage.TRANSACTION_COLUMNS)
+    try:
+        sql, params, row_columns = storage.transactions_query(
+            selected, limit, after_id=after_id, before_timestamp=before_timestamp,
+            before_id=before_id, start=start, end=end,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson":
+        return StreamingResponse(ndjson_stream(store.stream(sql, params), selected), media_type="application/x-ndjson")
+    if format == "arrow":
+        return StreamingResponse(arrow_stream(store.stream(sql, params), selected), media_type="application/vnd.apache.arrow.stream")
+    if format != "json":
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+
     try:
-        # Modify SQL query to accept dynamic limits
-        cursor.execute(f"SELECT * FROM transactions ORDER BY timestamp DESC LIMIT {limit}")
-        transactions = cursor.fetchall()
+        transactions = await store.read(storage.fetch_all, sql, params)
 
         # Convert the transactions to a list of dictionaries
-        transactions_list = [
-            {
-                "id": t[0],
-                "type": t[1],
-                "amount": t[2],
-                "isFraud": t[3],
-                "timestamp": t[4],
-                # Add any other fields here as needed, e.g., 'step'
-            }
-            for t in transactions
-        ]
-        return transactions_list
-    except Exception as e:
-        print(f"Error retrieving transactions: {e}")
+        transactions_list = [dict(zip(selected, t)) for t in transactions]
+
+        # Cursor for the next page, so clients don't need to project id/timestamp
+        headers = {}
+        if transactions:
+            last = dict(zip(row_columns, transactions[-1]))
+            if after_id is not None:
+                headers["X-Next-After-Id"] = str(last["id"])
+            else:
+                headers["X-Next-Before-Timestamp"] = str(last["timestamp"])
+                headers["X-Next-Before-Id"] = str(last["id"])
+        return JSONResponse(transactions_list, headers=headers)
+    except Exception:
+        logger.exception("Error retrieving transactions")
+        metrics.count_error("db-query")
         return {"error": "Failed to fetch transactions"}
 
 
 @app.get("/dashboard-data")
 async def get_dashboard_data():
     try:
-        cursor.execute("""
-        SELECT 
-            COUNT(*) AS total_transactions,
-            SUM(CASE WHEN isFraud = 1 THEN 1 ELSE 0 END) AS fraudulent_transactions,
-            SUM(amount) AS total_amount
-        FROM transactions
-        """)
-        result = cursor.fetchone()
+        result = await store.read(storage.dashboard_totals)
 
         # If no result found, return defaults
         if result is None:
@@ -181,42 +458,88 @@ async def get_dashboard_data():
                 "total_amount": 0
             }
 
+        by_type = await store.read(storage.totals_by_type)
+
         return {
             "total_transactions": result[0],
             "fraudulent_transactions": result[1],
             "total_amount": result[2],  # Include total amount
+            "by_type": {
+                t[0]: {
+                    "total_transactions": t[1],
+                    "fraudulent_transactions": t[2],
+                    "total_amount": t[3],
+                }
+                for t in by_type
+            },
         }
     
-    except Exception as e:
-        print(f"Error retrieving dashboard data: {e}")
+    except Exception:
+        logger.exception("Error retrieving dashboard data")
+        metrics.count_error("db-query")
         return {"error": "Failed to fetch dashboard data"}
 
 
-def send_email_to_admin(transaction):
-    sender_email = os.getenv("EMAIL_USER")
-    password = os.getenv("EMAIL_PASSWORD")
-    receiver_email = os.getenv("EMAIL_RECEIVER")
+@app.get("/dashboard-data/version")
+async def get_data_version():
+    # Changes whenever a transaction is stored; dashboards key their caches on it
+    return {"version": await store.read(storage.data_version)}
+
 
-    subject = "Fraud Alert: Transaction Detected"
-    body = f"""
-    A fraudulent transaction has been detected:
-    Type: {transaction.type}
-    Amount: {transaction.amount}
-    """
+def aggregate_etag(version, query):
+    return f'"{version}-{hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]}"'
 
-    # Create email message
-    msg = MIMEMultipart()
-    msg["From"] = sender_email
-    msg["To"] = receiver_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
 
-    # Send email
+@app.get("/dashboard-data/aggregate")
+async def get_dashboard_aggregate(
+    bucket: str = "1h",
+    buckets: int = Query(48, ge=1, le=storage.MAX_BUCKETS),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    type: Optional[str] = None,
+    percentiles: str = "50,90,99",
+    if_none_match: Optional[str] = Header(None),
+):
+    # Time-bucketed counts, fraud rate, per-type breakdown and amount
+    # percentiles, computed from the rollups (see storage.aggregate). The
+    # ETag is the data version plus the query, so an unchanged dashboard
+    # revalidates without recomputing anything.
     try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, password)
-            server.sendmail(sender_email, receiver_email, msg.as_string())
-            print("Email sent to admin.")
-    except Exception as e:
-        print(f"Failed to send email: {e}")
+        quantiles = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid percentiles: {percentiles}")
+    if any(not 0 <= p <= 100 for p in quantiles):
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+
+    query = f"{bucket}|{buckets}|{start}|{end}|{type}|{percentiles}"
+    if if_none_match:
+        etag = aggregate_etag(await store.read(storage.data_version), query)
+        if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": etag})
+
+    try:
+        result = await store.read(storage.aggregate, bucket, buckets, start, end, type, quantiles)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(result, headers={"ETag": aggregate_etag(result["version"], query)})
+
+
+@app.get("/dashboard-data/trends")
+async def get_dashboard_trends(days: int = 30):
+    # Per-day counts straight from the daily rollup, most recent day first
+    try:
+        trends = await store.read(storage.daily_trends, days)
+        return [
+            {
+                "date": t[0],
+                "total_transactions": t[1],
+                "fraudulent_transactions": t[2],
+                "total_amount": t[3],
+            }
+            for t in trends
+        ]
+    except Exception:
+        logger.exception("Error retrieving dashboard trends")
+        metrics.count_error("db-query")
+        return {"error": "Failed to fetch dashboard trends"}
+
@@ -0,0 +1,143 @@
+import argparse
+import gc
+import multiprocessing
+import os
+import pickle
+import signal
+import socket
+import tempfile
+import time
+
+import uvicorn
+
+from compiled_model import ARRAY_NAMES, META_FILE, CompiledForest, export_forest
+import storage
+
+
+# Makes sure the memory-mappable export of the model exists and is not
+# older than the pickle, then reads it once so the workers start against a
+# warm page cache. Every worker maps the same files, so the model's pages
+# are in memory once however many workers there are.
+def prepare_model(pickle_path, compiled_dir):
+    meta_path = os.path.join(compiled_dir, META_FILE)
+    if os.path.exists(pickle_path) and (
+            not os.path.exists(meta_path) or os.path.getmtime(meta_path) < os.path.getmtime(pickle_path)):
+        print(f"Exporting {pickle_path} to {compiled_dir} for shared loading")
+        with open(pickle_path, "rb") as f:
+            export_forest(pickle.load(f), compiled_dir)
+
+    forest = CompiledForest.load(compiled_dir)
+    size = 0
+    for name in ARRAY_NAMES:
+        array = getattr(forest, name)
+        array.sum()
+        size += array.nbytes
+    return size
+
+
+# Runs one uvicorn server on the shared listening socket in a forked child
+def fork_worker(app, sock, log_level):
+    pid = os.fork()
+    if pid:
+        return pid
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[sock])
+    finally:
+        # Skip the parent's atexit handlers, which would wait on its children
+        os._exit(0)
+
+
+# Multi-worker deployment of main.py, pre-fork style:
+#   * one writer process (storage.serve_writes) owns the SQLite write
+#     connection; workers send their inserts to it over a Unix socket and
+#     it group-commits them together, so N workers never contend for the
+#     write lock. Workers still read the database directly.
+#   * main.py is imported once here, loading the model from the
+#     memory-mapped array export, and then the workers are forked. The
+#     model's pages and everything the imports allocated are shared
+#     copy-on-write (gc.freeze keeps the collector from touching them),
+#     instead of each worker paying for its own interpreter and model.
+#   * main.py opens no connections and starts no threads at import, only
+#     in its lifespan, which runs in each worker after the fork.
+#   * workers that die are replaced; SIGTERM/SIGINT shut the workers down
+#     gracefully, then the writer commits what they sent and exits.
+#
+# State that lives in a worker stays per worker: prediction and
+# idempotency caches, micro-batches, and velocity windows. An account's
+# velocity features only count the transactions that reached the same
+# worker, so run velocity-trained models with one worker or accept the
+# narrower windows.
+def main():
+    parser = argparse.ArgumentParser(description="Run the fraud scoring API with several worker processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--db", default=os.getenv("FRAUD_DB", "transactions.db"))
+    parser.add_argument("--socket", default=None, help="Writer socket path (default: a per-run temporary file)")
+    parser.add_argument("--model", default="fraud_model.pkl")
+    parser.add_argument("--compiled", default=os.getenv("FRAUD_COMPILED_MODEL", "fraud_model_arrays"))
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+    address = args.socket or os.path.join(tempfile.gettempdir(), f"fraud-writer-{os.getpid()}.sock")
+
+    size = prepare_model(args.model, args.compiled)
+    print(f"Model arrays: {size / 1e6:.1f} MB in {args.compiled}, shared by {args.workers} workers")
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    writer = context.Process(target=storage.serve_writes, args=(args.db, address, ready), name="fraud-writer")
+    writer.start()
+    if not ready.wait(30):
+        writer.terminate()
+        raise SystemExit("Transaction writer process failed to start")
+
+    os.environ["FRAUD_DB"] = args.db
+    os.environ["FRAUD_WRITER_SOCKET"] = address
+    os.environ["FRAUD_COMPILED_MODEL"] = args.compiled
+
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    import main as service
+    gc.collect()
+    gc.freeze()
+
+    workers = [fork_worker(service.app, sock, args.log_level) for _ in range(args.workers)]
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Serving on {args.host}:{args.port} with {args.workers} workers, writer at {address}")
+    try:
+        while workers:
+            time.sleep(0.5)
+            for pid in list(workers):
+                done, status = os.waitpid(pid, os.WNOHANG)
+                if not done:
+                    continue
+                workers.remove(pid)
+                if not stopping:
+                    print(f"Worker {pid} exited with status {status}, starting a replacement")
+                    workers.append(fork_worker(service.app, sock, args.log_level))
+    finally:
+        # The writer commits whatever the workers sent before they exited
+        writer.terminate()
+        writer.join()
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,748 @@
+import asyncio
+import calendar
+import itertools
+import json
+import os
+import queue
+import signal
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+import metrics
+
+# Queued by close() to tell the writer thread to finish up
+_STOP = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT,
+    amount REAL,
+    isFraud BOOLEAN,
+    timestamp TEXT
+)
+"""
+
+# Pre-aggregated counts kept up to date by write_rows, keyed by the length of
+# the timestamp prefix they group on. Dashboards read these instead of
+# scanning the transactions table.
+ROLLUP_TABLES = {
+    "rollup_totals": 0,    # one row per type
+    "rollup_daily": 10,    # 'YYYY-MM-DD'
+    "rollup_hourly": 13,   # 'YYYY-MM-DD HH'
+    "rollup_minute": 16,   # 'YYYY-MM-DD HH:MM'
+}
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    bucket TEXT NOT NULL,
+    type TEXT NOT NULL,
+    transactions INTEGER NOT NULL,
+    fraudulent INTEGER NOT NULL,
+    total_amount REAL NOT NULL,
+    PRIMARY KEY (bucket, type)
+) WITHOUT ROWID
+"""
+
+ROLLUP_UPSERT_SQL = """
+INSERT INTO {table} (bucket, type, transactions, fraudulent, total_amount)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (bucket, type) DO UPDATE SET
+    transactions = transactions + excluded.transactions,
+    fraudulent = fraudulent + excluded.fraudulent,
+    total_amount = total_amount + excluded.total_amount
+"""
+
+ROLLUP_BACKFILL_SQL = """
+INSERT INTO {table} (bucket, type, transactions, fraudulent, total_amount)
+SELECT {bucket}, COALESCE(type, ''), COUNT(*), SUM(isFraud = 1), TOTAL(amount)
+FROM transactions
+GROUP BY 1, 2
+"""
+
+# Amount distribution per bucket and type: transaction counts in fixed
+# logarithmic amount bins, stored as one int64 array per row, so amount
+# percentiles over any range come from the rollups too. A bin spans 12%
+# (20 per decade) and its geometric middle is reported, which keeps
+# percentiles within ~6%. Bin 0 holds zero or missing amounts, and amounts
+# outside 0.01..1e12 are clamped to the edge bins.
+AMOUNT_ROLLUP_TABLES = {
+    "rollup_amount_hourly": 13,   # 'YYYY-MM-DD HH'
+    "rollup_amount_daily": 10,    # 'YYYY-MM-DD'
+}
+AMOUNT_BINS_PER_DECADE = 20
+AMOUNT_MIN_DECADE, AMOUNT_MAX_DECADE = -2, 12
+AMOUNT_BINS = 1 + (AMOUNT_MAX_DECADE - AMOUNT_MIN_DECADE) * AMOUNT_BINS_PER_DECADE
+
+AMOUNT_ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    bucket TEXT NOT NULL,
+    type TEXT NOT NULL,
+    counts BLOB NOT NULL,
+    PRIMARY KEY (bucket, type)
+) WITHOUT ROWID
+"""
+
+AMOUNT_ROLLUP_BACKFILL_SQL = """
+SELECT substr(timestamp, 1, {prefix}), COALESCE(type, ''), amount
+FROM transactions
+"""
+
+# Bumped whenever create_schema gains a migration step
+SCHEMA_VERSION = 2
+
+INSERT_SQL = """
+INSERT INTO transactions (type, amount, isFraud, timestamp)
+VALUES (?, ?, ?, ?)
+"""
+
+# WAL lets readers run alongside the single writer; synchronous=NORMAL is
+# durable across application crashes in WAL mode and avoids an fsync per commit
+WRITER_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA wal_autocheckpoint=10000",
+]
+
+READER_PRAGMAS = [
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16384",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+]
+
+
+def create_schema(connection):
+    with connection:
+        connection.execute(SCHEMA)
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions (timestamp)")
+        for table in ROLLUP_TABLES:
+            connection.execute(ROLLUP_SCHEMA.format(table=table))
+        for table in AMOUNT_ROLLUP_TABLES:
+            connection.execute(AMOUNT_ROLLUP_SCHEMA.format(table=table))
+
+        # Databases created before the rollups existed get them built once
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            for table, prefix in ROLLUP_TABLES.items():
+                bucket = f"substr(timestamp, 1, {prefix})" if prefix else "'all'"
+                connection.execute(f"DELETE FROM {table}")
+                connection.execute(ROLLUP_BACKFILL_SQL.format(table=table, bucket=bucket))
+        elif version < 2:
+            connection.execute("DELETE FROM rollup_hourly")
+            connection.execute(ROLLUP_BACKFILL_SQL.format(table="rollup_hourly", bucket="substr(timestamp, 1, 13)"))
+        if version < 2:
+            for table, prefix in AMOUNT_ROLLUP_TABLES.items():
+                connection.execute(f"DELETE FROM {table}")
+                cursor = connection.execute(AMOUNT_ROLLUP_BACKFILL_SQL.format(prefix=prefix))
+                while True:
+                    rows = cursor.fetchmany(100000)
+                    if not rows:
+                        break
+                    add_amount_counts(connection, table, rows)
+        if version < SCHEMA_VERSION:
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def amount_bins(amounts):
+    amounts = np.asarray(amounts, dtype=np.float64)
+    bins = np.zeros(len(amounts), dtype=np.int64)
+    positive = amounts > 0
+    scaled = (np.log10(amounts[positive]) - AMOUNT_MIN_DECADE) * AMOUNT_BINS_PER_DECADE
+    bins[positive] = 1 + np.clip(np.floor(scaled), 0, AMOUNT_BINS - 2)
+    return bins
+
+
+# The amount each bin stands for: its geometric middle
+BIN_AMOUNTS = np.concatenate([[0.0], 10.0 ** (
+    AMOUNT_MIN_DECADE + (np.arange(AMOUNT_BINS - 1) + 0.5) / AMOUNT_BINS_PER_DECADE)])
+
+
+# Fold (bucket, type, amount) rows into an amount rollup table. Each
+# (bucket, type) row is read, added to and written back, which is one
+# lookup per bucket and type touched rather than one per transaction.
+def add_amount_counts(connection, table, rows):
+    groups = {}
+    for bucket, type_, amount in rows:
+        groups.setdefault((bucket, type_), []).append(amount if amount is not None else 0.0)
+    for (bucket, type_), amounts in groups.items():
+        counts = np.bincount(amount_bins(amounts), minlength=AMOUNT_BINS)
+        row = connection.execute(f"SELECT counts FROM {table} WHERE bucket = ? AND type = ?", (bucket, type_)).fetchone()
+        if row is not None:
+            counts += np.frombuffer(row[0], dtype="<i8")
+        connection.execute(f"INSERT OR REPLACE INTO {table} (bucket, type, counts) VALUES (?, ?, ?)",
+                           (bucket, type_, counts.astype("<i8").tobytes()))
+
+
+# Rows are (type, amount, isFraud, timestamp) tuples. The caller owns the
+# transaction, so a whole group and its rollup updates land in one commit.
+def write_rows(connection, rows):
+    rows = [(type_, amount, bool(is_fraud), str(timestamp)) for type_, amount, is_fraud, timestamp in rows]
+    connection.executemany(INSERT_SQL, rows)
+
+    # Fold the group into per-bucket deltas first, so each rollup row is
+    # touched once per commit rather than once per transaction
+    for table, prefix in ROLLUP_TABLES.items():
+        deltas = {}
+        for type_, amount, is_fraud, timestamp in rows:
+            key = (timestamp[:prefix] if prefix else "all", type_ or "")
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = [0, 0, 0.0]
+            delta[0] += 1
+            delta[1] += is_fraud
+            delta[2] += amount or 0.0
+        connection.executemany(
+            ROLLUP_UPSERT_SQL.format(table=table),
+            [(bucket, type_, count, fraudulent, total) for (bucket, type_), (count, fraudulent, total) in deltas.items()],
+        )
+
+    for table, prefix in AMOUNT_ROLLUP_TABLES.items():
+        add_amount_counts(connection, table, [(timestamp[:prefix], type_ or "", amount)
+                                              for type_, amount, _, timestamp in rows])
+
+# Columns /transactions may project, in table order
+TRANSACTION_COLUMNS = ["id", "type", "amount", "isFraud", "timestamp"]
+
+
+# Keyset-paginated page query. With after_id, pages walk forward by id;
+# otherwise they walk backwards from the newest row by (timestamp, id), and
+# the last row of a page gives the before_timestamp/before_id of the next.
+# id and timestamp are always selected (after the projected columns) so the
+# caller can build the next cursor; the full column list is returned too.
+def transactions_query(columns, limit, after_id=None, before_timestamp=None, before_id=None, start=None, end=None):
+    unknown = [c for c in columns if c not in TRANSACTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    # The two cursors walk in opposite orders, and before_id only breaks
+    # ties between rows with the same timestamp
+    if after_id is not None and (before_timestamp is not None or before_id is not None):
+        raise ValueError("after_id can't be combined with before_timestamp/before_id")
+    if before_id is not None and before_timestamp is None:
+        raise ValueError("before_id requires before_timestamp")
+    selected = list(columns) + [c for c in ("id", "timestamp") if c not in columns]
+
+    where = []
+    params = []
+    if start is not None:
+        where.append("timestamp >= ?")
+        params.append(_stored_timestamp(start))
+    if end is not None:
+        where.append("timestamp < ?")
+        params.append(_stored_timestamp(end))
+
+    if after_id is not None:
+        where.append("id > ?")
+        params.append(after_id)
+        order = "id ASC"
+    else:
+        if before_id is not None:
+            where.append("(timestamp, id) < (?, ?)")
+            params.extend([before_timestamp, before_id])
+        elif before_timestamp is not None:
+            where.append("timestamp < ?")
+            params.append(before_timestamp)
+        order = "timestamp DESC, id DESC"
+
+    sql = f"SELECT {', '.join(selected)} FROM transactions"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order} LIMIT ?"
+    params.append(limit)
+    return sql, params, selected
+
+
+def fetch_all(connection, sql, params=()):
+    return connection.execute(sql, params).fetchall()
+
+
+def dashboard_totals(connection):
+    return connection.execute("""
+    SELECT
+        COALESCE(SUM(transactions), 0) AS total_transactions,
+        COALESCE(SUM(fraudulent), 0) AS fraudulent_transactions,
+        COALESCE(SUM(total_amount), 0) AS total_amount
+    FROM rollup_totals
+    """).fetchone()
+
+
+def daily_trends(connection, days):
+    return connection.execute("""
+    SELECT bucket, SUM(transactions), SUM(fraudulent), SUM(total_amount)
+    FROM rollup_daily
+    GROUP BY bucket
+    ORDER BY bucket DESC
+    LIMIT ?
+    """, (days,)).fetchall()
+
+
+def totals_by_type(connection):
+    return connection.execute("""
+    SELECT type, transactions, fraudulent, total_amount
+    FROM rollup_totals
+    ORDER BY type
+    """).fetchall()
+
+
+# Changes whenever a transaction is stored (rows are only ever appended),
+# and is the same for every process reading the database. Clients key
+# their caches of dashboard data on it.
+def data_version(connection):
+    return connection.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+
+
+# Bucket sizes aggregate() accepts, in seconds
+BUCKET_SIZES = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "6h": 21600, "1d": 86400, "7d": 604800}
+MAX_BUCKETS = 2000
+
+# (rollup table, its bucket text format, seconds one bucket covers, SQL
+# turning its bucket into epoch seconds). Timestamps are written in UTC
+# (older rows without a zone are read as UTC too), so buckets are aligned
+# to the Unix epoch.
+COUNT_SOURCES = [
+    ("rollup_daily", "%Y-%m-%d", 86400, "strftime('%s', bucket)"),
+    ("rollup_hourly", "%Y-%m-%d %H", 3600, "strftime('%s', bucket || ':00')"),
+    ("rollup_minute", "%Y-%m-%d %H:%M", 60, "strftime('%s', bucket)"),
+]
+AMOUNT_SOURCES = [
+    ("rollup_amount_daily", "%Y-%m-%d", 86400, "strftime('%s', bucket)"),
+    ("rollup_amount_hourly", "%Y-%m-%d %H", 3600, "strftime('%s', bucket || ':00')"),
+]
+
+
+# The coarsest rollup whose buckets divide bucket_seconds
+def _rollup_source(sources, bucket_seconds):
+    for source in sources:
+        if bucket_seconds % source[2] == 0:
+            return source
+    return None
+
+
+def _epoch(text):
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {text}") from None
+    return calendar.timegm(moment.utctimetuple())
+
+
+# An ISO 8601 time as UTC text in the stored column's form, so it compares
+# correctly with stored timestamps as strings
+def _stored_timestamp(text):
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {text}") from None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return str(moment)
+
+
+# Rows of a rollup in [start, end) with their bucket's slot in the series
+# (counted from start in steps of size), grouped by slot and group_by if given
+def _slot_rows(connection, source, columns, group_by, start, end, size, type_):
+    table, format, _, epoch_sql = source
+    where = "bucket >= ? AND bucket < ?"
+    params = [start, size, time.strftime(format, time.gmtime(start)), time.strftime(format, time.gmtime(end))]
+    if type_ is not None:
+        where += " AND type = ?"
+        params.append(type_)
+    group = f" GROUP BY 1, {group_by}" if group_by else ""
+    return connection.execute(f"""
+    SELECT (CAST({epoch_sql} AS INTEGER) - ?) / ?, {columns}
+    FROM {table}
+    WHERE {where}{group}
+    """, params)
+
+
+# Percentiles (0-100) of the amounts counted in an amount bins array
+def bin_percentiles(counts, percentiles):
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    if not total:
+        return None
+    return {f"p{p:g}": round(float(BIN_AMOUNTS[np.searchsorted(cumulative, p / 100.0 * total)]), 2)
+            for p in percentiles}
+
+
+def _summary(transactions, fraudulent, amount):
+    return {
+        "transactions": transactions,
+        "fraudulent": fraudulent,
+        "fraud_rate": fraudulent / transactions if transactions else 0.0,
+        "total_amount": amount,
+    }
+
+
+# Time-bucketed dashboard series, computed from the rollups, so the cost
+# depends on the number of buckets and types in the range rather than on
+# the number of transactions. The range is [start, end); by default it is
+# the last `buckets` buckets up to the newest data. Each bucket has its
+# counts, fraud rate and total amount, the same per type, and amount
+# percentiles (for bucket sizes of an hour or more). All of it is read in
+# one snapshot together with the data version it belongs to.
+def aggregate(connection, bucket="1h", buckets=48, start=None, end=None, type_=None, percentiles=(50, 90, 99)):
+    if bucket not in BUCKET_SIZES:
+        raise ValueError(f"Unsupported bucket size {bucket}; use one of {', '.join(BUCKET_SIZES)}")
+    size = BUCKET_SIZES[bucket]
+    counts_source = _rollup_source(COUNT_SOURCES, size)
+    amounts_source = _rollup_source(AMOUNT_SOURCES, size)
+
+    connection.execute("BEGIN")
+    try:
+        version = data_version(connection)
+        if end is not None:
+            end_epoch = _epoch(end)
+        else:
+            newest = connection.execute(f"SELECT MAX(bucket) FROM {counts_source[0]}").fetchone()[0]
+            end_epoch = _epoch(newest) + counts_source[2] if newest else calendar.timegm(time.gmtime())
+        end_epoch = -(-end_epoch // size) * size
+        start_epoch = _epoch(start) // size * size if start is not None else end_epoch - buckets * size
+        n_buckets = (end_epoch - start_epoch) // size
+        if n_buckets <= 0:
+            raise ValueError("start must be before end")
+        if n_buckets > MAX_BUCKETS:
+            raise ValueError(f"Range covers {n_buckets} buckets of {bucket}; at most {MAX_BUCKETS} are allowed")
+
+        # [transactions, fraudulent, amount] per slot and type, and
+        # {bin: transactions} per slot
+        counts = [{} for _ in range(n_buckets)]
+        for slot, row_type, transactions, fraudulent, amount in _slot_rows(
+                connection, counts_source, "type, SUM(transactions), SUM(fraudulent), SUM(total_amount)",
+                "type", start_epoch, end_epoch, size, type_):
+            counts[slot][row_type] = [transactions, fraudulent, amount]
+        bins = np.zeros((n_buckets, AMOUNT_BINS), dtype=np.int64)
+        if amounts_source is not None:
+            for slot, counts_blob in _slot_rows(connection, amounts_source, "counts", None,
+                                                start_epoch, end_epoch, size, type_):
+                bins[slot] += np.frombuffer(counts_blob, dtype="<i8")
+    finally:
+        connection.rollback()
+
+    def describe(by_type, amount_bins):
+        entry = _summary(*[sum(values) for values in zip([0, 0, 0.0], *by_type.values())])
+        entry["by_type"] = {key: _summary(*values) for key, values in sorted(by_type.items())}
+        entry["amount_percentiles"] = bin_percentiles(amount_bins, percentiles) if amounts_source else None
+        return entry
+
+    series = []
+    range_counts = {}
+    for slot in range(n_buckets):
+        series.append({
+            "start": time.strftime("%Y-%m-%d %H:%M", time.gmtime(start_epoch + slot * size)),
+            **describe(counts[slot], bins[slot]),
+        })
+        for key, values in counts[slot].items():
+            range_counts[key] = [a + b for a, b in zip(range_counts.get(key, [0, 0, 0.0]), values)]
+
+    return {
+        "version": version,
+        "bucket": bucket,
+        "bucket_seconds": size,
+        "start": time.strftime("%Y-%m-%d %H:%M", time.gmtime(start_epoch)),
+        "end": time.strftime("%Y-%m-%d %H:%M", time.gmtime(end_epoch)),
+        "totals": describe(range_counts, bins.sum(axis=0)),
+        "buckets": series,
+    }
+
+
+# Persistence for the fraud service. All writes go through one writer
+# thread that group-commits whatever is queued; reads run on a small pool
+# of read-only connections so they never wait behind the writer.
+class TransactionStore:
+    def __init__(self, path="transactions.db", max_group_size=1000, read_workers=4):
+        self.path = path
+        self.max_group_size = max_group_size
+
+        self._queue = queue.Queue()
+        self._writer = None
+        self._ready = threading.Event()
+        self._startup_error = None
+
+        self._read_executor = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="fraud-reader")
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+
+        self.counters = {"commits": 0, "rows_written": 0, "write_errors": 0}
+
+    def start(self):
+        if self._writer is None or not self._writer.is_alive():
+            self._ready.clear()
+            self._writer = threading.Thread(target=self._run_writer, name="fraud-writer", daemon=True)
+            self._writer.start()
+            # The schema is created by the writer, so wait for it before serving
+            self._ready.wait()
+            if self._startup_error is not None:
+                raise self._startup_error
+
+    def close(self):
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._writer = None
+        self._read_executor.shutdown(wait=True)
+        with self._readers_lock:
+            for connection in self._readers:
+                connection.close()
+            self._readers.clear()
+
+    async def insert(self, row):
+        await self.insert_many([row])
+
+    async def insert_many(self, rows):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((list(rows), future, loop))
+        await future
+
+    def _run_writer(self):
+        try:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            for pragma in WRITER_PRAGMAS:
+                connection.execute(pragma)
+            create_schema(connection)
+        except Exception as e:
+            self._startup_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            # Group commit: take everything that queued up while the last
+            # commit was running and write it in one transaction
+            group = [item]
+            group_rows = len(item[0])
+            while group_rows < self.max_group_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                group.append(item)
+                group_rows += len(item[0])
+
+            self._write_group(connection, group)
+
+        connection.close()
+
+    def _write_group(self, connection, group):
+        rows = [row for item_rows, _, _ in group for row in item_rows]
+        try:
+            with connection:
+                write_rows(connection, rows)
+        except Exception as e:
+            self.counters["write_errors"] += 1
+            for _, future, loop in group:
+                loop.call_soon_threadsafe(_set_exception, future, e)
+            return
+
+        self.counters["commits"] += 1
+        self.counters["rows_written"] += len(rows)
+        for _, future, loop in group:
+            loop.call_soon_threadsafe(_set_result, future, None)
+
+    async def read(self, fn, *args):
+        # fn(connection, *args) runs on a reader thread with its own connection
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._call_reader, fn, args)
+
+    def _call_reader(self, fn, args):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._open_reader()
+            self._local.connection = connection
+            with self._readers_lock:
+                self._readers.append(connection)
+        return metrics.timed_call("db-query", fn, connection, *args)
+
+    def _open_reader(self):
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        for pragma in READER_PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    async def stream(self, sql, params=(), batch_size=1000):
+        # Yields lists of rows from a server-side cursor. The stream gets its
+        # own connection, since it stays open across many executor calls.
+        loop = asyncio.get_running_loop()
+        connection = await loop.run_in_executor(self._read_executor, self._open_reader)
+        try:
+            cursor = await loop.run_in_executor(self._read_executor, connection.execute, sql, params)
+            while True:
+                rows = await loop.run_in_executor(self._read_executor, cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            connection.close()
+
+    def metrics(self):
+        return {"queue_depth": self._queue.qsize(), **self.counters}
+
+
+# Store for worker processes of a multi-process deployment (see server.py):
+# reads use the worker's own read-only connections as usual, but writes are
+# sent to the single writer process over a Unix socket, one JSON line per
+# insert, and acknowledged once committed. The connection is opened on the
+# first write, from inside the worker's event loop, and reopened after the
+# writer goes away.
+class RemoteTransactionStore(TransactionStore):
+    def __init__(self, path="transactions.db", address="fraud-writer.sock", read_workers=4):
+        super().__init__(path, read_workers=read_workers)
+        self.address = address
+        self._stream = None
+        self._connect_lock = None
+        # The event loop only keeps weak references to tasks, so the task
+        # reading acknowledgements is held here
+        self._ack_task = None
+        self._pending = {}
+        self._ids = itertools.count()
+        self.counters = {"requests": 0, "rows_sent": 0, "write_errors": 0, "reconnects": 0}
+
+    def start(self):
+        pass
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self._ack_task is not None:
+            self._ack_task.cancel()
+            self._ack_task = None
+        super().close()
+
+    async def _connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._stream is None:
+                reader, writer = await asyncio.open_unix_connection(self.address)
+                self._stream = writer
+                self.counters["reconnects"] += 1
+                self._ack_task = asyncio.get_running_loop().create_task(self._read_acks(reader, writer))
+        return self._stream
+
+    async def insert_many(self, rows):
+        rows = [[type_, amount, bool(is_fraud), str(timestamp)] for type_, amount, is_fraud, timestamp in rows]
+        stream = self._stream or await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self.counters["requests"] += 1
+        self.counters["rows_sent"] += len(rows)
+        stream.write((json.dumps({"id": request_id, "rows": rows}) + "\n").encode("utf-8"))
+        await stream.drain()
+        await future
+
+    async def _read_acks(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                future = self._pending.pop(reply["id"], None)
+                if future is None or future.done():
+                    continue
+                if reply.get("error"):
+                    self.counters["write_errors"] += 1
+                    future.set_exception(sqlite3.OperationalError(reply["error"]))
+                else:
+                    future.set_result(None)
+        finally:
+            if self._stream is writer:
+                self._stream = None
+            error = ConnectionError(f"Lost connection to the transaction writer at {self.address}")
+            for future in self._pending.values():
+                _set_exception(future, error)
+            self._pending.clear()
+
+    def metrics(self):
+        return {"queue_depth": len(self._pending), "writer": self.address, **self.counters}
+
+
+# The writer process of a multi-process deployment: owns the only write
+# connection and group-commits inserts from every worker that connects to
+# address. Sets ready once the schema exists and the socket is listening;
+# on SIGTERM or SIGINT it stops accepting, lets connected workers finish
+# (for up to drain_timeout seconds) and commits what is left.
+def serve_writes(path, address, ready=None, drain_timeout=10.0):
+    store = TransactionStore(path)
+    store.start()
+    connections = set()
+
+    async def handle(reader, writer):
+        connections.add(asyncio.current_task())
+        tasks = set()
+
+        async def write(request_id, rows):
+            error = None
+            try:
+                await store.insert_many(rows)
+            except Exception as e:
+                error = str(e)
+            if not writer.is_closing():
+                writer.write((json.dumps({"id": request_id, "error": error}) + "\n").encode("utf-8"))
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                task = asyncio.create_task(write(request["id"], request["rows"]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+            connections.discard(asyncio.current_task())
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        if os.path.exists(address):
+            os.unlink(address)
+        server = await asyncio.start_unix_server(handle, path=address)
+        if ready is not None:
+            ready.set()
+        await stop.wait()
+        server.close()
+        if connections:
+            await asyncio.wait(set(connections), timeout=drain_timeout)
+
+    try:
+        asyncio.run(run())
+    finally:
+        store.close()
+        if os.path.exists(address):
+            os.unlink(address)
+    return store.metrics()
+
+
+def _set_result(future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def _set_exception(future, error):
+    if not future.done():
+        future.set_exception(error)
@@ -1,27 +1,155 @@
+import argparse
+import json
+import os
+import pickle
+import time
+from contextlib import contextmanager
+
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report
-import pickle
+from compiled_model import export_forest
+
+# Wall-clock seconds per stage, printed at the end of training
+timings = {}
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+# Converts the CSV once into one flat binary file per column, so later runs
+# memory-map the data instead of parsing it again. Trees split on float32
+# values anyway, so storing features as float32 loses nothing.
+def build_cache(csv_path, cache_dir, target, chunk_size):
+    os.makedirs(cache_dir, exist_ok=True)
+    columns = list(pd.read_csv(csv_path, nrows=0).columns)
+    features = [c for c in columns if c != target]
+    dtypes = {c: np.float32 for c in features}
+    dtypes[target] = np.int8
+
+    files = {c: open(os.path.join(cache_dir, f"{c}.bin"), "wb") for c in columns}
+    n_rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size, dtype=dtypes):
+            for column, f in files.items():
+                f.write(chunk[column].to_numpy(dtype=dtypes[column]).tobytes())
+            n_rows += len(chunk)
+    finally:
+        for f in files.values():
+            f.close()
+
+    stat = os.stat(csv_path)
+    meta = {
+        "source": os.path.abspath(csv_path),
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime,
+        "target": target,
+        "features": features,
+        "n_rows": n_rows,
+    }
+    with open(os.path.join(cache_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def load_cache_meta(csv_path, cache_dir, target):
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    # Rebuild if the CSV changed since the cache was written
+    if not os.path.exists(csv_path):
+        return meta if meta["target"] == target else None
+    stat = os.stat(csv_path)
+    if (meta["source_size"], meta["source_mtime"], meta["target"]) != (stat.st_size, stat.st_mtime, target):
+        return None
+    return meta
+
+
+def open_column(cache_dir, name, dtype, n_rows):
+    return np.memmap(os.path.join(cache_dir, f"{name}.bin"), dtype=dtype, mode="r", shape=(n_rows,))
+
+
+# Keeps every fraud row and a random fraction of the legitimate ones, so the
+# rare class survives subsampling intact
+def stratified_sample(y, negative_fraction, seed):
+    positives = np.flatnonzero(y == 1)
+    negatives = np.flatnonzero(y != 1)
+    if negative_fraction < 1.0:
+        rng = np.random.default_rng(seed)
+        negatives = rng.choice(negatives, size=int(len(negatives) * negative_fraction), replace=False)
+    return np.sort(np.concatenate([positives, negatives]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the fraud detection model")
+    parser.add_argument("--data", default="creditcard.csv")  # Replace with your dataset path
+    parser.add_argument("--target", default="Class")  # 1 = Fraudulent, 0 = Legitimate
+    parser.add_argument("--cache-dir", default=None, help="Columnar cache directory (default: <data>.cache)")
+    parser.add_argument("--chunk-size", type=int, default=200000)
+    parser.add_argument("--negative-fraction", type=float, default=1.0,
+                        help="Fraction of legitimate rows to keep; all fraud rows are always kept")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--output", default="fraud_model.pkl")
+    parser.add_argument("--compiled-output", default="fraud_model_arrays")
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or f"{args.data}.cache"
+
+    # Load the dataset (parsed once into the cache, memory-mapped afterwards)
+    with stage("load"):
+        meta = load_cache_meta(args.data, cache_dir, args.target)
+        if meta is None:
+            print(f"Building columnar cache in {cache_dir}")
+            meta = build_cache(args.data, cache_dir, args.target, args.chunk_size)
+        n_rows = meta["n_rows"]
+        y_all = open_column(cache_dir, args.target, np.int8, n_rows)
+        rows = stratified_sample(y_all, args.negative_fraction, seed=42)
+
+        # Only the sampled rows are materialized, one column at a time
+        X = np.empty((len(rows), len(meta["features"])), dtype=np.float32)
+        for i, column in enumerate(meta["features"]):
+            X[:, i] = open_column(cache_dir, column, np.float32, n_rows)[rows]
+        X = pd.DataFrame(X, columns=meta["features"], copy=False)
+        y = np.asarray(y_all[rows])
+    print(f"Loaded {len(rows)} of {n_rows} rows ({int((y == 1).sum())} fraudulent)")
+
+    # Split the data into train and test sets, keeping the class ratio in both
+    with stage("split"):
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
 
-# Load the dataset
-data = pd.read_csv("creditcard.csv")  # Replace with your dataset path
+    # Train a Random Forest model on all cores
+    with stage("fit"):
+        model = RandomForestClassifier(n_estimators=args.n_estimators, random_state=42, n_jobs=args.n_jobs)
+        model.fit(X_train, y_train)
 
-# Data preprocessing
-X = data.drop(columns=["Class"])  # Features
-y = data["Class"]  # Target (1 = Fraudulent, 0 = Legitimate)
+    # Evaluate the model
+    with stage("evaluate"):
+        y_pred = model.predict(X_test)
+        print(classification_report(y_test, y_pred))
 
-# Split the data into train and test sets
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Save the model, plus the flat array export used for fast worker startup
+    with stage("serialize"):
+        with open(args.output, "wb") as f:
+            pickle.dump(model, f)
+        export_forest(model, args.compiled_output)
 
-# Train a Random Forest model
-model = RandomForestClassifier(random_state=42)
-model.fit(X_train, y_train)
+    total = sum(timings.values())
+    print("Timing breakdown:")
+    for name, seconds in timings.items():
+        print(f"  {name:10s} {seconds:8.2f} s  ({seconds / total * 100:5.1f}%)")
+    print(f"  {'total':10s} {total:8.2f} s")
 
-# Evaluate the model
-y_pred = model.predict(X_test)
-print(classification_report(y_test, y_pred))
 
-# Save the model
-with open("fraud_model.pkl", "wb") as f:
-    pickle.dump(model, f)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import argparse
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_COLUMNS
+
+# (label, seconds) for each rolling window; each is a whole number of buckets
+DEFAULT_WINDOWS = (("10m", 600), ("1h", 3600))
+
+
+def velocity_feature_names(windows=DEFAULT_WINDOWS):
+    names = []
+    for label, _ in windows:
+        names += [f"orig_count_{label}", f"orig_amount_{label}"]
+    return names + ["orig_seconds_since_last", "orig_balance_gap", "orig_balance_error", "dest_balance_error"]
+
+
+# Extra model columns the store can produce, in this order
+VELOCITY_FEATURES = velocity_feature_names()
+
+
+# Per-account velocity state kept in memory, so features are computed at
+# request time without touching the database. Every origin account owns
+# one slot of a preallocated array: a ring of per-bucket transaction counts
+# and amount sums covering the longest window, plus the time and closing
+# balance of its last transaction. That is a fixed 16 bytes per bucket per
+# account (~1 KB with the default windows), whatever the account's traffic.
+# All window totals are read with one product against a precomputed mask
+# of the buckets each window covers.
+#
+# Accounts unseen for idle_seconds (default: the longest window, after which
+# their counters are all zero anyway) are evicted a few at a time as new
+# transactions arrive. At max_keys accounts the least recently seen one
+# makes room for the next.
+class VelocityStore:
+    def __init__(self, windows=DEFAULT_WINDOWS, bucket_seconds=60, max_keys=100000, idle_seconds=None,
+                 initial_capacity=1024):
+        for label, seconds in windows:
+            if seconds % bucket_seconds:
+                raise ValueError(f"Window {label} is not a multiple of {bucket_seconds}s buckets")
+        self.windows = list(windows)
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = [seconds // bucket_seconds for _, seconds in windows]
+        self.n_buckets = max(self.window_buckets)
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds if idle_seconds is not None else max(s for _, s in windows)
+        self.feature_names = velocity_feature_names(windows)
+        self.n_features = len(self.feature_names)
+
+        self._lock = threading.Lock()
+        # Least recently seen first, which is also the eviction order
+        self._slots = OrderedDict()
+        self._free = []
+        self._capacity = 0
+        # Row 0 of a slot counts transactions, row 1 sums their amounts
+        self._buckets = np.zeros((0, 2, self.n_buckets), dtype=np.float64)
+        self._last_bucket = []
+        self._last_seen = []
+        self._last_balance = []
+        self._grow(min(initial_capacity, max_keys))
+
+        # _masks[p] selects, for each window, the buckets it covers when the
+        # newest bucket is at ring position p
+        ages = (np.arange(self.n_buckets)[:, np.newaxis] - np.arange(self.n_buckets)) % self.n_buckets
+        self._masks = np.stack([ages < n for n in self.window_buckets], axis=1).astype(np.float64)
+        self.counters = {"records": 0, "anonymous": 0, "evicted_idle": 0, "evicted_full": 0}
+
+    def _grow(self, capacity):
+        old = self._capacity
+
+        buckets = np.zeros((capacity, 2, self.n_buckets), dtype=np.float64)
+        buckets[:old] = self._buckets
+        self._buckets = buckets
+        for values in (self._last_bucket, self._last_seen, self._last_balance):
+            values.extend([0] * (capacity - old))
+        self._free.extend(range(capacity - 1, old - 1, -1))
+        self._capacity = capacity
+
+    def _release(self, key):
+        self._free.append(self._slots.pop(key))
+
+    def _evict_idle(self, now, limit=2):
+        for _ in range(limit):
+            if not self._slots:
+                return
+            key = next(iter(self._slots))
+            if now - self._last_seen[self._slots[key]] <= self.idle_seconds:
+                return
+            self._release(key)
+            self.counters["evicted_idle"] += 1
+
+    def _allocate(self, key, bucket, now):
+        if not self._free:
+            if self._capacity < self.max_keys:
+                self._grow(min(self._capacity * 2, self.max_keys))
+            else:
+                self._release(next(iter(self._slots)))
+                self.counters["evicted_full"] += 1
+        slot = self._free.pop()
+        self._slots[key] = slot
+        self._buckets[slot] = 0.0
+        self._last_bucket[slot] = bucket
+        self._last_seen[slot] = now
+        return slot
+
+    # Zero the buckets the ring has moved past since the slot's last write
+    def _advance(self, slot, bucket):
+        last = self._last_bucket[slot]
+        if bucket == last:
+            return
+        if bucket - last >= self.n_buckets:
+            self._buckets[slot] = 0.0
+        else:
+            start, stop = (last + 1) % self.n_buckets, (bucket + 1) % self.n_buckets
+            if start < stop:
+                self._buckets[slot, :, start:stop] = 0.0
+            else:
+                self._buckets[slot, :, start:] = 0.0
+                self._buckets[slot, :, :stop] = 0.0
+        self._last_bucket[slot] = bucket
+
+    # Record a transaction (anything with nameOrig, amount and the four
+    # balance fields) at time now, and return its velocity features, which
+    # include the transaction itself. Transactions without nameOrig are
+    # scored as an account's first.
+    def features(self, transaction, now=None, out=None):
+        out = np.empty(self.n_features, dtype=np.float64) if out is None else out
+        amount = float(transaction.amount)
+        old_balance = float(transaction.oldbalanceOrg)
+        new_balance = float(transaction.newbalanceOrig)
+        out[-2] = old_balance - amount - new_balance
+        out[-1] = float(transaction.oldbalanceDest) + amount - float(transaction.newbalanceDest)
+
+        key = getattr(transaction, "nameOrig", None)
+        if not key or not isinstance(key, str):
+            self.counters["anonymous"] += 1
+            out[0:-4:2] = 1.0
+            out[1:-4:2] = amount
+            out[-4] = -1.0
+            out[-3] = 0.0
+            return out
+
+        now = time.time() if now is None else float(now)
+        bucket = int(now // self.bucket_seconds)
+        with self._lock:
+            self._evict_idle(now)
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._allocate(key, bucket, now)
+                since_last, balance_gap = -1.0, 0.0
+            else:
+                self._slots.move_to_end(key)
+                since_last = max(now - self._last_seen[slot], 0.0)
+                balance_gap = old_balance - self._last_balance[slot]
+                # Late events count towards the newest bucket
+                bucket = max(bucket, self._last_bucket[slot])
+                self._advance(slot, bucket)
+
+            position = bucket % self.n_buckets
+            state = self._buckets[slot]
+            state[0, position] += 1.0
+            state[1, position] += amount
+            if now > self._last_seen[slot]:
+                self._last_seen[slot] = now
+            self._last_balance[slot] = new_balance
+            out[:-4] = (self._masks[position] @ state.T).ravel()
+            self.counters["records"] += 1
+        out[-4] = since_last
+        out[-3] = balance_gap
+        return out
+
+    def __len__(self):
+        return len(self._slots)
+
+    def stats(self):
+        with self._lock:
+            # Per-slot metadata lives in Python lists: a pointer plus a float each
+            allocated = self._buckets.nbytes + self._capacity * 3 * (8 + 24)
+            return {
+                "keys": len(self._slots),
+                "capacity": self._capacity,
+                "max_keys": self.max_keys,
+                "windows": {label: seconds for label, seconds in self.windows},
+                "bucket_seconds": self.bucket_seconds,
+                "idle_seconds": self.idle_seconds,
+                "bytes_per_key": allocated // self._capacity if self._capacity else 0,
+                "allocated_bytes": allocated,
+                **self.counters,
+            }
+
+
+# Velocity features for every row of a frame, in order, as float64 columns.
+# times are the rows' epoch seconds; by default the step column in hours
+# (as in the training data), or the current time if there is none.
+def frame_features(frame, store, times=None):
+    if times is None:
+        times = frame["step"].to_numpy(dtype=np.float64) * 3600.0 if "step" in frame else np.full(len(frame), time.time())
+    values = np.empty((len(frame), store.n_features), dtype=np.float64)
+    for i, row in enumerate(frame.itertuples(index=False)):
+        store.features(row, now=times[i], out=values[i])
+    return pd.DataFrame(values, columns=store.feature_names, index=frame.index)
+
+
+# Adds velocity columns to a PaySim-style CSV (step, type, amount, nameOrig,
+# the four balances, isFraud) for train_model.py. Rows are replayed in file
+# order with step hours as the clock, so train with windows of at least an
+# hour; serving uses the same store on the wall clock.
+def main():
+    parser = argparse.ArgumentParser(description="Add per-account velocity features to a transactions CSV")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--encoder", default="type_encoder.pkl")
+    parser.add_argument("--target", default="isFraud")
+    parser.add_argument("--chunk-size", type=int, default=200000)
+    parser.add_argument("--max-keys", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with open(args.encoder, "rb") as f:
+        type_codes = {label: code for code, label in enumerate(pickle.load(f).classes_)}
+    store = VelocityStore(max_keys=args.max_keys)
+
+    started = time.perf_counter()
+    n_rows = 0
+    for i, chunk in enumerate(pd.read_csv(args.input, chunksize=args.chunk_size, dtype={"nameOrig": str})):
+        velocity = frame_features(chunk, store)
+        out = chunk[FEATURE_COLUMNS].assign(type=chunk["type"].map(type_codes))
+        out = pd.concat([out, velocity, chunk[[args.target]]], axis=1)
+        out.to_csv(args.output, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        n_rows += len(chunk)
+        print(f"{n_rows} rows, {n_rows / (time.perf_counter() - started):.0f} rows/s, {len(store)} accounts")
+
+
+if __name__ == "__main__":
+    main()